@@ -9,7 +9,8 @@ from channels.layers import get_channel_layer
 from markdown_it import MarkdownIt
 
 from apps.uploads.models import Task, Report
-from apps.rag.views import retrieve, best_sentence_for_chunk
+from apps.rag.quotes import best_sentences
+from apps.rag.views import retrieve
 
 log = logging.getLogger("docuchat.agent")
 
@@ -20,8 +21,9 @@ def ws_group(tenant_name: str, task_id: int) -> str:
 
 def _summarize(chunks, question: str) -> str:
     lines = []
-    for c in chunks:
-        q = best_sentence_for_chunk(question, c.get("text") or "") or c.get("snippet") or ""
+    quotes = best_sentences(question, [(c.get("text") or "", c.get("sentences")) for c in chunks])
+    for c, quote in zip(chunks, quotes):
+        q = quote or c.get("snippet") or ""
         if q:
             lines.append(f"- {q}")
     if not lines:
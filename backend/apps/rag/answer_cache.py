@@ -0,0 +1,125 @@
+from __future__ import annotations
+import hashlib, logging, threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from cachetools import TTLCache
+from django.conf import settings
+from django.core.cache import cache
+
+from .corpus import normalize_question
+from .llm import _build_context, get_provider
+
+log = logging.getLogger("docuchat.llm")
+
+# İki katman: süreç içi TTLCache (boyut sınırlı, LRU tahliye) + paylaşılan
+# Django cache (Redis) ki diğer worker'ların cevapları da kullanılsın.
+_local: Optional[TTLCache] = None
+_lock = threading.Lock()
+
+
+def _ttl() -> int:
+    return int(getattr(settings, "ANSWER_CACHE_TTL", 3600))
+
+
+def _local_cache() -> TTLCache:
+    global _local
+    with _lock:
+        if _local is None:
+            _local = TTLCache(maxsize=max(1, int(getattr(settings, "ANSWER_CACHE_SIZE", 1024))), ttl=_ttl())
+        return _local
+
+
+def answer_cache_key(question: str, cites: List[Dict]) -> str:
+    """Normalize soru + LLM'e gidecek context (chunk id'leri ve içerikleri) + model ayarları."""
+    provider = get_provider()
+    h = hashlib.blake2b(digest_size=16)
+    for part in (
+        provider.name,
+        provider.model,
+        str(getattr(settings, "GEMINI_TEMPERATURE", "")),
+        str(getattr(settings, "GEMINI_MAX_TOKENS", "")),
+        normalize_question(question),
+        _build_context(cites),
+    ):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return f"answer:{h.hexdigest()}"
+
+
+def _cacheable(answer: str) -> bool:
+    # Hata metinleri (ör. "LLM error (Gemini): ...", akış ortasında da gelebilir) cache'lenmez
+    return bool(answer) and not any(line.startswith("LLM error") for line in answer.splitlines())
+
+
+def _lookup(key: str) -> Optional[str]:
+    local = _local_cache()
+    with _lock:
+        answer = local.get(key)
+    if answer is None:
+        answer = cache.get(key)
+        if answer is not None:
+            with _lock:
+                local[key] = answer
+    return answer
+
+
+def _store(key: str, answer: str, ttl: int) -> None:
+    if _cacheable(answer):
+        local = _local_cache()
+        with _lock:
+            local[key] = answer
+        cache.set(key, answer, ttl)
+
+
+def lookup_answer(question: str, cites: List[Dict]) -> Optional[str]:
+    """Cache'teki cevap (yoksa ya da cache kapalıysa None)."""
+    if _ttl() <= 0:
+        return None
+    return _lookup(answer_cache_key(question, cites))
+
+
+def store_answer(question: str, cites: List[Dict], answer: str) -> None:
+    ttl = _ttl()
+    if ttl > 0:
+        _store(answer_cache_key(question, cites), answer, ttl)
+
+
+def cached_answer(question: str, cites: List[Dict], produce: Callable[[], str]) -> Tuple[str, bool]:
+    """(cevap, cache_hit). Miss olursa produce() çağrılır ve sonuç iki katmana yazılır."""
+    ttl = _ttl()
+    if ttl <= 0:
+        return produce(), False
+    key = answer_cache_key(question, cites)
+    answer = _lookup(key)
+    if answer is not None:
+        return answer, True
+
+    answer = produce()
+    _store(key, answer, ttl)
+    return answer, False
+
+
+def cached_answer_stream(question: str, cites: List[Dict], produce: Callable[[], Iterator[str]],
+                         cacheable: Callable[[], bool] = lambda: True) -> Tuple[Iterator[str], bool]:
+    """
+    cached_answer'ın akış hali: (parça iteratörü, cache_hit). Hit'te cevap tek parça
+    döner; miss'te produce() parçaları aktarılır ve akış sonuna kadar tüketilirse
+    birleşik cevap cache'e yazılır (yarıda kalan akış ve cacheable() False ise yazılmaz).
+    """
+    ttl = _ttl()
+    if ttl <= 0:
+        return produce(), False
+    key = answer_cache_key(question, cites)
+    answer = _lookup(key)
+    if answer is not None:
+        return iter((answer,)), True
+
+    def pieces() -> Iterator[str]:
+        parts: List[str] = []
+        for piece in produce():
+            parts.append(piece)
+            yield piece
+        if cacheable():
+            _store(key, "".join(parts).strip(), ttl)
+
+    return pieces(), False
@@ -0,0 +1,228 @@
+from __future__ import annotations
+import gc, json, logging, platform, resource, shutil, subprocess, sys, tempfile, time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.db import connection
+from django.db.models import TextField, Value
+from django.test import override_settings
+
+from apps.uploads.compression import compress, tenant_dictionary
+from apps.uploads.models import FTS_CONFIG, Tenant, Document, Chunk
+from . import index as index_mod, store
+from .corpus import bump_corpus_version
+from .quotes import sentence_features
+
+log = logging.getLogger("docuchat.bench")
+
+# Sentetik korpus: Zipf dağılımlı sözlük (gerçek metne benzer df eğrisi),
+# chunk başına ~CHUNK_TERMS terim. Aynı seed ile her çalıştırmada aynı korpus.
+VOCAB_SIZE = 50000
+CHUNK_TERMS = 120
+ZIPF_S = 1.07
+BACKENDS = ("index", "postgres", "dense")
+
+
+def _vocabulary():
+    words = np.array([f"w{i:x}" for i in range(VOCAB_SIZE)])
+    p = 1.0 / np.arange(1, VOCAB_SIZE + 1) ** ZIPF_S
+    return words, p / p.sum()
+
+
+def synthetic_texts(n: int, seed: int = 0, batch: int = 10000) -> Iterable[List[str]]:
+    rng = np.random.default_rng(seed)
+    words, p = _vocabulary()
+    for start in range(0, n, batch):
+        size = min(batch, n - start)
+        toks = words[rng.choice(VOCAB_SIZE, size=(size, CHUNK_TERMS), p=p)]
+        # Quote seçimi için chunk başına iki cümle
+        yield [" ".join(row[:60]) + ". " + " ".join(row[60:]) + "." for row in toks]
+
+
+def synthetic_questions(n: int, seed: int = 1) -> List[str]:
+    """Sık ve nadir terim karışımı sorular (2-6 terim)."""
+    rng = np.random.default_rng(seed)
+    words, p = _vocabulary()
+    out = []
+    for _ in range(n):
+        k = int(rng.integers(2, 7))
+        common = words[rng.choice(VOCAB_SIZE, size=k - 1, p=p)]
+        rare = words[rng.integers(100, VOCAB_SIZE, size=1)]
+        out.append(" ".join([*common, *rare]))
+    return out
+
+
+def ensure_tenant(size: int, seed: int = 0, log_fn: Callable[[str], None] = log.info) -> Tenant:
+    """`bench_<size>` tenant'ı; chunk sayısı tutmuyorsa yeniden üretilir."""
+    tenant, _ = Tenant.objects.get_or_create(name=f"bench_{size}")
+    if Chunk.objects.filter(tenant=tenant).count() == size:
+        return tenant
+    Document.objects.filter(tenant=tenant).delete()
+    doc = Document.objects.create(tenant=tenant, filename=f"synthetic_{size}.txt", size=0)
+    done = 0
+    zdict = None
+    for texts in synthetic_texts(size, seed):
+        zdict = zdict or tenant_dictionary(tenant.id, texts)
+        dict_id, data = zdict or (None, None)
+        Chunk.objects.bulk_create(
+            [Chunk(tenant=tenant, document=doc, index=done + i, text_z=compress(t, data), text_dict_id=dict_id,
+                   search=SearchVector(Value(t, output_field=TextField()), config=FTS_CONFIG),
+                   sentences=sentence_features(t))
+             for i, t in enumerate(texts)],
+            batch_size=2000,
+        )
+        done += len(texts)
+        log_fn(f"  generated {done}/{size} chunks")
+    bump_corpus_version(tenant.id)
+    return tenant
+
+
+def drop_tenant(tenant: Tenant) -> None:
+    index_mod.invalidate(tenant.id)
+    shutil.rmtree(store.tenant_dir(tenant.id), ignore_errors=True)
+    tenant.delete()
+
+
+def peak_rss_mb() -> float:
+    # Süreç ömrü boyunca en yüksek değer (Linux'ta KB, macOS'ta byte): boyut başına
+    # anlamlı olması için her boyut ayrı süreçte ölçülür (bkz. run)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+
+def percentiles(samples_s: Sequence[float]) -> Dict[str, float]:
+    ms = np.asarray(samples_s, dtype=np.float64) * 1000.0
+    if not len(ms):
+        return {}
+    return {
+        "n": int(len(ms)),
+        "mean": round(float(ms.mean()), 3),
+        "p50": round(float(np.percentile(ms, 50)), 3),
+        "p95": round(float(np.percentile(ms, 95)), 3),
+        "p99": round(float(np.percentile(ms, 99)), 3),
+        "max": round(float(ms.max()), 3),
+    }
+
+
+def _timed(fn: Callable, *args) -> float:
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
+
+
+def measure_index_build(tenant: Tenant) -> Dict[str, float]:
+    """Soğuk kurulum (DB -> disk nesli) ve yeni worker gibi mmap ile açılış."""
+    index_mod.invalidate(tenant.id)
+    shutil.rmtree(store.tenant_dir(tenant.id), ignore_errors=True)
+    gc.collect()
+    build_s = _timed(index_mod.get_index, tenant)
+    index_mod.invalidate(tenant.id)
+    open_s = _timed(index_mod.get_index, tenant)
+    return {"build_s": round(build_s, 4), "open_s": round(open_s, 4)}
+
+
+def measure_queries(tenant: Tenant, backend: str, questions: Sequence[str], top_k: int) -> Dict:
+    """Önce cache'siz (korpus nesli artırılarak), sonra aynı sorular cache'ten."""
+    from .views import retrieve
+
+    overrides = {"RETRIEVAL_BACKEND": "postgres" if backend == "postgres" else "index"}
+    if backend == "dense":
+        overrides["DENSE_WEIGHT"] = float(getattr(settings, "DENSE_WEIGHT", 0.0)) or 0.3
+    with override_settings(**overrides):
+        if backend == "dense":
+            from .embeddings import get_model, train
+            if get_model(tenant.id) is None:
+                train(tenant.id)
+        # Isınma: indeks/model yükleme ölçüme girmesin
+        retrieve(tenant, questions[0], top_k=top_k)
+        bump_corpus_version(tenant.id)
+        cold = [_timed(retrieve, tenant, q, top_k) for q in questions]
+        warm = [_timed(retrieve, tenant, q, top_k) for q in questions]
+    cold_p, warm_p = percentiles(cold), percentiles(warm)
+    return {
+        "query_ms": cold_p,
+        "cached_query_ms": warm_p,
+        "cache_speedup_p50": round(cold_p["p50"] / warm_p["p50"], 2) if warm_p.get("p50") else None,
+    }
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=str(settings.BASE_DIR), timeout=5).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "db_vendor": connection.vendor,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def run(sizes: Sequence[int], backends: Sequence[str], n_queries: int = 200, top_k: int = 4,
+        keep: bool = True, isolate: bool = True, log_fn: Callable[[str], None] = log.info) -> Dict:
+    """
+    `isolate`: her boyut yeni bir `manage.py bench_retrieval` sürecinde ölçülür; böylece
+    peak_rss_mb önceki (daha küçük/büyük) boyutların belleğini içermez.
+    """
+    questions = synthetic_questions(n_queries)
+    if isolate:
+        results = [_run_isolated(size, backends, n_queries, top_k, keep, log_fn) for size in sizes]
+    else:
+        results = [_run_size(size, backends, questions, top_k, keep, log_fn) for size in sizes]
+    return {"env": environment(), "params": {"queries": n_queries, "top_k": top_k,
+                                             "vocab_size": VOCAB_SIZE, "chunk_terms": CHUNK_TERMS},
+            "results": results}
+
+
+def _run_size(size: int, backends: Sequence[str], questions: Sequence[str], top_k: int, keep: bool,
+              log_fn: Callable[[str], None]) -> Dict:
+    log_fn(f"size={size}: preparing tenant")
+    tenant = ensure_tenant(size, log_fn=log_fn)
+    row: Dict = {"size": size, "chunks": Chunk.objects.filter(tenant=tenant).count()}
+    row.update(measure_index_build(tenant))
+    row["backends"] = {}
+    for backend in backends:
+        log_fn(f"size={size}: backend={backend}")
+        row["backends"][backend] = measure_queries(tenant, backend, questions, top_k)
+    row["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    if not keep:
+        drop_tenant(tenant)
+    return row
+
+
+def _run_isolated(size: int, backends: Sequence[str], n_queries: int, top_k: int, keep: bool,
+                  log_fn: Callable[[str], None]) -> Dict:
+    log_fn(f"size={size}: running in a fresh process")
+    with tempfile.TemporaryDirectory() as tmp:
+        out = Path(tmp) / "bench.json"
+        cmd = [sys.executable, str(Path(settings.BASE_DIR) / "manage.py"), "bench_retrieval",
+               "--sizes", str(size), "--backends", ",".join(backends), "--queries", str(n_queries),
+               "--top-k", str(top_k), "--output", str(out), "--in-process"]
+        if not keep:
+            cmd.append("--drop")
+        # Alt süreç ilerlemeyi aynı stderr'e yazar; ayarlar DJANGO_SETTINGS_MODULE ile geçer
+        proc = subprocess.run(cmd, cwd=str(settings.BASE_DIR))
+        if proc.returncode != 0:
+            raise RuntimeError(f"benchmark for size={size} failed (exit {proc.returncode})")
+        return json.loads(out.read_text())["results"][0]
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = 0.10) -> List[str]:
+    """İki JSON arasında p95'i `threshold`'dan fazla kötüleşen (boyut, backend) çiftleri."""
+    base = {(r["size"], b): m for r in baseline.get("results", []) for b, m in r.get("backends", {}).items()}
+    out = []
+    for r in current.get("results", []):
+        for b, m in r.get("backends", {}).items():
+            old: Optional[Dict] = base.get((r["size"], b))
+            if not old or "query_ms" not in old or "query_ms" not in m:
+                continue
+            before, after = old["query_ms"]["p95"], m["query_ms"]["p95"]
+            if before and after > before * (1 + threshold):
+                out.append(f"size={r['size']} backend={b}: p95 {before:.2f}ms -> {after:.2f}ms")
+    return out
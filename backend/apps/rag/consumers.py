@@ -0,0 +1,39 @@
+from __future__ import annotations
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+
+from apps.uploads.models import Tenant
+from .views import answer_events, prepare_stream
+
+
+def _scope_tenant(scope) -> Tenant:
+    # TenantMiddleware ile aynı sıra: X-Tenant başlığı, ?tenant=, DEFAULT_TENANT
+    headers = dict(scope.get("headers") or [])
+    query = parse_qs((scope.get("query_string") or b"").decode())
+    name = (headers.get(b"x-tenant", b"").decode() or (query.get("tenant") or [""])[0]
+            or settings.DEFAULT_TENANT)
+    tenant, _ = Tenant.objects.get_or_create(name=name)
+    return tenant
+
+
+class AskConsumer(AsyncJsonWebsocketConsumer):
+    """
+    ws/ask/: {"q": "...", "id": ...} gönderilir; {"type": "citations"}, her LLM
+    parçası için {"type": "token", "text"} ve {"type": "done", "answer", "meta"} döner.
+    "id" verilirse her mesajda geri gelir; sorular aynı bağlantıda sırayla cevaplanır.
+    """
+
+    async def connect(self):
+        self.tenant = await database_sync_to_async(_scope_tenant)(self.scope)
+        await self.accept()
+
+    async def receive_json(self, content, **kwargs):
+        content = content if isinstance(content, dict) else {}
+        q = (str(content.get("question") or "") or str(content.get("q") or "")).strip()
+        extra = {"id": content["id"]} if "id" in content else {}
+        enriched, pieces, hit = await database_sync_to_async(prepare_stream)(self.tenant, q)
+        async for name, payload in answer_events(enriched, pieces, hit):
+            await self.send_json({"type": name, **extra, **payload})
@@ -0,0 +1,55 @@
+from __future__ import annotations
+import hashlib, time
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Tenant başına korpus nesli: upload/silme (ve embedding modeli değişimi) sayacı
+# artırır. Retrieval cache anahtarları nesli içerdiği için eski kayıtlar
+# silinmeden geçersiz olur; TTL uzun tutulabilir.
+
+
+def _version_key(tenant_id: int) -> str:
+    return f"corpus:{tenant_id}:gen"
+
+
+def corpus_version(tenant_id: int) -> int:
+    key = _version_key(tenant_id)
+    version = cache.get(key)
+    if version is None:
+        # Sayaç cache'ten düşmüş olabilir: 1'den değil zamandan başla ki eski
+        # nesillerin anahtarlarıyla çakışmasın
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return int(version)
+
+
+def bump_corpus_version(tenant_id: int) -> int:
+    key = _version_key(tenant_id)
+    try:
+        return int(cache.incr(key))
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, None)
+        return version
+
+
+def normalize_question(question: str) -> str:
+    # Tokenizer büyük/küçük harf ve boşluk farkını zaten yok sayar
+    return " ".join((question or "").lower().split())
+
+
+def retrieval_cache_key(tenant_id: int, question: str, top_k: int, version: Optional[int] = None) -> str:
+    """Worker'lar ve restart'lar arasında sabit anahtar (hash() süreç başına tuzlu)."""
+    if version is None:
+        version = corpus_version(tenant_id)
+    digest = hashlib.blake2b(normalize_question(question).encode("utf-8"), digest_size=16).hexdigest()
+    # Retrieval ayarları değişince eski sonuçlar da geçersiz
+    backend = getattr(settings, "RETRIEVAL_BACKEND", "index")
+    dense = float(getattr(settings, "DENSE_WEIGHT", 0.0))
+    return f"retrv:{tenant_id}:{version}:{backend}:{dense:g}:{top_k}:{digest}"
+
+
+def retrieval_cache_ttl() -> int:
+    return int(getattr(settings, "RETRIEVAL_CACHE_TTL", 86400))
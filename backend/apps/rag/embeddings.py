@@ -0,0 +1,251 @@
+from __future__ import annotations
+import logging, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from pgvector.django import CosineDistance
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+from apps.uploads.compression import iter_texts
+from apps.uploads.models import Chunk, EMBEDDING_DIM
+from . import store
+from .corpus import bump_corpus_version
+
+log = logging.getLogger("docuchat.embeddings")
+
+# Hashing uzayı: sözlük tutmadan sabit boyut; model = (1 + dim) x EMBED_FEATURES float32
+EMBED_FEATURES = 2 ** 14
+
+_hasher = HashingVectorizer(
+    n_features=EMBED_FEATURES, token_pattern=r"(?u)\w+", lowercase=True,
+    alternate_sign=False, norm=None,
+)
+
+
+def dense_weight() -> float:
+    return float(getattr(settings, "DENSE_WEIGHT", 0.0))
+
+
+class LsaModel:
+    """
+    Tenant'a özel, ağ gerektirmeyen embedding modeli (LSA):
+    hashing TF -> sublinear tf * IDF -> TruncatedSVD -> L2 norm.
+    Diskte tek dizi olarak durur: satır 0 = IDF, kalan satırlar = SVD bileşenleri.
+    """
+
+    def __init__(self, idf: np.ndarray, components: np.ndarray):
+        self.idf = idf
+        self.components = components
+
+    @staticmethod
+    def _weight(texts: Sequence[str], idf: Optional[np.ndarray] = None):
+        X = _hasher.transform(texts).astype(np.float32)
+        X.data = 1.0 + np.log(X.data)
+        if idf is not None:
+            X = X.multiply(idf).tocsr()
+        return X
+
+    @classmethod
+    def fit(cls, texts: Sequence[str]) -> "LsaModel":
+        counts = _hasher.transform(texts)
+        n = counts.shape[0]
+        df = np.bincount(counts.indices, minlength=EMBED_FEATURES)
+        idf = (np.log((1.0 + n) / (1.0 + df)) + 1.0).astype(np.float32)
+        X = normalize(cls._weight(texts, idf))
+        # Küçük tenant'larda bileşen sayısı doküman sayısıyla sınırlı; kalan boyutlar sıfır
+        k = max(1, min(EMBEDDING_DIM, n - 1, EMBED_FEATURES - 1))
+        components = np.zeros((EMBEDDING_DIM, EMBED_FEATURES), dtype=np.float32)
+        if n > 1:
+            svd = TruncatedSVD(n_components=k, algorithm="randomized", random_state=0)
+            svd.fit(X)
+            components[:k] = svd.components_
+        return cls(idf, components)
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        X = normalize(self._weight(texts, self.idf))
+        return normalize(np.asarray(X @ self.components.T, dtype=np.float32))
+
+    def save(self, tenant_id: int) -> None:
+        store.save_array(tenant_id, "embed_model", np.vstack([self.idf[None, :], self.components]))
+
+    @classmethod
+    def load(cls, tenant_id: int) -> Optional["LsaModel"]:
+        arr = store.load_array(tenant_id, "embed_model")
+        if arr is None or arr.shape != (EMBEDDING_DIM + 1, EMBED_FEATURES):
+            return None
+        return cls(arr[0], arr[1:])
+
+
+# tenant_id -> (dosya mtime, model); başka süreç yeniden eğitirse mtime değişir
+_models: Dict[int, tuple] = {}
+_training: set = set()
+_lock = threading.Lock()
+_trainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-train")
+
+
+def get_model(tenant_id: int) -> Optional[LsaModel]:
+    mtime = store.array_mtime(tenant_id, "embed_model")
+    if mtime is None:
+        return None
+    cached = _models.get(tenant_id)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    model = LsaModel.load(tenant_id)
+    if model is not None:
+        _models[tenant_id] = (mtime, model)
+    return model
+
+
+def embed_missing(tenant_id: int, model: LsaModel, batch_size: int = 500) -> int:
+    """Embedding'i boş olan chunk'ları (ör. model eğitilmeden önce yüklenenler) doldurur."""
+    done = 0
+    ids = list(Chunk.objects.filter(tenant_id=tenant_id, embedding__isnull=True)
+               .order_by("id").values_list("id", flat=True))
+    for i in range(0, len(ids), batch_size):
+        rows = list(iter_texts(Chunk.objects.filter(id__in=ids[i:i + batch_size])
+                               .values_list("id", "text_z", "text_dict_id")))
+        vecs = model.embed([t or "" for _, t in rows])
+        Chunk.objects.bulk_update(
+            [Chunk(id=cid, embedding=v) for (cid, _), v in zip(rows, vecs)], ["embedding"], batch_size=batch_size)
+        done += len(rows)
+    if done:
+        bump_corpus_version(tenant_id)
+    return done
+
+
+def train(tenant_id: int, reembed: bool = False) -> LsaModel:
+    """Tenant modelini eğitir, kaydeder ve boş embedding'leri doldurur."""
+    sample = int(getattr(settings, "EMBED_TRAIN_SAMPLE", 20000))
+    texts = [t for _, t in iter_texts(Chunk.objects.filter(tenant_id=tenant_id)
+                                      .order_by("-id").values_list("id", "text_z", "text_dict_id")[:sample])]
+    model = LsaModel.fit(texts)
+    # İndeks kilidinden ayrı: uzun embed_missing indeks nesli yazımını bekletmez
+    with store.tenant_lock(tenant_id, name="embed"):
+        model.save(tenant_id)
+        if reembed:
+            # Yeni model = yeni uzay; eski vektörler karşılaştırılamaz
+            Chunk.objects.filter(tenant_id=tenant_id).update(embedding=None)
+        n = embed_missing(tenant_id, model)
+    # Dense skorlar değişti: cache'teki retrieval sonuçları eskidi
+    bump_corpus_version(tenant_id)
+    log.info("Embedding model trained tenant=%s sample=%d embedded=%d", tenant_id, len(texts), n)
+    return model
+
+
+def _train_background(tenant_id: int) -> None:
+    try:
+        train(tenant_id)
+    except Exception:
+        log.exception("Embedding training failed tenant=%s", tenant_id)
+    finally:
+        connection.close()
+        with _lock:
+            _training.discard(tenant_id)
+
+
+def ensure_model(tenant_id: int) -> Optional[LsaModel]:
+    """Model varsa döner; yoksa arka planda eğitimi başlatır (sorgu yolu beklemez)."""
+    model = get_model(tenant_id)
+    if model is None:
+        with _lock:
+            if tenant_id not in _training:
+                _training.add(tenant_id)
+                _trainer.submit(_train_background, tenant_id)
+    return model
+
+
+def embed_texts(tenant_id: int, texts: Sequence[str]) -> Optional[np.ndarray]:
+    """Upload sırasında: dense sinyal açıksa ve model varsa chunk vektörleri."""
+    if dense_weight() <= 0:
+        return None
+    model = get_model(tenant_id)
+    return model.embed(list(texts)) if model is not None else None
+
+
+# pgvector'ün ef_search üst sınırı
+HNSW_EF_MAX = 1000
+
+_iterative: Optional[bool] = None
+
+
+def _iterative_scan() -> bool:
+    """pgvector >= 0.8: hnsw.iterative_scan filtreyi geçen n satır bulunana kadar taramayı sürdürür."""
+    global _iterative
+    if _iterative is None:
+        with connection.cursor() as cur:
+            cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            row = cur.fetchone()
+        _iterative = bool(row) and tuple(int(p) for p in row[0].split(".")[:2]) >= (0, 8)
+    return _iterative
+
+
+def _ef_search(cur, n: int, tenant_rows: Optional[int]) -> int:
+    """
+    HNSW önce ef_search aday bulur, tenant filtresi sonra uygulanır: beklenen
+    isabet ef * (tenant payı) olduğundan havuz paya göre büyütülür.
+    """
+    ef = max(int(getattr(settings, "HNSW_EF_SEARCH", 64)), n)
+    if tenant_rows:
+        # Toplam için planner tahmini yeter (sayım sorgusu yok); -1 = hiç analiz edilmemiş
+        cur.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [Chunk._meta.db_table])
+        total = cur.fetchone()[0]
+        if total > tenant_rows:
+            ef = int(np.ceil(ef * total / tenant_rows))
+    return min(ef, HNSW_EF_MAX)
+
+
+def nearest(tenant, qvec: np.ndarray, n: int, tenant_rows: Optional[int] = None) -> Dict[int, float]:
+    """
+    HNSW üzerinden tenant'ın en yakın n chunk'ı: {chunk_id: cosine benzerlik}.
+    tenant_rows: tenant'ın chunk sayısı (indeksten); ef_search tenant payına göre ayarlanır.
+    """
+    qs = (Chunk.objects.filter(tenant=tenant, embedding__isnull=False)
+          .annotate(distance=CosineDistance("embedding", qvec)).order_by("distance").values_list("id", "distance"))
+    with transaction.atomic():
+        with connection.cursor() as cur:
+            if _iterative_scan():
+                cur.execute("SET LOCAL hnsw.iterative_scan = strict_order")
+            cur.execute(f"SET LOCAL hnsw.ef_search = {_ef_search(cur, n, tenant_rows)}")
+        rows = list(qs[:n])
+        if len(rows) < n and (tenant_rows is None or len(rows) < tenant_rows):
+            # Havuz yine de yetmedi: tenant'ın satırları üzerinde kesin tarama (HNSW kapalı, tenant_id indeksi açık)
+            with connection.cursor() as cur:
+                cur.execute("SET LOCAL enable_indexscan = off")
+            rows = list(qs[:n])
+    return {cid: 1.0 - float(d) for cid, d in rows}
+
+
+def similarities(tenant, qvec: np.ndarray, chunk_ids: Iterable[int]) -> Dict[int, float]:
+    rows = (Chunk.objects.filter(tenant=tenant, id__in=list(chunk_ids), embedding__isnull=False)
+            .annotate(distance=CosineDistance("embedding", qvec)).values_list("id", "distance"))
+    return {cid: 1.0 - float(d) for cid, d in rows}
+
+
+def hybrid_search(tenant, index, question: str, n: int, weight: float) -> List[int]:
+    """
+    Lexical hybrid (0.40 TF-IDF + 0.60 BM25) skoruna dense cosine benzerliğini
+    `weight` ile ekler. Aday kümesi = lexical top-n ∪ HNSW top-n.
+    """
+    lexical = dict(index.search_scored(question, n))
+    model = ensure_model(tenant.id)
+    if model is None:
+        return list(lexical)
+    qvec = model.embed([question])[0]
+    if not qvec.any():
+        return list(lexical)
+    dense = nearest(tenant, qvec, n, index.n_live)
+    only_dense = [i for i in dense if i not in lexical]
+    if only_dense:
+        lexical.update(zip(only_dense, index.score(question, only_dense).tolist()))
+    only_lexical = [i for i in lexical if i not in dense]
+    if only_lexical:
+        dense.update(similarities(tenant, qvec, only_lexical))
+    fused = {i: s + weight * dense.get(i, 0.0) for i, s in lexical.items() if np.isfinite(s)}
+    return sorted(fused, key=fused.get, reverse=True)[:n]
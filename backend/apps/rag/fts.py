@@ -0,0 +1,31 @@
+from __future__ import annotations
+from typing import List
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, Value
+
+from apps.uploads.models import Chunk, FTS_CONFIG
+from .index import tokenize
+
+# ts_rank_cd normalizasyonu: 1 = skor / (1 + log(doküman uzunluğu)), BM25'teki uzunluk cezasına yakın
+RANK_NORMALIZATION = 1
+
+
+def fts_search(tenant, question: str, n: int) -> List[Chunk]:
+    """
+    RETRIEVAL_BACKEND=postgres: aday seçimi ve sıralama veritabanında yapılır.
+    Chunk.search (GIN indeksli, insert'te hesaplanan tsvector) üzerinde terimlerin OR'u
+    ile eşleşen satırlar ts_rank_cd ile sıralanır; sadece ilk n satır döner.
+    """
+    terms = sorted(set(tokenize(question or "")))
+    if not terms:
+        return []
+    # Token'lar \w+ olduğu için tırnaklı literal olarak güvenle raw tsquery'ye girer
+    query = SearchQuery(" | ".join(f"'{t}'" for t in terms), search_type="raw", config=FTS_CONFIG)
+    return list(
+        Chunk.objects.select_related("document")
+        .only("id","text_z","text_dict_id","sentences","document_id","document__filename","tenant_id","page","index")
+        .filter(tenant=tenant, search=query)
+        .annotate(rank=SearchRank(F("search"), query, cover_density=True, normalization=Value(RANK_NORMALIZATION)))
+        .order_by("-rank", "id")[:n]
+    )
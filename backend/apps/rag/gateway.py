@@ -0,0 +1,300 @@
+from __future__ import annotations
+import asyncio, logging, threading, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+from .llm import fake_llm_answer, get_provider
+
+log = logging.getLogger("docuchat.llm")
+
+# Cevap kaynağı (meta.llm): sağlayıcı, hedge isteği ya da extractive fallback
+PRIMARY, HEDGED, FALLBACK = "primary", "hedged", "fallback"
+
+
+class CircuitBreaker:
+    """
+    Ardışık LLM_BREAKER_FAILURES hata/timeout → açık: LLM_BREAKER_COOLDOWN saniye
+    boyunca sağlayıcı çağrılmaz. Süre dolunca tek deneme isteği geçer (yarı açık);
+    başarılıysa kapanır, değilse tekrar açılır. Sadece gateway loop'unda değişir.
+    """
+
+    def __init__(self, failures: int, cooldown: float):
+        self.threshold = max(1, failures)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None and time.monotonic() - self.opened_at < self.cooldown
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self.is_open or self.probing:
+            return False
+        self.probing = True
+        return True
+
+    def success(self) -> None:
+        if self.opened_at is not None:
+            log.info("LLM circuit closed")
+        self.failures, self.opened_at, self.probing = 0, None, False
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.probing or self.failures >= self.threshold:
+            if not self.is_open:
+                log.warning("LLM circuit open for %.0fs after %d failures", self.cooldown, self.failures)
+            self.opened_at, self.probing = time.monotonic(), False
+
+    def release_probe(self) -> None:
+        """Deneme isteği sonuç bildirmeden bitti (istemci koptu/iptal): sıradaki istek yeniden dener."""
+        self.probing = False
+
+
+class LLMGateway:
+    """
+    Uzak LLM sağlayıcısı (get_provider().remote) çağrıları için tek süreç içi giriş
+    noktası. Kendi event loop thread'inde çalışır; senkron view'lar, akışlı cevaplar ve
+    async kod (ASGI loop'u) aynı semaforları ve breaker'ı paylaşır. Sağlayıcı çağrısı
+    bloklayıcı olduğu için ayrı bir thread havuzunda koşar.
+    """
+
+    def __init__(self):
+        self.max_inflight = max(1, int(getattr(settings, "LLM_MAX_INFLIGHT", 16)))
+        self.tenant_inflight = max(1, int(getattr(settings, "LLM_TENANT_INFLIGHT", 4)))
+        self.deadline = float(getattr(settings, "LLM_DEADLINE", 20))
+        self.first_token_deadline = min(self.deadline, float(getattr(settings, "LLM_FIRST_TOKEN_DEADLINE", 10)))
+        self.hedge = bool(getattr(settings, "LLM_HEDGE", False))
+        self.hedge_min_samples = int(getattr(settings, "LLM_HEDGE_MIN_SAMPLES", 20))
+        self.breaker = CircuitBreaker(int(getattr(settings, "LLM_BREAKER_FAILURES", 5)),
+                                      float(getattr(settings, "LLM_BREAKER_COOLDOWN", 30)))
+        self._latencies: Deque[float] = deque(maxlen=200)
+        self._global = asyncio.Semaphore(self.max_inflight)
+        self._tenants: Dict[object, asyncio.Semaphore] = {}
+        # Deadline'da bırakılan çağrılar thread'de bitene kadar sürer; havuz onlara da yer bırakır
+        self._executor = ThreadPoolExecutor(max_workers=self.max_inflight * 2, thread_name_prefix="llm-call")
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True).start()
+
+    def submit(self, tenant_id, question: str, cites: List[Dict]):
+        """concurrent.futures.Future → (cevap, kaynak)."""
+        return asyncio.run_coroutine_threadsafe(self._answer(tenant_id, question, cites), self._loop)
+
+    def hedge_delay(self) -> Optional[float]:
+        """Son gecikmelerin p95'i; hedge kapalıysa ya da örnek azsa None."""
+        if not self.hedge or len(self._latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    async def _answer(self, tenant_id, question: str, cites: List[Dict]) -> Tuple[str, str]:
+        if not self.breaker.allow():
+            return fake_llm_answer(question, cites), FALLBACK
+        # allow() bu isteği yarı açık devrenin denemesi yaptıysa probing şimdi True
+        probe = self.breaker.probing
+        try:
+            answer, source = await asyncio.wait_for(self._guarded(tenant_id, question, cites), self.deadline)
+        except asyncio.TimeoutError:
+            log.warning("LLM deadline (%.1fs) exceeded", self.deadline)
+            self.breaker.failure()
+            return fake_llm_answer(question, cites), FALLBACK
+        except Exception:
+            log.exception("LLM error")
+            self.breaker.failure()
+            return fake_llm_answer(question, cites), FALLBACK
+        finally:
+            # İptal (CancelledError) sonuç bildirmez: deneme bırakılmazsa devre hiç kapanmaz
+            if probe and self.breaker.probing:
+                self.breaker.release_probe()
+        self.breaker.success()
+        return answer, source
+
+    def _tenant(self, tenant_id) -> asyncio.Semaphore:
+        tenant = self._tenants.get(tenant_id)
+        if tenant is None:
+            tenant = self._tenants[tenant_id] = asyncio.Semaphore(self.tenant_inflight)
+        return tenant
+
+    async def _guarded(self, tenant_id, question: str, cites: List[Dict]) -> Tuple[str, str]:
+        # Önce tenant slotu: tek tenant'ın kuyruğu süreç slotlarını tutmaz
+        async with self._tenant(tenant_id), self._global:
+            return await self._hedged(question, cites)
+
+    async def _admit(self, tenant_id) -> Optional[Tuple[asyncio.Semaphore, bool]]:
+        """
+        Akış için slotlar: breaker kapalıysa tenant + süreç semaforu deadline içinde
+        alınır; (tenant semaforu, yarı açık devrenin denemesi mi) döner. Breaker
+        açıksa ya da süre dolarsa None.
+        """
+        if not self.breaker.allow():
+            return None
+        probe = self.breaker.probing
+        tenant = self._tenant(tenant_id)
+
+        async def acquire():
+            await tenant.acquire()
+            try:
+                await self._global.acquire()
+            except BaseException:
+                tenant.release()
+                raise
+
+        try:
+            await asyncio.wait_for(acquire(), self.first_token_deadline)
+        except asyncio.TimeoutError:
+            log.warning("LLM stream waited %.1fs for a slot", self.first_token_deadline)
+            self.breaker.failure()
+            return None
+        except BaseException:
+            if probe:
+                self.breaker.release_probe()
+            raise
+        return tenant, probe
+
+    def _report(self, outcome: Optional[bool], probe: bool) -> None:
+        """Akış sonucu breaker'a; istemci kopmuşsa (None) sadece deneme hakkı bırakılır."""
+        if outcome is None:
+            if probe and self.breaker.probing:
+                self.breaker.release_probe()
+        elif outcome:
+            self.breaker.success()
+        else:
+            self.breaker.failure()
+
+    def _release(self, tenant: asyncio.Semaphore) -> None:
+        self._global.release()
+        tenant.release()
+
+    def stream(self, tenant_id, question: str, cites: List[Dict]) -> "GatewayStream":
+        return GatewayStream(self, tenant_id, question, cites)
+
+    async def _call(self, question: str, cites: List[Dict]) -> str:
+        provider = get_provider()
+        start = time.monotonic()
+        answer = await self._loop.run_in_executor(self._executor, provider.generate, question, cites, self.deadline)
+        self._latencies.append(time.monotonic() - start)
+        return answer
+
+    async def _hedge_call(self, question: str, cites: List[Dict]) -> str:
+        try:
+            return await self._call(question, cites)
+        finally:
+            self._global.release()
+
+    async def _hedged(self, question: str, cites: List[Dict]) -> Tuple[str, str]:
+        primary = asyncio.ensure_future(self._call(question, cites))
+        tasks = {primary}
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                # p95'i aşan istek: boş süreç slotu varsa ikinci kopya gönderilir (doluyken
+                # hedge yükü artırır), ilk başarılı cevap kazanır
+                if not done and not self._global.locked():
+                    await self._global.acquire()
+                    tasks.add(asyncio.ensure_future(self._hedge_call(question, cites)))
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        return t.result(), (PRIMARY if t is primary else HEDGED)
+                    error = t.exception()
+            raise error
+        finally:
+            for t in tasks:
+                t.cancel()
+
+
+_END = object()
+
+
+class GatewayStream:
+    """
+    Akışlı cevap için gateway yolu (iterasyon başlayınca çalışır): aynı semaforlar,
+    ilk parçaya kadar LLM_FIRST_TOKEN_DEADLINE ve toplamda LLM_DEADLINE sınırı;
+    sonuç breaker'a bildirilir. Parça gelmeden düşen akış extractive cevaba döner
+    (source=FALLBACK, cache'lenmez); ortada kopan akış hata parçasıyla biter.
+    """
+
+    def __init__(self, gateway: LLMGateway, tenant_id, question: str, cites: List[Dict]):
+        self.gateway, self.tenant_id, self.question, self.cites = gateway, tenant_id, question, cites
+        self.source = PRIMARY
+
+    def _fallback(self) -> Iterator[str]:
+        self.source = FALLBACK
+        return get_provider("fake").iter_stream(self.question, self.cites)
+
+    def __iter__(self) -> Iterator[str]:
+        gw = self.gateway
+        admitted = asyncio.run_coroutine_threadsafe(gw._admit(self.tenant_id), gw._loop).result()
+        if admitted is None:
+            yield from self._fallback()
+            return
+        tenant, probe = admitted
+        provider = get_provider()
+        # outcome None: istemci koptu (başarı/hata sayılmaz, sadece deneme bırakılır)
+        start, sent, outcome = time.monotonic(), False, None
+        it = provider.iter_stream(self.question, self.cites)
+        try:
+            while True:
+                limit = gw.deadline if sent else gw.first_token_deadline
+                remaining = start + limit - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"no {'completion' if sent else 'first token'} within {limit:.1f}s")
+                piece = gw._executor.submit(next, it, _END).result(timeout=remaining)
+                if piece is _END:
+                    outcome = True
+                    break
+                sent = True
+                yield piece
+        except Exception as e:
+            outcome = False
+            reason = str(e) or type(e).__name__
+            log.warning("LLM stream failed: %s", reason)
+            if not sent:
+                yield from self._fallback()
+            else:
+                self.source = FALLBACK
+                yield f"\nLLM error ({provider.label}): {reason}"
+        finally:
+            gw._loop.call_soon_threadsafe(gw._release, tenant)
+            gw._loop.call_soon_threadsafe(gw._report, outcome, probe)
+            try:
+                it.close()
+            except (ValueError, RuntimeError):
+                # next() hâlâ havuz thread'inde çalışıyor (deadline): sağlayıcı timeout'u bitirir
+                pass
+
+
+_gateway: Optional[LLMGateway] = None
+_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    global _gateway
+    with _lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
+
+
+async def answer(tenant_id, question: str, cites: List[Dict]) -> Tuple[str, str]:
+    """(cevap, kaynak); bekleme sırasında çağıranın thread'i/loop'u serbesttir."""
+    return await asyncio.wrap_future(get_gateway().submit(tenant_id, question, cites))
+
+
+def answer_sync(tenant_id, question: str, cites: List[Dict]) -> Tuple[str, str]:
+    gateway = get_gateway()
+    # Deadline gateway içinde uygulanır; buradaki süre sadece emniyet payı
+    return gateway.submit(tenant_id, question, cites).result(timeout=gateway.deadline + 5)
+
+
+def stream(tenant_id, question: str, cites: List[Dict]) -> GatewayStream:
+    return get_gateway().stream(tenant_id, question, cites)
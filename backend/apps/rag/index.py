@@ -0,0 +1,747 @@
+from __future__ import annotations
+import logging, threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.db.models import Count, Max
+from sklearn.feature_extraction.text import CountVectorizer
+
+from apps.uploads.compression import iter_texts
+from apps.uploads.models import Chunk
+from . import store
+from .corpus import corpus_version
+from .store import Vocabulary
+
+log = logging.getLogger("docuchat.index")
+
+# Hybrid ağırlıkları (retrieve ile aynı)
+TFIDF_WEIGHT = 0.40
+BM25_WEIGHT = 0.60
+
+# rank_bm25.BM25Okapi varsayılanları
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_EPSILON = 0.25
+
+
+# BM25 tarafı `\w+` ile lower-case token'lar kullanıyordu; TF-IDF (sklearn
+# varsayılanı) aynı token'ların >=2 karakterli olanları. Tek sözlük yeterli.
+tokenize = CountVectorizer(token_pattern=r"(?u)\w+", lowercase=True).build_analyzer()
+
+
+# Sorgu anında kullanılan global istatistikler; her değişiklikte topluca yenilenir
+Stats = namedtuple("Stats", "df tfidf_idf bm25_idf n_live avgdl")
+
+
+def compute_idf(df: np.ndarray, term_len: np.ndarray, n_live: int) -> Tuple[np.ndarray, np.ndarray]:
+    # TF-IDF (sklearn smooth_idf): idf = ln((1+n)/(1+df)) + 1, tek harfli token'lar hariç
+    tfidf_idf = (np.log((1.0 + n_live) / (1.0 + df)) + 1.0) * (term_len >= 2)
+    # BM25Okapi: idf = ln(N - df + .5) - ln(df + .5); negatifler epsilon * ortalama ile.
+    # Ortalama, korpusta hâlâ geçen terimler üzerinden alınır.
+    bm25_idf = np.log(n_live - df + 0.5) - np.log(df + 0.5)
+    present = df > 0
+    average_idf = float(bm25_idf[present].mean()) if present.any() else 0.0
+    bm25_idf[bm25_idf < 0] = BM25_EPSILON * average_idf
+    bm25_idf[~present] = 0.0
+    return tfidf_idf, bm25_idf
+
+
+def doc_norms(tf: sparse.csr_matrix, tfidf_idf: np.ndarray) -> np.ndarray:
+    # TF-IDF doküman normu; IDF global olduğu için her istatistik değişiminde yeniden hesaplanır
+    w = tf.multiply(tfidf_idf[: tf.shape[1]]).tocsr()
+    norms = np.sqrt(np.asarray(w.multiply(w).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return norms
+
+
+def _column_reduce(ufunc, values: np.ndarray, indptr: np.ndarray, fill: float) -> np.ndarray:
+    out = np.full(len(indptr) - 1, fill, dtype=np.float64)
+    starts = indptr[:-1]
+    nonempty = indptr[1:] > starts
+    if nonempty.any():
+        out[nonempty] = ufunc.reduceat(values, starts[nonempty])
+    return out
+
+
+def _saturation(tf, dl, avgdl: float):
+    # BM25 terim kısmı (idf hariç): tf'te artan, doküman uzunluğunda azalan
+    return tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * dl / avgdl))
+
+
+class Segment:
+    """
+    Değişmez posting bloğu (chunk'lar id sırasıyla). Diziler düz numpy'dır,
+    böylece ana segment diskten mmap'li olarak da açılabilir. Silinen satırlar
+    sadece worker'a özel `live` maskesinde işaretlenir (copy-on-write).
+    """
+
+    def __init__(self, chunk_ids: np.ndarray, doc_len: np.ndarray, tf: Tuple, postings: Tuple,
+                 norms: Optional[np.ndarray] = None, bounds: Optional[Tuple] = None):
+        self.chunk_ids = chunk_ids
+        self.doc_len = doc_len
+        self.tf_indptr, self.tf_indices, self.tf_data = tf
+        self.post_indptr, self.post_indices, self.post_data = postings
+        self.live = np.ones(len(chunk_ids), dtype=bool)
+        # Terim başına skor üst sınırları (MaxScore için): en büyük tf, en kısa doküman
+        # ve en büyük tf/norm. Silinen satırlar sınırı sadece gevşetir, geçersiz kılmaz.
+        if bounds is None:
+            ptr = self.post_indptr
+            self.max_tf = _column_reduce(np.maximum, self.post_data, ptr, 0.0)
+            self.min_dl = _column_reduce(np.minimum, self.doc_len[self.post_indices], ptr, np.inf)
+            self.set_norms(norms if norms is not None else np.ones(len(chunk_ids)))
+        else:
+            self.max_tf, self.min_dl, max_tfn = bounds
+            self.set_norms(norms, max_tfn)
+
+    def set_norms(self, norms: np.ndarray, max_tfn: Optional[np.ndarray] = None) -> None:
+        """Normları ve onlara bağlı tf/norm üst sınırını ayarlar (IDF değişince tekrar çağrılır)."""
+        if max_tfn is None:
+            max_tfn = _column_reduce(np.maximum, self.post_data / norms[self.post_indices], self.post_indptr, 0.0)
+        self.norms, self.max_tfn = norms, max_tfn
+
+    @classmethod
+    def from_tf(cls, chunk_ids: np.ndarray, tf: sparse.csr_matrix) -> "Segment":
+        tf.sort_indices()
+        csc = tf.tocsc()
+        csc.sort_indices()
+        doc_len = np.asarray(tf.sum(axis=1)).ravel().astype(np.float64)
+        return cls(chunk_ids, doc_len, (tf.indptr, tf.indices, tf.data), (csc.indptr, csc.indices, csc.data))
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.chunk_ids)
+
+    @property
+    def n_terms(self) -> int:
+        return len(self.post_indptr) - 1
+
+    @property
+    def n_live(self) -> int:
+        return int(self.live.sum())
+
+    def tf_matrix(self, n_terms: int) -> sparse.csr_matrix:
+        return sparse.csr_matrix((self.tf_data, self.tf_indices, self.tf_indptr), shape=(self.n_docs, n_terms))
+
+    def row_terms(self, rows: np.ndarray) -> np.ndarray:
+        ptr = self.tf_indptr
+        return np.concatenate([self.tf_indices[ptr[r]:ptr[r + 1]] for r in rows])
+
+    def locate(self, chunk_ids: np.ndarray) -> np.ndarray:
+        if not self.n_docs:
+            return np.zeros(0, dtype=np.int64)
+        pos = np.clip(np.searchsorted(self.chunk_ids, chunk_ids), 0, self.n_docs - 1)
+        return pos[self.chunk_ids[pos] == chunk_ids]
+
+
+class TenantIndex:
+    """
+    Tenant arama indeksi: bir ana segment + küçük delta segmentler + tombstone'lar.
+    Upload yeni bir delta segment ekler, silme satırları tombstone'lar; arka plan
+    compaction segmentleri ana indekse birleştirir. Sözlük, DF ve doküman
+    uzunlukları artımlı tutulur, böylece sorgu yolu hiç tam rebuild ödemez.
+
+    `tenant_id` verilirse ana segment diskteki nesilden mmap ile açılır ve
+    compaction yeni nesli diske yazar (bkz. store.py); delta'lar ve
+    tombstone'lar worker belleğinde kalır.
+    """
+
+    def __init__(self, tenant_id: Optional[int] = None):
+        self.tenant_id = tenant_id
+        self.generation = 0
+        self.vocabulary = Vocabulary()
+        self.df = np.zeros(0, dtype=np.int64)
+        self.term_len = np.zeros(0, dtype=np.int32)
+        self.segments: Tuple[Segment, ...] = ()
+        self.total_len = 0.0
+        self.max_chunk_id = 0
+        # DB ile en son eşitlendiği korpus nesli (corpus.corpus_version); None = hiç eşitlenmedi
+        self.corpus_version: Optional[int] = None
+        self.stats = Stats(self.df, np.zeros(0), np.zeros(0), 0, 0.0)
+        self._lock = threading.RLock()
+        self._compacting = False
+
+    @classmethod
+    def build(cls, rows: Iterable[Tuple[int, str]]) -> "TenantIndex":
+        idx = cls()
+        idx.add(rows, compact=False)
+        return idx
+
+    @classmethod
+    def open(cls, tenant_id: int, manifest: dict) -> "TenantIndex":
+        arrays, vocabulary = store.open_generation(tenant_id, manifest)
+        idx = cls(tenant_id)
+        idx.generation = manifest["generation"]
+        idx.vocabulary = vocabulary
+        # DF ve terim uzunlukları worker'da değişebilir (delta/tombstone): kopya
+        idx.df = np.array(arrays["df"], dtype=np.int64)
+        idx.term_len = np.array(arrays["term_len"], dtype=np.int32)
+        idx.total_len = float(manifest["total_len"])
+        idx.max_chunk_id = int(manifest["max_chunk_id"])
+        idx.segments = (Segment(
+            arrays["chunk_ids"], arrays["doc_len"],
+            (arrays["tf_indptr"], arrays["tf_indices"], arrays["tf_data"]),
+            (arrays["post_indptr"], arrays["post_indices"], arrays["post_data"]),
+            norms=arrays["norms"], bounds=(arrays["max_tf"], arrays["min_dl"], arrays["max_tfn"]),
+        ),)
+        idx._refresh_stats()
+        return idx
+
+    @property
+    def n_live(self) -> int:
+        return self.stats.n_live
+
+    def live_ids(self) -> np.ndarray:
+        segments = self.segments
+        if not segments:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([s.chunk_ids[s.live] for s in segments])
+
+    def _tf_matrix(self, texts: Sequence[str]) -> sparse.csr_matrix:
+        indptr, indices, data = [0], [], []
+        seen: Dict[str, int] = {}
+        for text in texts:
+            counts: Dict[int, int] = {}
+            for tok in tokenize(text):
+                j = seen.get(tok)
+                if j is None:
+                    j = seen[tok] = self.vocabulary.add(tok)
+                counts[j] = counts.get(j, 0) + 1
+            indices.extend(counts.keys())
+            data.extend(counts.values())
+            indptr.append(len(indices))
+        return sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32),
+             np.asarray(indptr, dtype=np.int64)),
+            shape=(len(texts), len(self.vocabulary)),
+        )
+
+    def _grow_terms(self) -> None:
+        old, n_terms = len(self.df), len(self.vocabulary)
+        if n_terms == old:
+            return
+        new_len = np.asarray([len(self.vocabulary.term(j)) for j in range(old, n_terms)], dtype=np.int32)
+        self.df = np.concatenate([self.df, np.zeros(n_terms - old, dtype=np.int64)])
+        self.term_len = np.concatenate([self.term_len, new_len])
+
+    def _compute_stats(self, segments: Sequence[Segment]) -> Stats:
+        n_live = sum(s.n_live for s in segments)
+        df = self.df
+        tfidf_idf, bm25_idf = compute_idf(df, self.term_len, n_live)
+        avgdl = self.total_len / n_live if n_live else 0.0
+        return Stats(df, tfidf_idf, bm25_idf, n_live, avgdl)
+
+    def _refresh_stats(self) -> None:
+        self.stats = self._compute_stats(self.segments)
+
+    @staticmethod
+    def _renormalize(segments: Sequence[Segment], stats: Stats) -> None:
+        # IDF her add/delete'te değişir: tüm segmentlerin normları güncel IDF'e çekilir,
+        # skorlar tam rebuild ile aynı kalır. Sadece tf dizileri üzerinden O(nnz), tokenizasyon yok.
+        n_terms = len(stats.tfidf_idf)
+        for s in segments:
+            s.set_norms(doc_norms(s.tf_matrix(n_terms), stats.tfidf_idf))
+
+    def add(self, rows: Iterable[Tuple[int, str]], compact: bool = True) -> int:
+        """Yeni chunk'ları (id, text) tek bir delta segment olarak ekler."""
+        rows = sorted(rows)
+        if not rows:
+            return 0
+        with self._lock:
+            ids = np.asarray([r[0] for r in rows], dtype=np.int64)
+            fresh = ~np.isin(ids, self.live_ids())
+            if not fresh.all():
+                rows = [r for r, f in zip(rows, fresh) if f]
+                ids = ids[fresh]
+                if not rows:
+                    return 0
+            tf = self._tf_matrix([r[1] or "" for r in rows])
+            self._grow_terms()
+            self.df = self.df + np.bincount(tf.indices, minlength=len(self.df))
+            seg = Segment.from_tf(ids, tf)
+            self.total_len += float(seg.doc_len.sum())
+            self.max_chunk_id = max(self.max_chunk_id, int(ids[-1]))
+            segments = self.segments + (seg,)
+            stats = self._compute_stats(segments)
+            # Normlar (yeni segmentinki dahil) yayınlanmadan önce güncel IDF ile hesaplanır
+            self._renormalize(segments, stats)
+            self.segments, self.stats = segments, stats
+        if compact:
+            self._maybe_compact()
+        return len(rows)
+
+    def delete(self, chunk_ids: Iterable[int]) -> int:
+        """Chunk'ları tombstone'lar; posting'ler compaction'a kadar yerinde kalır."""
+        ids = np.unique(np.asarray(list(chunk_ids), dtype=np.int64))
+        if not len(ids):
+            return 0
+        removed = 0
+        with self._lock:
+            for s in self.segments:
+                rows = s.locate(ids)
+                rows = rows[s.live[rows]]
+                if not len(rows):
+                    continue
+                self.df = self.df - np.bincount(s.row_terms(rows), minlength=len(self.df))
+                self.total_len -= float(s.doc_len[rows].sum())
+                live = s.live.copy()
+                live[rows] = False
+                s.live = live
+                removed += len(rows)
+            if removed:
+                stats = self._compute_stats(self.segments)
+                self._renormalize(self.segments, stats)
+                self.stats = stats
+        if removed:
+            self._maybe_compact()
+        return removed
+
+    def _needs_compaction(self) -> bool:
+        segments = self.segments
+        if not segments or (len(segments) == 1 and segments[0].n_live == segments[0].n_docs):
+            return False
+        max_segments = int(getattr(settings, "INDEX_MAX_SEGMENTS", 8))
+        ratio = float(getattr(settings, "INDEX_COMPACT_RATIO", 0.10))
+        main = segments[0].n_docs
+        delta = sum(s.n_docs for s in segments[1:])
+        dead = sum(s.n_docs - s.n_live for s in segments)
+        return len(segments) > max_segments or (delta + dead) > ratio * max(main, 1)
+
+    def _maybe_compact(self) -> None:
+        with self._lock:
+            if self._compacting or not self._needs_compaction():
+                return
+            self._compacting = True
+        _compactor.submit(self._run_compaction)
+
+    def _run_compaction(self) -> None:
+        try:
+            self.compact()
+        except Exception:
+            log.exception("Index compaction failed")
+        finally:
+            self._compacting = False
+
+    def compact(self) -> None:
+        """Tüm segmentleri (canlı satırlarıyla) tek ana segmentte birleştirir."""
+        with self._lock:
+            snapshot = self.segments
+            masks = [s.live for s in snapshot]
+            n_terms = len(self.df)
+        if not snapshot:
+            return
+        # Ağır iş kilit dışında: yeni sorgular ve upload'lar beklemez
+        ids = np.concatenate([s.chunk_ids[m] for s, m in zip(snapshot, masks)])
+        tf = sparse.vstack([s.tf_matrix(n_terms)[m] for s, m in zip(snapshot, masks)], format="csr")
+        if self.tenant_id is not None:
+            with store.tenant_lock(self.tenant_id, blocking=False) as acquired:
+                current = store.read_manifest(self.tenant_id)
+                # Başka bir worker zaten yeni nesil yazdıysa onu açmak yeterli
+                if acquired and (current or {}).get("generation", 0) == self.generation:
+                    self.save(ids, tf)
+            # Registry bir sonraki sorguda yeni nesli açar ve DB'den delta'ları yakalar
+            return
+        merged = Segment.from_tf(ids, tf)
+        with self._lock:
+            # Birleştirme sırasında gelen tombstone'lar (snapshot maskesinden sonra ölenler)
+            died = np.concatenate([s.chunk_ids[m & ~s.live] for s, m in zip(snapshot, masks)])
+            if len(died):
+                merged.live[merged.locate(died)] = False
+            merged.set_norms(doc_norms(tf, self.stats.tfidf_idf))
+            # Arada eklenen delta'lar korunur; segmentler sadece sona eklenir
+            self.segments = (merged,) + self.segments[len(snapshot):]
+            self._refresh_stats()
+        log.info("Index compacted segments=%d -> %d docs=%d", len(snapshot), len(self.segments), merged.n_live)
+
+    def save(self, ids: np.ndarray, tf: sparse.csr_matrix) -> dict:
+        """
+        Verilen satırları yeni disk nesli olarak yazar. Sözlük byte sırasına göre
+        yeniden numaralanır ve artık geçmeyen terimler atılır. Kilit çağıranda.
+        """
+        df = np.bincount(tf.indices, minlength=tf.shape[1])
+        keep = np.flatnonzero(df)
+        order, blob, offsets = store.pack_vocabulary([self.vocabulary.term(int(j)) for j in keep])
+        remap = np.full(tf.shape[1], -1, dtype=np.int32)
+        remap[keep[order]] = np.arange(len(order), dtype=np.int32)
+        tf = sparse.csr_matrix((tf.data.astype(np.float32), remap[tf.indices], tf.indptr.astype(np.int64)),
+                               shape=(tf.shape[0], len(order)))
+        seg = Segment.from_tf(ids, tf)
+        df, term_len = df[keep[order]], self.term_len[keep[order]]
+        tfidf_idf, _ = compute_idf(df, term_len, seg.n_docs)
+        seg.set_norms(doc_norms(tf, tfidf_idf))
+        arrays = {
+            "chunk_ids": seg.chunk_ids, "doc_len": seg.doc_len, "norms": seg.norms,
+            "max_tf": seg.max_tf, "min_dl": seg.min_dl, "max_tfn": seg.max_tfn,
+            "tf_indptr": seg.tf_indptr, "tf_indices": seg.tf_indices, "tf_data": seg.tf_data,
+            "post_indptr": seg.post_indptr.astype(np.int64), "post_indices": seg.post_indices,
+            "post_data": seg.post_data,
+            "df": df, "term_len": term_len, "vocab_offsets": offsets,
+        }
+        meta = {
+            "n_docs": seg.n_docs, "n_terms": len(order),
+            "total_len": float(seg.doc_len.sum()),
+            "max_chunk_id": int(ids.max()) if len(ids) else 0,
+        }
+        return store.write_generation(self.tenant_id, arrays, blob, meta)
+
+    def _query_terms(self, question: str, stats: Stats) -> Tuple[List[int], Dict[int, float]]:
+        """BM25 için terim id'leri (tekrarlarıyla) ve L2 normlu TF-IDF sorgu ağırlıkları."""
+        term_ids: List[int] = []
+        counts: Dict[int, float] = {}
+        oov = 0.0
+        for t in tokenize(question or ""):
+            j = self.vocabulary.get(t)
+            known = j is not None and j < len(stats.df) and stats.df[j] > 0
+            if known:
+                term_ids.append(j)
+            if len(t) < 2:
+                continue
+            if not known:
+                # Korpusta olmayan terim sadece sorgu normuna katkı yapar
+                oov += 1.0
+                continue
+            counts[j] = counts.get(j, 0.0) + 1.0
+        if not counts:
+            return term_ids, {}
+        weights = {j: c * stats.tfidf_idf[j] for j, c in counts.items()}
+        oov_weight = oov * (np.log(1.0 + stats.n_live) + 1.0)
+        q_norm = np.sqrt(sum(w * w for w in weights.values()) + oov_weight ** 2)
+        # Doküman tarafındaki idf çarpanı da ağırlığa katlanır (posting'ler ham tf tutar)
+        return term_ids, {j: w * stats.tfidf_idf[j] / q_norm for j, w in weights.items()}
+
+    @staticmethod
+    def _contrib(seg: Segment, rows: np.ndarray, tf: np.ndarray, a: float, c: float, avgdl: float) -> np.ndarray:
+        # Tek terimin katkısı: a * tf/norm (TF-IDF kosinüs) + c * BM25 doygunluğu
+        tf = tf.astype(np.float64)
+        return a * tf / seg.norms[rows] + c * _saturation(tf, seg.doc_len[rows], avgdl)
+
+    def _probe(self, segments, offsets: np.ndarray, keys: np.ndarray, j: int, a: float, c: float,
+               avgdl: float) -> np.ndarray:
+        """Sadece verilen adayların (global satır anahtarları, sıralı) j terimindeki katkısı."""
+        out = np.zeros(len(keys))
+        bounds = np.searchsorted(keys, offsets)
+        for si, s in enumerate(segments):
+            lo_k, hi_k = bounds[si], bounds[si + 1]
+            if lo_k == hi_k or j >= s.n_terms:
+                continue
+            lo, hi = s.post_indptr[j], s.post_indptr[j + 1]
+            plist = s.post_indices[lo:hi]
+            rows = keys[lo_k:hi_k] - offsets[si]
+            pos = np.searchsorted(plist, rows)
+            hit = pos < len(plist)
+            hit[hit] = plist[pos[hit]] == rows[hit]
+            if hit.any():
+                r = rows[hit]
+                out[lo_k:hi_k][hit] = self._contrib(s, r, s.post_data[lo + pos[hit]], a, c, avgdl)
+        return out
+
+    def _evaluate(self, segments, stats: Stats, coefs: Dict[int, Tuple[float, float]],
+                  k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        MaxScore (term-at-a-time) top-k: terimler üst sınırlarına göre büyükten
+        küçüğe işlenir. Kalan terimlerin üst sınırları toplamı mevcut k'ıncı
+        skorun altına düşünce yeni aday eklenmez; sonraki posting listeleri
+        sadece mevcut adaylar için ikili aramayla yoklanır ve yetişemeyecek
+        adaylar atılır. Maliyet eşleşen posting sayısıyla büyür, korpusla değil.
+        Dönüş: (global satır anahtarları, skorlar, segment offset'leri).
+        """
+        offsets = np.cumsum([0] + [s.n_docs for s in segments])
+        avgdl = stats.avgdl or 1.0
+        plan = []
+        for j, (a, c) in coefs.items():
+            ub = 0.0
+            for s in segments:
+                if j < s.n_terms and s.post_indptr[j + 1] > s.post_indptr[j]:
+                    ub = max(ub, a * s.max_tfn[j] + max(c, 0.0) * _saturation(s.max_tf[j], s.min_dl[j], avgdl))
+            if ub > 0:
+                plan.append((ub, j, a, c))
+        plan.sort(reverse=True)
+        # Negatif katkı (ör. negatif ortalama IDF) kısmi skoru alt sınır olmaktan çıkarır: budama yok
+        prune = all(a >= 0 and c >= 0 for _, _, a, c in plan)
+        keys, acc = np.zeros(0, dtype=np.int64), np.zeros(0)
+        remaining = sum(p[0] for p in plan)
+        theta = -np.inf
+        essential = True
+        for ub, j, a, c in plan:
+            if essential and prune and len(acc) >= k and remaining <= theta:
+                essential = False
+            if essential:
+                new_keys, vals = [keys], [acc]
+                for si, s in enumerate(segments):
+                    if j >= s.n_terms:
+                        continue
+                    lo, hi = s.post_indptr[j], s.post_indptr[j + 1]
+                    rows = s.post_indices[lo:hi]
+                    live = s.live[rows]
+                    rows = rows[live]
+                    new_keys.append(rows + offsets[si])
+                    vals.append(self._contrib(s, rows, s.post_data[lo:hi][live], a, c, avgdl))
+                keys, inverse = np.unique(np.concatenate(new_keys), return_inverse=True)
+                acc = np.bincount(inverse, weights=np.concatenate(vals), minlength=len(keys))
+            else:
+                acc = acc + self._probe(segments, offsets, keys, j, a, c, avgdl)
+            remaining = max(remaining - ub, 0.0)
+            if prune and len(acc) >= k:
+                theta = np.partition(acc, len(acc) - k)[len(acc) - k]
+                if not essential:
+                    keep = acc + remaining >= theta
+                    keys, acc = keys[keep], acc[keep]
+        return keys, acc, offsets
+
+    def _coefs(self, question: str, stats: Stats) -> Tuple[Dict[int, float], Dict[int, float]]:
+        """Terim başına (TF-IDF ağırlığı, BM25 idf * sorgudaki tekrar sayısı)."""
+        term_ids, q_weights = self._query_terms(question, stats)
+        bm25: Dict[int, float] = {}
+        for j in term_ids:
+            bm25[j] = bm25.get(j, 0.0) + stats.bm25_idf[j]
+        return q_weights, bm25
+
+    def _max_bm25(self, segments, stats: Stats, bm25: Dict[int, float]) -> float:
+        # Hybrid skor BM25'i korpustaki en yüksek BM25'e böler: önce top-1 BM25
+        if not bm25:
+            return 0.0
+        _, acc, _ = self._evaluate(segments, stats, {j: (0.0, c) for j, c in bm25.items()}, 1)
+        return float(acc.max()) if len(acc) else 0.0
+
+    def _hybrid_coefs(self, q_weights, bm25, max_bm25: float) -> Dict[int, Tuple[float, float]]:
+        norm = BM25_WEIGHT / (max_bm25 + 1e-9)
+        return {j: (TFIDF_WEIGHT * q_weights.get(j, 0.0), norm * bm25.get(j, 0.0))
+                for j in set(q_weights) | set(bm25)}
+
+    def search_scored(self, question: str, n: int) -> List[Tuple[int, float]]:
+        segments, stats = self.segments, self.stats
+        n = min(n, stats.n_live)
+        if n <= 0:
+            return []
+        q_weights, bm25 = self._coefs(question, stats)
+        coefs = self._hybrid_coefs(q_weights, bm25, self._max_bm25(segments, stats, bm25))
+        keys, acc, offsets = self._evaluate(segments, stats, coefs, n)
+        top = np.argsort(-acc, kind="stable")[:n]
+        out = []
+        for key, score in zip(keys[top], acc[top]):
+            si = int(np.searchsorted(offsets, key, side="right")) - 1
+            out.append((int(segments[si].chunk_ids[key - offsets[si]]), float(score)))
+        return self._pad(segments, out, n)
+
+    @staticmethod
+    def _pad(segments, out: List[Tuple[int, float]], n: int) -> List[Tuple[int, float]]:
+        if len(out) < n:
+            # Eşleşmeyen chunk'lar skor 0 ile (en yeniden eskiye) tamamlanır; eskisi gibi
+            # soru hiçbir terimle eşleşmese de top_k sonuç döner
+            seen = {cid for cid, _ in out}
+            for s in reversed(segments):
+                for cid in s.chunk_ids[s.live][::-1]:
+                    if len(out) >= n:
+                        break
+                    if int(cid) not in seen:
+                        out.append((int(cid), 0.0))
+                if len(out) >= n:
+                    break
+        return out
+
+    def search_many(self, questions: Sequence[str], n: int,
+                    batch_size: int = 256) -> List[List[Tuple[int, float]]]:
+        """
+        Çok soruyu tek geçişte skorlar: sorular seyrek bir sorgu matrisine
+        (soru x terim) çevrilir, her segment için sorguların terimleriyle
+        sınırlı doküman ağırlık matrisleriyle çarpılır. Sonuç search_scored ile
+        aynıdır; sorgu başına Python döngüsü yerine tek sparse matmul.
+        """
+        segments, stats = self.segments, self.stats
+        n = min(n, stats.n_live)
+        if n <= 0:
+            return [[] for _ in questions]
+        results: List[List[Tuple[int, float]]] = []
+        for start in range(0, len(questions), batch_size):
+            results.extend(self._search_batch(segments, stats, questions[start:start + batch_size], n))
+        return results
+
+    def _search_batch(self, segments, stats: Stats, questions: Sequence[str], n: int):
+        coefs = [self._coefs(q, stats) for q in questions]
+        cols = sorted({j for qw, bm in coefs for j in (*qw, *bm)})
+        col_of = {j: c for c, j in enumerate(cols)}
+        # Sorgu matrisleri: TF-IDF ağırlıkları ve BM25 idf * tekrar sayısı
+        q_rows, q_cols, q_tfidf, q_bm25 = [], [], [], []
+        for i, (qw, bm) in enumerate(coefs):
+            for j in set(qw) | set(bm):
+                q_rows.append(i)
+                q_cols.append(col_of[j])
+                q_tfidf.append(qw.get(j, 0.0))
+                q_bm25.append(bm.get(j, 0.0))
+        shape = (len(questions), len(cols))
+        Q_tfidf = sparse.csr_matrix((q_tfidf, (q_rows, q_cols)), shape=shape)
+        Q_bm25 = sparse.csr_matrix((q_bm25, (q_rows, q_cols)), shape=shape)
+
+        avgdl = stats.avgdl or 1.0
+        tfidf_parts, bm25_parts, ids = [], [], []
+        for s in segments:
+            present = np.asarray([j for j in cols if j < s.n_terms], dtype=np.int64)
+            D = sparse.csc_matrix((s.post_data, s.post_indices, s.post_indptr), shape=(s.n_docs, s.n_terms))
+            D = D[:, present].tocsc()
+            if len(present) < len(cols):
+                # Segmentte olmayan (sonradan eklenmiş) terimler boş sütun
+                D = sparse.hstack([D, sparse.csc_matrix((s.n_docs, len(cols) - len(present)))]).tocsc()
+            # Silinen satırlar skorlanmaz
+            D.data[~s.live[D.indices]] = 0
+            D.eliminate_zeros()
+            rows, tf = D.indices, D.data.astype(np.float64)
+            D_tfidf = sparse.csc_matrix((tf / s.norms[rows], D.indices, D.indptr), shape=D.shape)
+            D_bm25 = sparse.csc_matrix((_saturation(tf, s.doc_len[rows], avgdl), D.indices, D.indptr),
+                                       shape=D.shape)
+            tfidf_parts.append((Q_tfidf @ D_tfidf.T).tocsr())
+            bm25_parts.append((Q_bm25 @ D_bm25.T).tocsr())
+            ids.append(s.chunk_ids)
+        tfidf = sparse.hstack(tfidf_parts).tocsr()
+        bm25 = sparse.hstack(bm25_parts).tocsr()
+        ids = np.concatenate(ids)
+
+        out = []
+        for i in range(len(questions)):
+            t_lo, t_hi = tfidf.indptr[i], tfidf.indptr[i + 1]
+            b_lo, b_hi = bm25.indptr[i], bm25.indptr[i + 1]
+            b_idx, b_val = bm25.indices[b_lo:b_hi], bm25.data[b_lo:b_hi]
+            max_bm25 = float(b_val.max()) if len(b_val) else 0.0
+            keys, inverse = np.unique(np.concatenate([tfidf.indices[t_lo:t_hi], b_idx]), return_inverse=True)
+            vals = np.concatenate([TFIDF_WEIGHT * tfidf.data[t_lo:t_hi],
+                                   BM25_WEIGHT / (max_bm25 + 1e-9) * b_val])
+            acc = np.bincount(inverse, weights=vals, minlength=len(keys))
+            top = np.argsort(-acc, kind="stable")[:n]
+            out.append(self._pad(segments, [(int(ids[k]), float(v)) for k, v in zip(keys[top], acc[top])], n))
+        return out
+
+    def search(self, question: str, n: int) -> List[int]:
+        return [cid for cid, _ in self.search_scored(question, n)]
+
+    def score(self, question: str, chunk_ids: Sequence[int]) -> np.ndarray:
+        """Verilen chunk'ların hybrid skoru (indekste olmayan/silinen: -inf)."""
+        segments, stats = self.segments, self.stats
+        want = np.asarray(chunk_ids, dtype=np.int64)
+        out = np.full(len(want), -np.inf)
+        if not stats.n_live or not len(want):
+            return out
+        offsets = np.cumsum([0] + [s.n_docs for s in segments])
+        keys = np.full(len(want), -1, dtype=np.int64)
+        for si, s in enumerate(segments):
+            if not s.n_docs:
+                continue
+            pos = np.clip(np.searchsorted(s.chunk_ids, want), 0, s.n_docs - 1)
+            hit = (s.chunk_ids[pos] == want) & s.live[pos]
+            keys[hit] = pos[hit] + offsets[si]
+        found = keys >= 0
+        order = np.argsort(keys[found])
+        sorted_keys = keys[found][order]
+        q_weights, bm25 = self._coefs(question, stats)
+        coefs = self._hybrid_coefs(q_weights, bm25, self._max_bm25(segments, stats, bm25))
+        acc = np.zeros(len(sorted_keys))
+        for j, (a, c) in coefs.items():
+            acc += self._probe(segments, offsets, sorted_keys, j, a, c, stats.avgdl or 1.0)
+        scores = np.empty(len(sorted_keys))
+        scores[order] = acc
+        out[found] = scores
+        return out
+
+
+_indexes: Dict[int, TenantIndex] = {}
+# Global kilit sadece tenant kilidini bulmak için kısa tutulur; kurulum tenant kilidinde
+_lock = threading.Lock()
+_tenant_locks: Dict[int, threading.Lock] = {}
+_compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-compact")
+
+
+def _fingerprint(tenant) -> Tuple[int, int]:
+    # Sadece soğuk başlangıçta / yeni nesil açılınca ya da korpus nesli değişince çalışır
+    agg = Chunk.objects.filter(tenant=tenant).aggregate(n=Count("id"), last=Max("id"))
+    return agg["n"], agg["last"] or 0
+
+
+def build_index(tenant) -> TenantIndex:
+    """Tenant'ın indeksini diskten açar; disk nesli yoksa DB'den kurup yazar."""
+    manifest = store.read_manifest(tenant.id)
+    if manifest is None:
+        # Aynı anda başlayan worker'lardan sadece biri kurar, diğerleri bekleyip açar
+        with store.tenant_lock(tenant.id):
+            manifest = store.read_manifest(tenant.id)
+            if manifest is None:
+                rows = iter_texts(Chunk.objects.filter(tenant=tenant).order_by("id")
+                                  .values_list("id", "text_z", "text_dict_id").iterator(chunk_size=2000))
+                tmp = TenantIndex.build(rows)
+                tmp.tenant_id = tenant.id
+                seg = tmp.segments[0] if tmp.segments else Segment.from_tf(
+                    np.zeros(0, dtype=np.int64), sparse.csr_matrix((0, 0), dtype=np.float32))
+                manifest = tmp.save(seg.chunk_ids, seg.tf_matrix(len(tmp.df)))
+                log.info("Index built tenant=%s docs=%d terms=%d", tenant.id, seg.n_docs, manifest["n_terms"])
+    try:
+        return TenantIndex.open(tenant.id, manifest)
+    except FileNotFoundError:
+        # Okunan nesil bu arada iki kez compaction'la silindi: güncel manifest'le tekrar
+        return TenantIndex.open(tenant.id, store.read_manifest(tenant.id) or manifest)
+
+
+def _sync(tenant, idx: TenantIndex, count: int, last: int) -> None:
+    # Başka worker'ların değişikliklerini DB'den yakala: yeni id'ler delta,
+    # kaybolan id'ler tombstone olur. Yerel upload/delete bunu zaten önceden yapar.
+    if last > idx.max_chunk_id:
+        idx.add(iter_texts(Chunk.objects.filter(tenant=tenant, id__gt=idx.max_chunk_id)
+                           .values_list("id", "text_z", "text_dict_id")))
+    if count != idx.n_live:
+        db_ids = np.fromiter(Chunk.objects.filter(tenant=tenant).values_list("id", flat=True), dtype=np.int64)
+        live = idx.live_ids()
+        idx.delete(np.setdiff1d(live, db_ids))
+        missing = np.setdiff1d(db_ids, live)
+        if len(missing):
+            idx.add(iter_texts(Chunk.objects.filter(tenant=tenant, id__in=missing.tolist())
+                               .values_list("id", "text_z", "text_dict_id")))
+
+
+def get_index(tenant, version: Optional[int] = None) -> Optional[TenantIndex]:
+    """
+    Tenant indeksi. Upload/silme korpus neslini artırır; nesil ve disk nesli
+    değişmediyse indeks DB'ye sorulmadan döner. version: çağıranın zaten okuduğu
+    corpus_version (aggregate'ten önce okunmalı ki araya giren değişiklik kaçmasın).
+    """
+    if version is None:
+        version = corpus_version(tenant.id)
+    manifest = store.read_manifest(tenant.id)
+    # Sıcak yol kilitsiz ve sorgusuz: hazır indeks güncel disk neslinde ve korpus neslinde
+    idx = _indexes.get(tenant.id)
+    fresh = idx is not None and manifest is not None and idx.generation == manifest["generation"]
+    if fresh and idx.corpus_version == version:
+        return idx
+    count, last = _fingerprint(tenant)
+    if not count:
+        _indexes.pop(tenant.id, None)
+        return None
+    if not fresh:
+        with _lock:
+            tenant_lock = _tenant_locks.setdefault(tenant.id, threading.Lock())
+        # Kurulum (chunk taraması + flock) sadece bu tenant'ın sorgularını bekletir
+        with tenant_lock:
+            idx = _indexes.get(tenant.id)
+            manifest = store.read_manifest(tenant.id)
+            # Başka bir worker yeni nesil yazdıysa (compaction) onu aç
+            if idx is None or manifest is None or idx.generation != manifest["generation"]:
+                idx = _indexes[tenant.id] = build_index(tenant)
+    _sync(tenant, idx, count, last)
+    idx.corpus_version = version
+    return idx
+
+
+def chunks_added(tenant_id: int, rows: Iterable[Tuple[int, str]]) -> None:
+    """Upload sonrası: bu worker'daki indekse delta segment ekle."""
+    idx = _indexes.get(tenant_id)
+    if idx is not None:
+        idx.add(rows)
+
+
+def chunks_deleted(tenant_id: int, chunk_ids: Iterable[int]) -> None:
+    """Silme sonrası: bu worker'daki indekste chunk'ları tombstone'la."""
+    idx = _indexes.get(tenant_id)
+    if idx is not None:
+        idx.delete(chunk_ids)
+
+
+def invalidate(tenant_id: int) -> None:
+    _indexes.pop(tenant_id, None)
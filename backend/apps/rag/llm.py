@@ -1,8 +1,13 @@
 from __future__ import annotations
-import logging
-from typing import List, Dict
+import json, logging, re, threading
+from typing import Iterator, List, Dict, Optional, Tuple
 from django.conf import settings
+from django.utils.module_loading import import_string
 import google.generativeai as genai
+from google.generativeai import client as genai_client
+
+from .quotes import SENT_SPLIT
+from .tokens import count_tokens, token_offsets
 
 log = logging.getLogger("docuchat.llm")
 
@@ -12,49 +17,158 @@ SYSTEM_PROMPT = (
     "Prefer verbatim facts (versions, dates, numbers). Be concise. Do not invent anything.\n"
 )
 
-def _configure_gemini():
-    api_key = getattr(settings, "GEMINI_API_KEY", "")
-    if not api_key:
-        raise RuntimeError("GEMINI_API_KEY is not set")
-    genai.configure(api_key=api_key)
-    model_name = getattr(settings, "GEMINI_MODEL", "models/gemini-2.5-flash")
-    generation_config = {
+# Süreç genelinde tek istemci kaydı: genai.configure her çağrıldığında SDK'nın
+# istemci önbelleğini (ve gRPC bağlantısını) sıfırlar; bu yüzden sadece API
+# anahtarı değişince çağrılır. Model nesneleri (model, generation config)
+# başına bir kez kurulur ve thread'ler/async görevler arasında paylaşılır.
+_models: Dict[Tuple, "genai.GenerativeModel"] = {}
+_models_lock = threading.Lock()
+_configured_key: Optional[str] = None
+
+
+def _generation_config() -> Dict:
+    return {
         # daha deterministik
         "temperature": float(getattr(settings, "GEMINI_TEMPERATURE", 0.1)),
         "max_output_tokens": int(getattr(settings, "GEMINI_MAX_TOKENS", 1536)),
     }
-    return genai.GenerativeModel(model_name, generation_config=generation_config)
 
-def _build_context(cites: List[Dict], char_limit: int = 16000) -> str:
+
+def gemini_model(model_name: Optional[str] = None, generation_config: Optional[Dict] = None) -> "genai.GenerativeModel":
+    """
+    Kayıttaki GenerativeModel; yoksa kurulur. Tüm modeller SDK'nın paylaşılan
+    (keep-alive) gRPC istemcisini kullanır. Kilit sadece kurulumda tutulur.
+    """
+    global _configured_key
+    api_key = getattr(settings, "GEMINI_API_KEY", "")
+    if not api_key:
+        raise RuntimeError("GEMINI_API_KEY is not set")
+    model_name = model_name or getattr(settings, "GEMINI_MODEL", "models/gemini-2.5-flash")
+    config = generation_config if generation_config is not None else _generation_config()
+    key = (api_key, model_name, tuple(sorted(config.items())))
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _models_lock:
+        if _configured_key != api_key:
+            genai.configure(api_key=api_key)
+            _configured_key = api_key
+            _models.clear()
+            # Paylaşılan istemci kilit altında bir kez kurulur (SDK tembel kurar)
+            genai_client.get_default_generative_client()
+        model = _models.get(key)
+        if model is None:
+            model = _models[key] = genai.GenerativeModel(model_name, generation_config=config)
+        return model
+
+def _join_overlap(a: str, b: str) -> str:
+    """Ardışık iki chunk: b'nin a'nın sonuyla örtüşen başı bir kez yazılır."""
+    probe = b[:64]
+    if probe:
+        p = a.find(probe, max(0, len(a) - len(b)))
+        while p >= 0:
+            if b.startswith(a[p:]):
+                return a + b[len(a) - p:]
+            p = a.find(probe, p + 1)
+    return f"{a} {b}"
+
+
+def _merge_cites(cites: List[Dict]) -> List[Dict]:
     """
-    cites beklenen alanlar: doc, page, chunk_id, text/snippet, quote
-    quote -> önce; ardından kısa snippet (varsa)
+    Aynı dokümandan ardışık (index'i bitişik) chunk'lar tek parçada birleşir;
+    örtüşme metni bir kez gider. Parçalar en iyi üyelerinin sırasıyla döner.
+    index/text olmayan citation'lar (eski cache kayıtları) tek başına kalır.
     """
+    groups: List[List[Tuple[int, Dict]]] = []
+    by_doc: Dict = {}
+    for rank, c in enumerate(cites):
+        if c.get("index") is None or not c.get("text"):
+            groups.append([(rank, c)])
+        else:
+            by_doc.setdefault(c.get("doc_id"), []).append((rank, c))
+    for members in by_doc.values():
+        members.sort(key=lambda m: m[1]["index"])
+        run = [members[0]]
+        for m in members[1:]:
+            if m[1]["index"] <= run[-1][1]["index"] + 1:
+                run.append(m)
+            else:
+                groups.append(run)
+                run = [m]
+        groups.append(run)
+    groups.sort(key=lambda g: min(r for r, _ in g))
+
+    merged = []
+    for g in groups:
+        cs = [c for _, c in g]
+        text = ""
+        for c in cs:
+            if c.get("text"):
+                text = _join_overlap(text, c["text"].strip()) if text else c["text"].strip()
+        pages = [c.get("page") for c in cs if c.get("page") is not None]
+        merged.append({
+            "doc": cs[0].get("doc", "doc"),
+            "page": (f"{min(pages)}-{max(pages)}" if min(pages) != max(pages) else pages[0]) if pages else "-",
+            "chunk_ids": ",".join(str(c.get("chunk_id", "-")) for c in cs),
+            "quotes": list(dict.fromkeys((c.get("quote") or "").strip() for c in cs if (c.get("quote") or "").strip())),
+            "text": text or (cs[0].get("snippet") or "").strip(),
+        })
+    return merged
+
+
+def _truncate_tokens(text: str, budget: int) -> str:
+    """En fazla `budget` token; mümkünse son cümle sonunda kesilir."""
+    offs = token_offsets(text)
+    if len(offs) <= budget:
+        return text
+    if budget <= 0:
+        return ""
+    cut = offs[budget]
+    ends = [m.start() for m in SENT_SPLIT.finditer(text, offs[budget // 2], cut)]
+    return text[: ends[-1] if ends else cut].rstrip()
+
+
+def _context_budget() -> int:
+    return int(getattr(settings, "CONTEXT_TOKENS", 3000))
+
+
+def _build_context(cites: List[Dict], token_budget: Optional[int] = None) -> str:
+    """
+    cites beklenen alanlar: doc, page, chunk_id, quote, text (yoksa snippet), doc_id, index.
+    Bitişik chunk'lar birleştirilir; her parça quote(lar) önce, ardından metin.
+    Toplam context token_budget (CONTEXT_TOKENS) token'ı aşmaz; bütçeyi aşan
+    parçanın metni token/cümle sınırında kısaltılır ve paketleme biter.
+    """
+    budget = _context_budget() if token_budget is None else token_budget
+    sep = "\n---\n"
+    sep_tokens = count_tokens(sep)
     parts, used = [], 0
-    for c in cites:
-        head = f"[DOC:{c.get('doc','doc')} | PAGE:{c.get('page','-')} | CHUNK:{c.get('chunk_id','-')}]"
-        quote = (c.get("quote") or "").strip()
-        snippet = (c.get("snippet") or c.get("text") or "").strip()
-        body_lines = []
-        if quote:
-            body_lines.append(f"QUOTE: \"{quote}\"")
-        if snippet and snippet != quote:
-            body_lines.append(f"SNIPPET: {snippet}")
-        if not body_lines:
+    for m in _merge_cites(cites):
+        head = f"[DOC:{m['doc']} | PAGE:{m['page']} | CHUNK:{m['chunk_ids']}]"
+        lines = [f"QUOTE: \"{q}\"" for q in m["quotes"]]
+        text = m["text"]
+        if text and not (len(m["quotes"]) == 1 and text == m["quotes"][0]):
+            lines.append(f"TEXT: {text}")
+        if not lines:
+            continue
+        seg = f"{head}\n" + "\n".join(lines) + "\n"
+        cost = count_tokens(seg) + (sep_tokens if parts else 0)
+        if used + cost <= budget:
+            parts.append(seg)
+            used += cost
             continue
-        seg = f"{head}\n" + "\n".join(body_lines) + "\n"
-        seg_len = len(seg)
-        if used + seg_len > char_limit:
-            seg = seg[: max(0, char_limit - used)]
-            seg_len = len(seg)
-        parts.append(seg); used += seg_len
-        if used >= char_limit:
-            break
-    return "\n---\n".join(parts) if parts else "(no context)"
-
-def gemini_answer(question: str, cites: List[Dict]) -> str:
+        # Sığmayan parça: başlık + quote'lar sığıyorsa metin kalan bütçeye kısaltılır
+        fixed = f"{head}\n" + "".join(f"{q}\n" for q in lines if not q.startswith("TEXT: ")) + "TEXT: \n"
+        left = budget - used - count_tokens(fixed) - (sep_tokens if parts else 0)
+        short = _truncate_tokens(text, left) if text else ""
+        if left > 0 and short:
+            parts.append(fixed[:-1] + short + "\n")
+        break
+    return sep.join(parts) if parts else "(no context)"
+
+def _prompt(question: str, cites: List[Dict]) -> str:
     ctx = _build_context(cites)
-    prompt = (
+    return (
         f"{SYSTEM_PROMPT}\n\n"
         f"Context:\n{ctx}\n\n"
         f"Question:\n{question}\n\n"
@@ -63,36 +177,226 @@ def gemini_answer(question: str, cites: List[Dict]) -> str:
         "2) Then the exact supporting sentence from Context in quotes (if any).\n"
         "If no support exists in Context, respond exactly: I don't know."
     )
-    model = _configure_gemini()
-    try:
-        resp = model.generate_content(prompt)
-        text = (getattr(resp, "text", "") or "").strip()
+
+_WORDS = re.compile(r"\s*\S+")
+
+
+class LLMProvider:
+    """
+    Sağlayıcı arayüzü. Alt sınıflar _generate (tam cevap) ve _stream (metin
+    parçaları) yazar; ikisi de hatada exception yükseltir. answer/stream bu
+    hataları "LLM error (<label>): ..." metnine çevirir; gateway ise generate'i
+    doğrudan çağırıp hataları sayar. remote=False sağlayıcılar gateway'den geçmez.
+    """
+    name = "base"
+    label = "LLM"
+    remote = True
+
+    @property
+    def model(self) -> str:
+        return self.name
+
+    def generate(self, question: str, cites: List[Dict], timeout: Optional[float] = None) -> str:
+        text = (self._generate(_prompt(question, cites), timeout) or "").strip()
         return text if text else "I don't know."
-    except Exception as e:
-        log.exception("Gemini error")
-        return f"LLM error (Gemini): {e}"
 
-def llm_healthcheck() -> dict:
-    try:
-        model = _configure_gemini()
-        resp = model.generate_content("Respond with a single word: ok")
-        ok = bool((getattr(resp, "text", "") or "").strip())
-        return {
-            "provider": "gemini",
-            "model": getattr(settings, "GEMINI_MODEL", "models/gemini-2.5-flash"),
-            "api_key_set": True,
-            "ok": ok,
-            "error": None if ok else "Empty response from model",
-        }
-    except Exception as e:
+    def answer(self, question: str, cites: List[Dict]) -> str:
+        try:
+            return self.generate(question, cites)
+        except Exception as e:
+            log.exception("%s error", self.label)
+            return f"LLM error ({self.label}): {e}"
+
+    def stream(self, question: str, cites: List[Dict]) -> Iterator[str]:
+        """
+        Metin parçaları geldikçe döner. Hata (ilk parçadan önce ya da akış
+        ortasında) tek bir "LLM error (<label>): ..." parçası olarak akışı bitirir.
+        """
+        sent = False
+        try:
+            for text in self.iter_stream(question, cites):
+                sent = True
+                yield text
+        except Exception as e:
+            log.exception("%s stream error", self.label)
+            error = f"LLM error ({self.label}): {e}"
+            yield "\n" + error if sent else error
+            return
+        if not sent:
+            yield "I don't know."
+
+    def iter_stream(self, question: str, cites: List[Dict]) -> Iterator[str]:
+        """stream'in ham hali: boş olmayan parçalar; hata exception olarak yükselir (gateway)."""
+        for text in self._stream(_prompt(question, cites)):
+            if text:
+                yield text
+
+    def healthcheck(self) -> dict:
+        info = {"provider": self.name, "model": self.model}
+        try:
+            ok = bool((self._generate("Respond with a single word: ok", None) or "").strip())
+            return {**info, "ok": ok, "error": None if ok else "Empty response from model"}
+        except Exception as e:
+            return {**info, "ok": False, "error": str(e)}
+
+    def _generate(self, prompt: str, timeout: Optional[float]) -> str:
+        raise NotImplementedError
+
+    def _stream(self, prompt: str) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+    label = "Gemini"
+
+    @property
+    def model(self) -> str:
+        return getattr(settings, "GEMINI_MODEL", "models/gemini-2.5-flash")
+
+    def _generate(self, prompt: str, timeout: Optional[float]) -> str:
+        resp = gemini_model().generate_content(prompt, request_options={"timeout": timeout} if timeout else None)
+        return getattr(resp, "text", "") or ""
+
+    def _stream(self, prompt: str) -> Iterator[str]:
+        timeout = float(getattr(settings, "LLM_DEADLINE", 20))
+        for part in gemini_model().generate_content(prompt, stream=True, request_options={"timeout": timeout}):
+            yield getattr(part, "text", "") or ""
+
+    def healthcheck(self) -> dict:
+        return {**super().healthcheck(), "api_key_set": bool(getattr(settings, "GEMINI_API_KEY", ""))}
+
+
+class HTTPProvider(LLMProvider):
+    """
+    Akışlı completion API'si konuşan HTTP sağlayıcı (LLM_HTTP_URL); yerel
+    stand-in sunucusuyla (manage.py llm_standin) ağ olmadan yük testi için.
+    POST /v1/completions {"prompt", "stream", ...} → {"text"} ya da SSE
+    "data: {"text": ...}" satırları ve "data: [DONE]".
+    """
+    name = "http"
+    label = "HTTP"
+
+    def __init__(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        # Keep-alive bağlantıları süreç boyunca paylaşılır (gateway slotları kadar)
+        self._session = requests.Session()
+        pool = max(10, 2 * int(getattr(settings, "LLM_MAX_INFLIGHT", 16)))
+        self._session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool))
+        self._session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool))
+
+    @property
+    def model(self) -> str:
+        return getattr(settings, "LLM_HTTP_MODEL", "standin")
+
+    def _url(self) -> str:
+        return getattr(settings, "LLM_HTTP_URL", "http://localhost:8090").rstrip("/") + "/v1/completions"
+
+    def _body(self, prompt: str, stream: bool) -> Dict:
         return {
-            "provider": "gemini",
-            "model": getattr(settings, "GEMINI_MODEL", "models/gemini-2.5-flash"),
-            "api_key_set": bool(getattr(settings, "GEMINI_API_KEY", "")),
-            "ok": False,
-            "error": str(e),
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "temperature": float(getattr(settings, "GEMINI_TEMPERATURE", 0.1)),
+            "max_tokens": int(getattr(settings, "GEMINI_MAX_TOKENS", 1536)),
         }
 
+    def _generate(self, prompt: str, timeout: Optional[float]) -> str:
+        resp = self._session.post(self._url(), json=self._body(prompt, False),
+                                  timeout=timeout or float(getattr(settings, "LLM_DEADLINE", 20)))
+        resp.raise_for_status()
+        return resp.json().get("text", "")
+
+    def _stream(self, prompt: str) -> Iterator[str]:
+        timeout = float(getattr(settings, "LLM_DEADLINE", 20))
+        with self._session.post(self._url(), json=self._body(prompt, True), stream=True, timeout=timeout) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data: "):
+                    continue
+                data = line[6:]
+                if data == "[DONE]":
+                    return
+                event = json.loads(data)
+                if event.get("error"):
+                    raise RuntimeError(event["error"])
+                yield event.get("text", "")
+        raise RuntimeError("Stream ended without [DONE]")
+
+
+class FakeProvider(LLMProvider):
+    """Extractive cevap (ilk citation'ın quote'u); ağ yok, gateway'den geçmez."""
+    name = "fake"
+    label = "Fake"
+    remote = False
+
+    @property
+    def model(self) -> str:
+        return "extractive"
+
+    def generate(self, question: str, cites: List[Dict], timeout: Optional[float] = None) -> str:
+        return fake_llm_answer(question, cites)
+
+    def iter_stream(self, question: str, cites: List[Dict]) -> Iterator[str]:
+        # Kelime kelime (boşluklar korunarak)
+        yield from _WORDS.findall(fake_llm_answer(question, cites))
+
+    def stream(self, question: str, cites: List[Dict]) -> Iterator[str]:
+        return self.iter_stream(question, cites)
+
+    def healthcheck(self) -> dict:
+        return {"provider": self.name, "model": self.model, "ok": True, "error": None}
+
+
+# LLM_PROVIDER değerleri; başka sağlayıcılar dotted path ile verilir
+# (ör. LLM_PROVIDER=myapp.llm.MyProvider, LLMProvider alt sınıfı)
+PROVIDERS: Dict[str, type] = {
+    "gemini": GeminiProvider,
+    "http": HTTPProvider,
+    "fake": FakeProvider,
+}
+_providers: Dict[str, LLMProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def provider_name() -> str:
+    name = getattr(settings, "LLM_PROVIDER", "gemini") or "fake"
+    # Anahtar yoksa Gemini yerine extractive cevap
+    if name == "gemini" and not getattr(settings, "GEMINI_API_KEY", ""):
+        return "fake"
+    return name
+
+
+def get_provider(name: Optional[str] = None) -> LLMProvider:
+    """Süreç başına tek sağlayıcı nesnesi (bağlantı havuzlarıyla birlikte paylaşılır)."""
+    name = name or provider_name()
+    provider = _providers.get(name)
+    if provider is not None:
+        return provider
+    with _providers_lock:
+        provider = _providers.get(name)
+        if provider is None:
+            cls = PROVIDERS.get(name)
+            if cls is None:
+                try:
+                    cls = import_string(name)
+                except ImportError as e:
+                    raise ValueError(f"Unknown LLM_PROVIDER: {name}") from e
+            provider = _providers[name] = cls()
+        return provider
+
+
+def llm_healthcheck() -> dict:
+    # Yapılandırılan sağlayıcı denetlenir (anahtarsız Gemini fake'e düşmeden hata verir)
+    try:
+        provider = get_provider(getattr(settings, "LLM_PROVIDER", "gemini") or "fake")
+    except ValueError as e:
+        return {"provider": getattr(settings, "LLM_PROVIDER", ""), "ok": False, "error": str(e)}
+    return provider.healthcheck()
+
+
 def fake_llm_answer(question: str, cites: List[Dict]) -> str:
     if cites:
         lead = cites[0]
@@ -0,0 +1,56 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from apps.rag import bench
+
+
+class Command(BaseCommand):
+    help = ("Benchmark retrieval on synthetic tenants (bench_<size>): index build/open time, "
+            "p50/p95/p99 query latency with and without cache, peak RSS. Each size runs in a fresh "
+            "process so peak RSS is per size. Writes JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000,1000000",
+                            help="Comma separated chunk counts (default: 1k,10k,100k,1M)")
+        parser.add_argument("--backends", default="index,postgres",
+                            help=f"Comma separated, any of: {', '.join(bench.BACKENDS)}")
+        parser.add_argument("--queries", type=int, default=200, help="Questions per backend")
+        parser.add_argument("--top-k", type=int, default=4)
+        parser.add_argument("--output", help="JSON output path (default: stdout)")
+        parser.add_argument("--compare", help="Baseline JSON; report p95 regressions against it")
+        parser.add_argument("--threshold", type=float, default=0.10, help="Regression threshold for --compare")
+        parser.add_argument("--drop", action="store_true", help="Delete the synthetic tenants afterwards")
+        parser.add_argument("--in-process", action="store_true",
+                            help="Measure all sizes in this process (peak RSS is then cumulative)")
+
+    def handle(self, *args, **opts):
+        try:
+            sizes = [int(s) for s in opts["sizes"].split(",") if s.strip()]
+        except ValueError:
+            raise CommandError("--sizes must be comma separated integers")
+        backends = [b.strip() for b in opts["backends"].split(",") if b.strip()]
+        unknown = [b for b in backends if b not in bench.BACKENDS]
+        if unknown:
+            raise CommandError(f"Unknown backend(s): {', '.join(unknown)}")
+
+        try:
+            report = bench.run(sizes, backends, n_queries=opts["queries"], top_k=opts["top_k"],
+                               keep=not opts["drop"], isolate=not opts["in_process"],
+                               log_fn=lambda m: self.stderr.write(m))
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        data = json.dumps(report, indent=2)
+        if opts["output"]:
+            with open(opts["output"], "w") as fh:
+                fh.write(data + "\n")
+            self.stderr.write(self.style.SUCCESS(f"Wrote {opts['output']}"))
+        else:
+            self.stdout.write(data)
+
+        if opts["compare"]:
+            with open(opts["compare"]) as fh:
+                regressions = bench.compare(json.load(fh), report, opts["threshold"])
+            for line in regressions:
+                self.stderr.write(self.style.WARNING(line))
+            if regressions:
+                raise CommandError(f"{len(regressions)} p95 regression(s) against {opts['compare']}")
+            self.stderr.write(self.style.SUCCESS("No p95 regressions"))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.uploads.models import Tenant
+from apps.rag.embeddings import get_model, train, embed_missing
+
+
+class Command(BaseCommand):
+    help = "Train the per-tenant LSA embedding model and fill Chunk.embedding for pgvector search."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tenant", help="Tenant name (default: all tenants)")
+        parser.add_argument("--retrain", action="store_true", help="Retrain the model and re-embed every chunk")
+
+    def handle(self, *args, **opts):
+        qs = Tenant.objects.all()
+        if opts["tenant"]:
+            qs = qs.filter(name=opts["tenant"])
+            if not qs.exists():
+                raise CommandError(f"Tenant '{opts['tenant']}' not found")
+        for t in qs:
+            model = None if opts["retrain"] else get_model(t.id)
+            if model is None:
+                train(t.id, reembed=opts["retrain"])
+                self.stdout.write(self.style.SUCCESS(f"Trained embedding model for tenant '{t.name}'"))
+            else:
+                n = embed_missing(t.id, model)
+                self.stdout.write(self.style.SUCCESS(f"Embedded {n} chunks for tenant '{t.name}'"))
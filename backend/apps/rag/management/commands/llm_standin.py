@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.rag import standin
+
+
+class Command(BaseCommand):
+    help = ("Run the local LLM stand-in server (streaming completion API with injected latency, "
+            "token rate and errors). Point the backend at it with LLM_PROVIDER=http LLM_HTTP_URL=...")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8090)
+        parser.add_argument("--ttft", default="lognormal:0.4,0.5",
+                            help="Time to first token in seconds: fixed:S | uniform:A,B | normal:MU,SIGMA | "
+                                 "lognormal:MEDIAN,SIGMA | exp:MEAN")
+        parser.add_argument("--token-rate", type=float, default=40.0, help="Tokens per second (0 = instant)")
+        parser.add_argument("--token-jitter", type=float, default=0.3, help="Relative jitter of the token gap")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with 500")
+        parser.add_argument("--overload-rate", type=float, default=0.0, help="Share of requests failing with 429")
+        parser.add_argument("--stream-error-rate", type=float, default=0.0,
+                            help="Share of streams cut off mid-answer")
+        parser.add_argument("--min-tokens", type=int, default=0, help="Pad answers to at least this many tokens")
+        parser.add_argument("--seed", type=int, help="Seed for reproducible runs")
+
+    def handle(self, *args, **opts):
+        try:
+            ttft = standin.parse_distribution(opts["ttft"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        config = standin.StandinConfig(
+            ttft=ttft,
+            token_rate=opts["token_rate"],
+            token_jitter=opts["token_jitter"],
+            error_rate=opts["error_rate"],
+            overload_rate=opts["overload_rate"],
+            stream_error_rate=opts["stream_error_rate"],
+            min_tokens=opts["min_tokens"],
+            seed=opts["seed"],
+        )
+        server = standin.StandinServer((opts["host"], opts["port"]), config)
+        self.stderr.write(self.style.SUCCESS(f"LLM stand-in listening on http://{opts['host']}:{opts['port']}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,125 @@
+from __future__ import annotations
+import re
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Quote seçimi: chunk cümlelere bölünür, her cümle soruyla anahtar kelime
+# örtüşmesi + sorudan bağımsız özelliklerle (tarih/sürüm/yıl, uzunluk cezası)
+# skorlanır. Sorudan bağımsız kısım upload sırasında bir kez hesaplanıp
+# Chunk.sentences'ta saklanır (bkz. sentence_features).
+FEATURE_LEN = 6
+
+# Cümle sınırı (quote seçimi, chunk sonları ve context kırpma aynı deseni kullanır)
+SENT_SPLIT = re.compile(r'(?<=[\.!?])\s+|\n+')
+_DATE = re.compile(r'\b\d{1,2}\.\d{1,2}\.\d{4}\b')
+_YEAR = re.compile(r'\b20\d{2}\b')
+_VERSION = re.compile(r'\\b\\d+(?:\\.\\d+){1,3}\\b')  # 3.11.x gibi
+_WORD = re.compile(r'\w+')
+
+
+def sentence_spans(text: str) -> List[tuple]:
+    """Boş olmayan cümlelerin (başlangıç, bitiş) konumları; baş/son boşluklar hariç."""
+    spans = []
+    text = text or ""
+
+    def add(a: int, b: int) -> None:
+        s = text[a:b]
+        stripped = s.strip()
+        if stripped:
+            lead = len(s) - len(s.lstrip())
+            spans.append((a + lead, a + lead + len(stripped)))
+
+    pos = 0
+    for m in SENT_SPLIT.finditer(text):
+        add(pos, m.start())
+        pos = m.end()
+    add(pos, len(text))
+    return spans
+
+
+def sentence_features(text: str) -> List[list]:
+    """
+    Upload sırasında (Chunk.sentences): cümle başına
+    [başlangıç, bitiş, tarih, yıl, sürüm, uzunluk cezası]; desen alanları 0/1.
+    """
+    out = []
+    for a, b in sentence_spans(text):
+        s = text[a:b]
+        out.append([a, b, int(bool(_DATE.search(s))), int(bool(_YEAR.search(s))),
+                    int(bool(_VERSION.search(s))), min(len(s) / 500.0, 0.5)])
+    return out
+
+
+def question_keys(question: str) -> List[str]:
+    return [k for k in set(_WORD.findall((question or "").lower())) if len(k) >= 4]
+
+
+def _key_hits(keys: Sequence[str], lowered: List[str]) -> np.ndarray:
+    """Her cümlede kaç anahtar kelime geçiyor: cümleler tek metinde birleştirilir, anahtar başına tek tarama."""
+    hits = np.zeros(len(lowered))
+    if not keys or not lowered:
+        return hits
+    # Ayırıcı \x00 hiçbir \w+ anahtarında yok: eşleşme cümle sınırını aşamaz
+    joined = "\x00".join(lowered)
+    starts = np.cumsum([0] + [len(s) + 1 for s in lowered[:-1]])
+    for k in keys:
+        pos, found = joined.find(k), []
+        while pos >= 0:
+            found.append(pos)
+            # Aynı cümledeki sonraki eşleşmeler sayılmaz: sonraki cümleye atla
+            i = int(np.searchsorted(starts, pos, side="right"))
+            if i >= len(starts):
+                break
+            pos = joined.find(k, int(starts[i]))
+        if found:
+            hits[np.searchsorted(starts, found, side="right") - 1] += 1.0
+    return hits
+
+
+def best_sentences(question: str,
+                   chunks: Sequence[Tuple[str, Optional[Sequence[Sequence[float]]]]]) -> List[Optional[str]]:
+    """
+    Tüm citation'lar için tek geçişte quote seçimi: soru bir kez token'lanır,
+    bütün chunk'ların bütün cümleleri tek dizide skorlanır (anahtar kelime
+    örtüşmesi + saklı desen/uzunluk özellikleri) ve chunk başına ilk en
+    yüksek cümle döner. `chunks`: (metin, Chunk.sentences ya da None) çiftleri.
+    """
+    keys = question_keys(question)
+    sents: List[str] = []
+    feats: List[Sequence[float]] = []
+    owner: List[int] = []
+    for ci, (text, sentences) in enumerate(chunks):
+        text = text or ""
+        if sentences is None or (sentences and len(sentences[0]) != FEATURE_LEN):
+            sentences = sentence_features(text)
+        for f in sentences:
+            sents.append(text[int(f[0]):int(f[1])])
+            feats.append(f)
+            owner.append(ci)
+    out: List[Optional[str]] = [None] * len(chunks)
+    if not sents:
+        return out
+    f = np.asarray(feats, dtype=np.float64)
+    # Toplama sırası tek cümlelik skorlamayla aynı (eşitliklerde aynı sonuç)
+    scores = _key_hits(keys, [s.lower() for s in sents])
+    scores += 2.0 * f[:, 2]
+    scores += 0.5 * f[:, 3]
+    scores += 1.2 * f[:, 4]
+    scores -= f[:, 5]
+    owner_arr = np.asarray(owner)
+    # Chunk'a göre grupla, skor azalan, eşitlikte ilk cümle
+    order = np.lexsort((np.arange(len(sents)), -scores, owner_arr))
+    first = order[np.r_[True, owner_arr[order][1:] != owner_arr[order][:-1]]]
+    for i in first:
+        out[owner[i]] = sents[i].strip() or None
+    return out
+
+
+def best_sentence_for_chunk(question: str, chunk_text: str,
+                            sentences: Optional[Sequence[Sequence[float]]] = None) -> Optional[str]:
+    """
+    En iyi cümle. `sentences` (Chunk.sentences) verilirse sorgu anında sadece
+    anahtar kelime örtüşmesi hesaplanır; yoksa (eski chunk'lar) baştan çıkarılır.
+    """
+    return best_sentences(question, [(chunk_text, sentences)])[0]
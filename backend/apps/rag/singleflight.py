@@ -0,0 +1,109 @@
+from __future__ import annotations
+import asyncio, hashlib, logging, threading, time
+from concurrent.futures import Future, InvalidStateError
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .corpus import corpus_version, normalize_question
+
+log = logging.getLogger("docuchat.ask")
+
+# Aynı anda gelen özdeş sorular (tenant + normalize soru + korpus nesli) tek kez
+# işlenir. Süreç içinde takipçiler liderin Future'ını bekler; worker'lar arasında
+# lider cache.add (Redis SET NX) kilidini alır, diğerleri sonucu cache'ten okur.
+LEADER, COALESCED = "leader", "coalesced"
+
+_inflight: Dict[str, Future] = {}
+_lock = threading.Lock()
+
+
+class _Abandoned(Exception):
+    """Lider istek iptal edildi (istemci koptu); takipçiler işi kendileri yapar."""
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "ASK_COALESCE", True))
+
+
+def _wait() -> float:
+    return float(getattr(settings, "ASK_COALESCE_WAIT", 30))
+
+
+def flight_key(tenant_id: int, question: str, version: Optional[int] = None) -> str:
+    if version is None:
+        version = corpus_version(tenant_id)
+    digest = hashlib.blake2b(normalize_question(question).encode("utf-8"), digest_size=16).hexdigest()
+    return f"flight:{tenant_id}:{version}:{digest}"
+
+
+async def coalesce(key: str, produce: Callable[[], Awaitable[Dict]]) -> Tuple[Dict, str]:
+    """(sonuç, rol). Aynı anahtar için sadece bir produce() çalışır; diğerleri sonucunu paylaşır."""
+    with _lock:
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _inflight[key] = Future()
+    if not leader:
+        try:
+            # shield: kopan takipçinin iptali paylaşılan Future'a geçmez
+            return await asyncio.shield(asyncio.wrap_future(flight)), COALESCED
+        except _Abandoned:
+            return await produce(), LEADER
+
+    try:
+        result, role = await _across_workers(key, produce)
+    except asyncio.CancelledError:
+        _settle(flight, error=_Abandoned())
+        raise
+    except BaseException as e:
+        _settle(flight, error=e)
+        raise
+    else:
+        _settle(flight, result=result)
+        return result, role
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+
+
+def _settle(flight: Future, result=None, error: Optional[BaseException] = None) -> None:
+    # Future zaten tamamlanmış/iptal edilmişse hiçbir şey yapılmaz; liderin cevabı etkilenmez
+    try:
+        if error is not None:
+            flight.set_exception(error)
+        else:
+            flight.set_result(result)
+    except InvalidStateError:
+        log.debug("Flight future already settled")
+
+
+async def _across_workers(key: str, produce: Callable[[], Awaitable[Dict]]) -> Tuple[Dict, str]:
+    wait = _wait()
+    lock_key, result_key = f"{key}:lock", f"{key}:result"
+    if await cache.aadd(lock_key, 1, max(1, int(wait))):
+        try:
+            result = await produce()
+            await cache.aset(result_key, result, max(1, int(wait)))
+            return result, LEADER
+        finally:
+            await cache.adelete(lock_key)
+
+    # Başka bir worker lider: sonucu yazana (ya da kilidi bırakana) kadar beklenir
+    deadline = time.monotonic() + wait
+    delay = 0.02
+    while time.monotonic() < deadline:
+        result = await cache.aget(result_key)
+        if result is not None:
+            return result, COALESCED
+        if await cache.aget(lock_key) is None:
+            # Kilit sonuç yazıldıktan sonra bırakılır: son bir kez bakılır
+            result = await cache.aget(result_key)
+            if result is not None:
+                return result, COALESCED
+            break
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.2)
+    log.info("Coalesced ask gave up waiting on %s", key)
+    return await produce(), LEADER
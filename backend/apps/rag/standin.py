@@ -0,0 +1,171 @@
+"""
+Yerel LLM stand-in sunucusu: HTTPProvider'ın konuştuğu akışlı completion API'sini
+taklit eder, ağ ya da API anahtarı olmadan tüm ask yolunda throughput ve kuyruk
+gecikmesi ölçmek için. Django'dan bağımsızdır (sadece standart kütüphane).
+
+POST /v1/completions {"prompt", "stream", "max_tokens"}:
+  stream=false → {"text", "usage"}; stream=true → SSE "data: {"text": ...}" ... "data: [DONE]"
+GET /health → {"ok": true}
+
+Cevap, prompt'taki ilk QUOTE satırından üretilir (yoksa "I don't know.").
+"""
+from __future__ import annotations
+import json, logging, math, random, re, threading, time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+log = logging.getLogger("docuchat.standin")
+
+_QUOTE = re.compile(r'^QUOTE: "(.*)"$', re.MULTILINE)
+_WORDS = re.compile(r"\s*\S+")
+
+Sampler = Callable[[random.Random], float]
+
+
+def parse_distribution(spec: str) -> Sampler:
+    """
+    Saniye cinsinden gecikme dağılımı:
+    fixed:S | uniform:A,B | normal:MU,SIGMA | lognormal:MEDIAN,SIGMA | exp:MEAN
+    (negatif örnekler 0'a kırpılır). Düz sayı fixed demektir.
+    """
+    kind, _, args = spec.partition(":")
+    if not args:
+        kind, args = "fixed", kind
+    try:
+        p = [float(a) for a in args.split(",")]
+    except ValueError:
+        raise ValueError(f"Bad distribution: {spec}")
+    shapes = {
+        "fixed": (1, lambda r: p[0]),
+        "uniform": (2, lambda r: r.uniform(p[0], p[1])),
+        "normal": (2, lambda r: r.gauss(p[0], p[1])),
+        "lognormal": (2, lambda r: p[0] * math.exp(r.gauss(0.0, p[1]))),
+        "exp": (1, lambda r: r.expovariate(1.0 / p[0]) if p[0] > 0 else 0.0),
+    }
+    if kind not in shapes or len(p) != shapes[kind][0]:
+        raise ValueError(f"Bad distribution: {spec}")
+    sample = shapes[kind][1]
+    return lambda r: max(0.0, sample(r))
+
+
+@dataclass
+class StandinConfig:
+    # İlk token'a kadar geçen süre (kuyruk + prompt işleme)
+    ttft: Sampler = field(default_factory=lambda: parse_distribution("lognormal:0.4,0.5"))
+    # Saniyede token (kelime) ve token arası gecikmedeki göreli sapma
+    token_rate: float = 40.0
+    token_jitter: float = 0.3
+    # İstek başına olasılıklar: ilk token'dan önce 500, 429 (aşırı yük), akış ortasında kopma
+    error_rate: float = 0.0
+    overload_rate: float = 0.0
+    stream_error_rate: float = 0.0
+    # Cevap bu kadar token'dan kısaysa kaynak metinden dolgu eklenir
+    min_tokens: int = 0
+    seed: Optional[int] = None
+
+
+def answer_for(prompt: str, max_tokens: int, min_tokens: int = 0):
+    """Prompt'taki ilk quote'tan cevap token'ları (boşluklar korunarak)."""
+    m = _QUOTE.search(prompt or "")
+    if not m:
+        return _WORDS.findall("I don't know.")
+    words = _WORDS.findall(f"According to the context: \"{m.group(1)}\"")
+    filler = _WORDS.findall(" " + m.group(1)) or [" ..."]
+    i = 0
+    while len(words) < min_tokens:
+        words.append(filler[i % len(filler)])
+        i += 1
+    return words[:max(1, max_tokens)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "StandinServer"
+
+    def log_message(self, fmt, *args):
+        log.debug(fmt, *args)
+
+    def _json(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chunk(self, data: str) -> None:
+        raw = data.encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(raw), raw))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/health":
+            return self._json(200, {"ok": True})
+        self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/completions":
+            return self._json(404, {"error": "not found"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        except ValueError:
+            return self._json(400, {"error": "invalid JSON"})
+        cfg, rnd = self.server.config, self.server.rng()
+
+        time.sleep(cfg.ttft(rnd))
+        roll = rnd.random()
+        if roll < cfg.overload_rate:
+            return self._json(429, {"error": "overloaded"})
+        if roll < cfg.overload_rate + cfg.error_rate:
+            return self._json(500, {"error": "internal error"})
+
+        tokens = answer_for(body.get("prompt", ""), int(body.get("max_tokens") or 1024), cfg.min_tokens)
+        gap = 1.0 / cfg.token_rate if cfg.token_rate > 0 else 0.0
+
+        def pause():
+            if gap:
+                time.sleep(max(0.0, gap * (1 + rnd.uniform(-cfg.token_jitter, cfg.token_jitter))))
+
+        if not body.get("stream"):
+            for _ in tokens[1:]:
+                pause()
+            return self._json(200, {"text": "".join(tokens), "usage": {"completion_tokens": len(tokens)}})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        cut = int(rnd.random() * len(tokens)) if rnd.random() < cfg.stream_error_rate else None
+        for i, tok in enumerate(tokens):
+            if i:
+                pause()
+            if i == cut:
+                # Akış ortasında bağlantı kopar (chunked sonlandırıcı gönderilmez)
+                self.close_connection = True
+                return
+            self._chunk(f"data: {json.dumps({'text': tok})}\n\n")
+        self._chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: StandinConfig):
+        super().__init__(address, _Handler)
+        self.config = config
+        self._seed = random.Random(config.seed)
+        self._lock = threading.Lock()
+
+    def rng(self) -> random.Random:
+        # İstek başına ayrı üreteç: seed verilirse çalıştırmalar tekrarlanabilir
+        with self._lock:
+            return random.Random(self._seed.random())
+
+
+def serve(host: str, port: int, config: StandinConfig) -> StandinServer:
+    """Sunucuyu arka plan thread'inde başlatır (testler/benchmark'lar için)."""
+    server = StandinServer((host, port), config)
+    threading.Thread(target=server.serve_forever, name="llm-standin", daemon=True).start()
+    return server
@@ -0,0 +1,211 @@
+from __future__ import annotations
+import fcntl, json, logging, mmap, os, shutil
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+from django.conf import settings
+
+log = logging.getLogger("docuchat.index")
+
+# Disk formatı: tenant başına bir dizin, içinde nesil (generation) dizinleri ve
+# hangi neslin geçerli olduğunu gösteren manifest.json. Diziler .npy olarak
+# yazılır ve worker'larda np.load(mmap_mode="r") ile açılır; böylece aynı
+# node'daki tüm daphne worker'ları sayfaları page cache üzerinden paylaşır.
+FORMAT_VERSION = 2
+ARRAYS = (
+    "chunk_ids", "doc_len", "norms",
+    "max_tf", "min_dl", "max_tfn",                 # terim başına skor üst sınırları (MaxScore)
+    "tf_indptr", "tf_indices", "tf_data",          # CSR: chunk -> terimler
+    "post_indptr", "post_indices", "post_data",    # CSC: terim -> chunk'lar (posting'ler)
+    "df", "term_len", "vocab_offsets",
+)
+
+
+class Vocabulary:
+    """
+    Terim -> id tablosu. Diskteki kısım UTF-8 byte sırasıyla sıralı bir blob
+    (vocab.bin + offset dizisi) olarak mmap'lenir ve ikili aramayla okunur;
+    id = sıradaki konum. Sonradan (delta'larla) gelen terimler worker'a özel
+    bir sözlükte tutulur.
+    """
+
+    def __init__(self, blob=b"", offsets: Optional[np.ndarray] = None):
+        self._blob = blob
+        self._offsets = offsets if offsets is not None else np.zeros(1, dtype=np.int64)
+        self._n_disk = len(self._offsets) - 1
+        self._local: Dict[str, int] = {}
+        self._local_terms: List[str] = []
+
+    def __len__(self) -> int:
+        return self._n_disk + len(self._local_terms)
+
+    def __contains__(self, term: str) -> bool:
+        return self.get(term) is not None
+
+    def __getitem__(self, term: str) -> int:
+        j = self.get(term)
+        if j is None:
+            raise KeyError(term)
+        return j
+
+    def _disk_term(self, j: int) -> bytes:
+        return self._blob[int(self._offsets[j]):int(self._offsets[j + 1])]
+
+    def get(self, term: str) -> Optional[int]:
+        j = self._local.get(term)
+        if j is not None:
+            return j
+        if not self._n_disk:
+            return None
+        key = term.encode("utf-8")
+        lo, hi = 0, self._n_disk
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._disk_term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._n_disk and self._disk_term(lo) == key:
+            return lo
+        return None
+
+    def add(self, term: str) -> int:
+        j = self.get(term)
+        if j is None:
+            j = self._local[term] = len(self)
+            self._local_terms.append(term)
+        return j
+
+    def term(self, j: int) -> str:
+        if j < self._n_disk:
+            return self._disk_term(j).decode("utf-8")
+        return self._local_terms[j - self._n_disk]
+
+    def terms(self) -> List[str]:
+        return [self.term(j) for j in range(len(self))]
+
+
+def index_root() -> Path:
+    return Path(getattr(settings, "INDEX_DIR", "") or (Path(settings.BASE_DIR) / "index_data"))
+
+
+def tenant_dir(tenant_id: int) -> Path:
+    return index_root() / f"tenant_{tenant_id}"
+
+
+@contextmanager
+def tenant_lock(tenant_id: int, blocking: bool = True, name: str = "") -> Iterator[bool]:
+    """
+    Tenant dizini için worker'lar arası yazma kilidi (flock). name ayrı bir kilit
+    dosyası seçer (ör. "embed"): indeks nesilleri ile embedding eğitimi birbirini beklemez.
+    """
+    d = tenant_dir(tenant_id)
+    d.mkdir(parents=True, exist_ok=True)
+    with open(d / (f".{name}.lock" if name else ".lock"), "w") as fh:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def read_manifest(tenant_id: int) -> Optional[dict]:
+    try:
+        with open(tenant_dir(tenant_id) / "manifest.json") as fh:
+            manifest = json.load(fh)
+    except (FileNotFoundError, ValueError):
+        return None
+    return manifest if manifest.get("version") == FORMAT_VERSION else None
+
+
+def write_generation(tenant_id: int, arrays: Dict[str, np.ndarray], vocab_blob: bytes, meta: dict) -> dict:
+    """Yeni nesli yazar ve manifest'i atomik olarak ona çevirir. Kilit çağıranda."""
+    d = tenant_dir(tenant_id)
+    d.mkdir(parents=True, exist_ok=True)
+    current = read_manifest(tenant_id)
+    generation = (current["generation"] + 1) if current else 1
+    name = f"gen_{generation}"
+    tmp = d / f"{name}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    for key in ARRAYS:
+        np.save(tmp / f"{key}.npy", arrays[key], allow_pickle=False)
+    with open(tmp / "vocab.bin", "wb") as fh:
+        fh.write(vocab_blob)
+    shutil.rmtree(d / name, ignore_errors=True)
+    os.replace(tmp, d / name)
+
+    manifest = dict(meta, version=FORMAT_VERSION, generation=generation, path=name)
+    with open(d / "manifest.json.tmp", "w") as fh:
+        json.dump(manifest, fh)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(d / "manifest.json.tmp", d / "manifest.json")
+
+    # Bir önceki nesil korunur: read_manifest ile np.load arasındaki worker'lar
+    # onu hâlâ açabilir. Daha eskiler silinir; onları mmap'lemiş worker'lar için
+    # sayfalar unmap edilene kadar geçerli kalır (Linux unlink semantiği).
+    keep = {name, f"gen_{generation - 1}"}
+    for old in d.glob("gen_*"):
+        if old.name not in keep:
+            shutil.rmtree(old, ignore_errors=True)
+    log.info("Index generation written tenant=%s gen=%d docs=%s", tenant_id, generation, meta.get("n_docs"))
+    return manifest
+
+
+def _load(path: Path) -> np.ndarray:
+    try:
+        return np.load(path, mmap_mode="r", allow_pickle=False)
+    except ValueError:
+        # Boş diziler mmap'lenemez
+        return np.load(path, allow_pickle=False)
+
+
+def open_generation(tenant_id: int, manifest: dict):
+    """Nesli mmap ile açar: (diziler, Vocabulary)."""
+    d = tenant_dir(tenant_id) / manifest["path"]
+    arrays = {key: _load(d / f"{key}.npy") for key in ARRAYS}
+    blob = b""
+    if os.path.getsize(d / "vocab.bin"):
+        with open(d / "vocab.bin", "rb") as fh:
+            blob = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    return arrays, Vocabulary(blob, arrays["vocab_offsets"])
+
+
+def pack_vocabulary(terms: List[str]) -> tuple:
+    """Terimleri byte sırasına dizer: (sıra permütasyonu, blob, offset'ler)."""
+    encoded = [t.encode("utf-8") for t in terms]
+    order = sorted(range(len(encoded)), key=encoded.__getitem__)
+    offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    parts = []
+    for pos, j in enumerate(order):
+        parts.append(encoded[j])
+        offsets[pos + 1] = offsets[pos] + len(encoded[j])
+    return np.asarray(order, dtype=np.int64), b"".join(parts), offsets
+
+
+def save_array(tenant_id: int, name: str, arr: np.ndarray) -> None:
+    """Tenant dizinine tek bir dizi yazar (tmp + os.replace ile atomik)."""
+    d = tenant_dir(tenant_id)
+    d.mkdir(parents=True, exist_ok=True)
+    tmp = d / f"{name}.tmp.npy"
+    np.save(tmp, arr, allow_pickle=False)
+    os.replace(tmp, d / f"{name}.npy")
+
+
+def array_mtime(tenant_id: int, name: str) -> Optional[int]:
+    try:
+        return os.stat(tenant_dir(tenant_id) / f"{name}.npy").st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def load_array(tenant_id: int, name: str) -> Optional[np.ndarray]:
+    path = tenant_dir(tenant_id) / f"{name}.npy"
+    return _load(path) if path.exists() else None
@@ -0,0 +1,38 @@
+from __future__ import annotations
+import json, logging
+from typing import AsyncIterator, Dict, Iterator
+
+from asgiref.sync import sync_to_async
+
+log = logging.getLogger("docuchat.ask")
+
+_END = object()
+
+
+async def aiter_sync(it: Iterator[str]) -> AsyncIterator[str]:
+    """
+    Senkron parça iteratörü (ör. Gemini stream) event loop'u bloklamadan tüketilir:
+    her next() bir worker thread'de çalışır, parça gelir gelmez aktarılır.
+    Tüketici erken çıkarsa (istemci koptu) iteratör kapatılır; cache'e yazılmaz.
+    """
+    step = sync_to_async(next, thread_sensitive=False)
+    done = False
+    try:
+        while True:
+            piece = await step(it, _END)
+            if piece is _END:
+                done = True
+                return
+            yield piece
+    finally:
+        close = getattr(it, "close", None)
+        if not done and close is not None:
+            try:
+                await sync_to_async(close, thread_sensitive=False)()
+            except Exception:
+                # next() hâlâ thread'de çalışıyorsa kapatılamaz; parça bitince GC kapatır
+                log.debug("Stream iterator could not be closed", exc_info=True)
+
+
+def sse_event(name: str, payload: Dict) -> str:
+    return f"event: {name}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
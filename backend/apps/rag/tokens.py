@@ -0,0 +1,53 @@
+from __future__ import annotations
+import logging, re, threading
+from typing import List
+
+import tiktoken
+from django.conf import settings
+
+log = logging.getLogger("docuchat.tokens")
+
+# Token sayımı ve token sınırları (chunk'lama, LLM context bütçesi). Kodlama
+# dosyası ilk kullanımda indirilir; ağsız kurulumda (TIKTOKEN_CACHE_DIR yoksa)
+# kelime/noktalama tabanlı yaklaşık sayıma düşülür.
+_APPROX = re.compile(r"\s*(?:\w+|[^\w\s])|\s+")
+
+_enc = None
+_loaded = False
+_lock = threading.Lock()
+
+
+def _encoding():
+    global _enc, _loaded
+    if _loaded:
+        return _enc
+    with _lock:
+        if not _loaded:
+            name = getattr(settings, "TOKEN_ENCODING", "cl100k_base")
+            try:
+                _enc = tiktoken.get_encoding(name)
+            except Exception as e:
+                log.warning("tiktoken encoding %s unavailable, using approximate token counts: %s", name, e)
+                _enc = None
+            _loaded = True
+    return _enc
+
+
+def token_offsets(text: str) -> List[int]:
+    """Her token'ın metindeki başlangıç konumu (karakter); azalmayan sıra."""
+    if not text:
+        return []
+    enc = _encoding()
+    if enc is None:
+        return [m.start() for m in _APPROX.finditer(text)]
+    _, offsets = enc.decode_with_offsets(enc.encode(text, disallowed_special=()))
+    return offsets
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    enc = _encoding()
+    if enc is None:
+        return sum(1 for _ in _APPROX.finditer(text))
+    return len(enc.encode(text, disallowed_special=()))
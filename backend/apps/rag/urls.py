@@ -1,7 +1,9 @@
 from django.urls import path
-from .views import ask, llm_health
+from .views import ask, ask_batch, ask_stream, llm_health
 
 urlpatterns = [
     path("chat/ask", ask),
+    path("chat/ask_stream", ask_stream),
+    path("chat/ask_batch", ask_batch),
     path("llm/health", llm_health),
 ]
@@ -1,51 +1,71 @@
 from __future__ import annotations
-import logging, re
-from typing import List, Dict, Optional
+import json, logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterator, List, Dict, Optional, Sequence, Tuple
 from django.conf import settings
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from apps.uploads.models import Chunk
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from rank_bm25 import BM25Okapi
 from django.core.cache import cache
-from .llm import gemini_answer, llm_healthcheck, fake_llm_answer
+from . import gateway, singleflight
+from .answer_cache import cached_answer, cached_answer_stream, lookup_answer, store_answer
+from .corpus import corpus_version, retrieval_cache_key, retrieval_cache_ttl
+from .index import get_index
+from .embeddings import dense_weight, hybrid_search
+from .fts import fts_search
+from .quotes import best_sentences
+from .llm import get_provider, llm_healthcheck
+from .streaming import aiter_sync, sse_event
 from rest_framework import status
 log = logging.getLogger("docuchat.ask")
 
 def retrieve(tenant, question: str, top_k: int = 4) -> List[Dict]:
-    cache_key = f"retrv:{tenant.id}:{hash(question)}:{top_k}"
+    version = corpus_version(tenant.id)
+    cache_key = retrieval_cache_key(tenant.id, question, top_k, version)
     cached = cache.get(cache_key)
     if cached:
         return cached
 
-    qs = list(Chunk.objects.select_related("document")
-        .only("id","text","document_id","tenant_id","page")
-        .filter(tenant=tenant))
-    if not qs:
-        return []
+    if getattr(settings, "RETRIEVAL_BACKEND", "index") == "postgres":
+        # Aday seçimi DB'de (tsvector + GIN); sadece ilk top_k satır gelir
+        qs = fts_search(tenant, question, top_k)
+    else:
+        n = max(top_k*3, top_k)
+        # Tenant indeksi bir kez kurulur; sorgu sadece hazır yapıya karşı skorlanır
+        index = get_index(tenant, version)
+        if index is None:
+            return []
+        # Dense (pgvector) sinyali açıksa hybrid skora eklenir
+        weight = dense_weight()
+        ids = hybrid_search(tenant, index, question, n, weight) if weight > 0 else index.search(question, n)
+        # Aday sayısını geniş tut: indeks ile DB arasında silinen chunk'lar atlanır
+        rows = (Chunk.objects.select_related("document")
+            .only("id","text_z","text_dict_id","sentences","document_id","document__filename","tenant_id","page","index")
+            .filter(tenant=tenant)
+            .in_bulk(ids))
+        qs = [rows[i] for i in ids if i in rows]
 
-    corpus = [(c.text or "") for c in qs]
+    # Metin sadece dönecek top_k satır için açılır (Chunk.text_z sıkıştırılmış)
+    results = _citations(qs[:top_k])
 
-    # TF-IDF similarity
-    vectorizer = TfidfVectorizer(stop_words=None)
-    tfidf = vectorizer.fit_transform(corpus + [question])
-    tfidf_sims = cosine_similarity(tfidf[-1], tfidf[:-1]).flatten()
+    cache.set(cache_key, results, retrieval_cache_ttl())
+    return results
 
-    # BM25 score
-    tokenized = [re.findall(r"\w+", t.lower()) for t in corpus]
-    bm25 = BM25Okapi(tokenized)
-    bm25_scores = bm25.get_scores(re.findall(r"\w+", question.lower()))
-
-    # Hybrid score
-    import numpy as np
-    hybrid = 0.40 * tfidf_sims + 0.60 * (bm25_scores / (max(bm25_scores)+1e-9))
-    idxs = np.argsort(hybrid)[::-1][:max(top_k*3, top_k)]
+def _shift(sentences, lead: int):
+    # Cümle konumları ham chunk metnine göre; sonuçtaki metin strip'li
+    if not sentences or not lead:
+        return sentences
+    return [[f[0] - lead, f[1] - lead, *f[2:]] for f in sentences]
 
+def _citations(qs) -> List[Dict]:
     results: List[Dict] = []
-    for i in idxs:
-        c = qs[i]
-        text = (c.text or "").strip()
+    for c in qs:
+        raw = c.text or ""
+        text = raw.strip()
         doc_obj = getattr(c, "document", None)
         doc_name = getattr(doc_obj, "filename", f"doc-{getattr(c, 'document_id','unknown')}")
         results.append({
@@ -53,106 +73,288 @@ def retrieve(tenant, question: str, top_k: int = 4) -> List[Dict]:
             "doc_id": getattr(doc_obj, "id", getattr(c, "document_id", None)),
             "page": getattr(c, "page", None),
             "chunk_id": c.id,
+            "index": getattr(c, "index", None),
             "text": text,
             "snippet": (text[:280] + "…") if len(text) > 280 else text,
+            "sentences": _shift(getattr(c, "sentences", None), len(raw) - len(raw.lstrip())),
         })
+    return results
 
-    cache.set(cache_key, results[:top_k], 60)
-    return results[:top_k]
-
-_SENT_SPLIT = re.compile(r'(?<=[\.!?])\s+|\n+')
-
-def _split_sentences(text: str):
-    parts = [s.strip() for s in _SENT_SPLIT.split(text or "") if s.strip()]
-    return parts or ([] if not text else [text.strip()])
-
-def _score_sentence(q: str, s: str) -> float:
-    ql, sl = q.lower(), s.lower()
-    score = 0.0
-    keys = re.findall(r'\w+', ql)
-    for k in set(keys):
-        if len(k) >= 4 and k in sl:
-            score += 1.0
-    if re.search(r'\b\d{1,2}\.\d{1,2}\.\d{4}\b', s):
-        score += 2.0
-    if re.search(r'\b20\d{2}\b', s):
-        score += 0.5
-    if re.search(r'\\b\\d+(?:\\.\\d+){1,3}\\b', s):  # 3.11.x gibi
-        score += 1.2
-    score -= min(len(s) / 500.0, 0.5)
-    return score
-
-def best_sentence_for_chunk(question: str, chunk_text: str) -> Optional[str]:
-    sents = _split_sentences(chunk_text)
-    if not sents:
-        return None
-    best_s, best_sc = None, float("-inf")
-    for s in sents:
-        sc = _score_sentence(question, s)
-        if sc > best_sc:
-            best_s, best_sc = s, sc
-    return best_s.strip() if best_s else None
+def retrieve_many(tenant, questions: Sequence[str], top_k: int = 4) -> List[List[Dict]]:
+    """
+    retrieve() ile aynı sonuçlar, çok soru için: indeks yolunda tüm sorular
+    tek sparse matmul ile skorlanır ve chunk'lar tek sorguda okunur.
+    Postgres backend'i ya da dense sinyal açıkken soru başına retrieve'e düşer.
+    """
+    if (getattr(settings, "RETRIEVAL_BACKEND", "index") == "postgres" or dense_weight() > 0):
+        return [retrieve(tenant, q, top_k=top_k) for q in questions]
 
-@api_view(["POST"])
-def ask(request):
+    version = corpus_version(tenant.id)
+    keys = [retrieval_cache_key(tenant.id, q, top_k, version) for q in questions]
+    cached = cache.get_many(keys)
+    out: List[Optional[List[Dict]]] = [cached.get(k) or None for k in keys]
+    todo = [i for i, r in enumerate(out) if r is None]
+    if not todo:
+        return out
+
+    index = get_index(tenant, version)
+    if index is None:
+        return [r or [] for r in out]
+    n = max(top_k*3, top_k)
+    ranked = index.search_many([questions[i] for i in todo], n)
+    all_ids = {cid for hits in ranked for cid, _ in hits}
+    rows = (Chunk.objects.select_related("document")
+        .only("id","text_z","text_dict_id","sentences","document_id","document__filename","tenant_id","page","index")
+        .filter(tenant=tenant)
+        .in_bulk(list(all_ids)))
+    fresh = {}
+    for i, hits in zip(todo, ranked):
+        out[i] = _citations([rows[cid] for cid, _ in hits if cid in rows][:top_k])
+        fresh[keys[i]] = out[i]
+    cache.set_many(fresh, retrieval_cache_ttl())
+    return out
+
+def _enrich(q: str, raw_cites: List[Dict]) -> List[Dict]:
+    # Enrichment (quote önce): tüm citation'ların cümleleri tek geçişte skorlanır;
+    # cümle sınırları ve statik özellikler upload'da hesaplandı (Chunk.sentences)
+    quotes = best_sentences(q, [(c.get("text") or "", c.get("sentences")) for c in raw_cites])
+    enriched = []
+    for c, quote in zip(raw_cites, quotes):
+        enriched.append({
+            "doc": c["doc"],
+            "doc_id": c["doc_id"],
+            "page": c["page"],
+            "chunk_id": c["chunk_id"],
+            "snippet": c["snippet"],
+            "quote": (quote or c["snippet"]),
+            # Sadece LLM context'i için (bitişik chunk birleştirme); yanıtta dönmez
+            "text": c.get("text"),
+            "index": c.get("index"),
+        })
+    return enriched
+
+_CONTEXT_ONLY = ("text", "index")
+
+def _public(enriched: List[Dict]) -> List[Dict]:
+    return [{k: v for k, v in c.items() if k not in _CONTEXT_ONLY} for c in enriched]
+
+def _answer(q: str, enriched: List[Dict], tenant_id=None) -> Tuple[str, bool, Optional[str]]:
+    """
+    (cevap, cache_hit, kaynak): aynı soru + aynı context için LLM tekrar çağrılmaz.
+    Uzak sağlayıcı çağrısı gateway'den geçer; fallback cevapları cache'lenmez.
+    """
+    provider = get_provider()
+    if not provider.remote:
+        ans, hit = cached_answer(q, enriched, lambda: provider.answer(q, enriched))
+        return ans, hit, None
+    ans = lookup_answer(q, enriched)
+    if ans is not None:
+        return ans, True, None
+    ans, source = gateway.answer_sync(tenant_id, q, enriched)
+    if source != gateway.FALLBACK:
+        store_answer(q, enriched, ans)
+    return ans, False, source
+
+def _prepare_answer(tenant, q: str) -> Tuple[List[Dict], Optional[str], bool]:
+    """
+    ask'in senkron kısmı: (enriched citation'lar, cevap, cache_hit). Sağlayıcı
+    uzaksa ve cevap cache'te yoksa cevap None döner (gateway'e gidilir).
+    """
+    enriched = _enrich(q, retrieve(tenant, q, top_k=_top_k()))
+    provider = get_provider()
+    if provider.remote:
+        ans = lookup_answer(q, enriched)
+        return enriched, ans, ans is not None
+    ans, hit = cached_answer(q, enriched, lambda: provider.answer(q, enriched))
+    return enriched, ans, hit
+
+def _answer_stream(q: str, enriched: List[Dict], tenant_id=None) -> Tuple[Iterator[str], bool]:
+    """
+    _answer'ın akış hali; LLM çağrısı ilk parça istendiğinde başlar. Uzak sağlayıcı
+    akışı gateway'den geçer (semaforlar, deadline, breaker); fallback cache'lenmez.
+    """
+    provider = get_provider()
+    if not provider.remote:
+        return cached_answer_stream(q, enriched, lambda: provider.stream(q, enriched))
+    run = gateway.stream(tenant_id, q, enriched)
+    return cached_answer_stream(q, enriched, lambda: iter(run), cacheable=lambda: run.source != gateway.FALLBACK)
+
+def _meta(hit: bool, source: Optional[str] = None) -> Dict:
+    meta = {"answer_cache": "hit" if hit else "miss"}
+    if source:
+        meta["llm"] = source
+    return meta
+
+def _top_k() -> int:
+    try:
+        return int(getattr(settings, "TOP_K", 4))
+    except Exception:
+        return 4
+
+@csrf_exempt
+@require_POST
+async def ask(request):
+    """
+    Async view: retrieval thread'de, LLM çağrısı gateway'de beklenir; sağlayıcı
+    yavaşladığında ASGI worker thread'leri tutulmaz.
+    """
     tenant = getattr(request, "tenant", None)
 
     # Güvenli body okuma
+    try:
+        data = json.loads(request.body or b"{}")
+        if not isinstance(data, dict):
+            raise ValueError("JSON object expected")
+    except ValueError:
+        return JsonResponse(
+            {"answer": "Invalid JSON body.", "citations": []},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    q = (str(data.get("question") or "")).strip() or (str(data.get("q") or "")).strip()
+    if not q:
+        return JsonResponse({"answer": "Please provide a question.", "citations": []})
+
+    try:
+        if singleflight.enabled():
+            # Eşzamanlı özdeş sorular (aynı tenant + korpus nesli) tek kez cevaplanır
+            key = await sync_to_async(singleflight.flight_key)(tenant.id, q)
+            payload, role = await singleflight.coalesce(key, lambda: _ask(tenant, q))
+            if role == singleflight.COALESCED:
+                payload = {**payload, "meta": {**payload["meta"], "coalesced": True}}
+        else:
+            payload = await _ask(tenant, q)
+        return JsonResponse(payload)
+
+    except Exception as e:
+        # Her durumda Response dön! (500 üretmeyelim)
+        return JsonResponse(
+            {"answer": f"Server error: {e}", "citations": []},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+async def _ask(tenant, q: str) -> Dict:
+    # Retrieval + enrichment + cache kontrolü
+    enriched, ans, hit = await sync_to_async(_prepare_answer)(tenant, q)
+    source = None
+    if ans is None:
+        ans, source = await gateway.answer(tenant.id, q, enriched)
+        if source != gateway.FALLBACK:
+            await sync_to_async(store_answer)(q, enriched, ans)
+
+    # Nihai dönüş
+    return {
+        "answer": ans or "I don't know.",
+        "citations": _public(enriched),
+        "meta": _meta(hit, source),
+    }
+
+def prepare_stream(tenant, q: str) -> Tuple[List[Dict], Iterator[str], bool]:
+    """
+    Akışlı ask'in senkron kısmı (retrieval + enrichment + cache kontrolü):
+    (enriched citation'lar, cevap parçaları, cache_hit). Hatalar cevap metnine döner.
+    """
+    if not q:
+        return [], iter(("Please provide a question.",)), False
+    try:
+        enriched = _enrich(q, retrieve(tenant, q, top_k=_top_k()))
+        pieces, hit = _answer_stream(q, enriched, getattr(tenant, "id", None))
+        return enriched, pieces, hit
+    except Exception as e:
+        log.exception("Stream ask failed")
+        return [], iter((f"Server error: {e}",)), False
+
+async def answer_events(enriched: List[Dict], pieces: Iterator[str], hit: bool) -> AsyncIterator[Tuple[str, Dict]]:
+    """citations (retrieval biter bitmez) → token... (LLM parçaları geldikçe) → done."""
+    yield "citations", {"citations": _public(enriched)}
+    parts: List[str] = []
+    try:
+        async for piece in aiter_sync(pieces):
+            parts.append(piece)
+            yield "token", {"text": piece}
+    except Exception as e:
+        log.exception("Answer stream failed")
+        parts.append(f"\nServer error: {e}")
+        yield "token", {"text": parts[-1]}
+    yield "done", {"answer": "".join(parts).strip() or "I don't know.", "meta": _meta(hit)}
+
+@api_view(["POST"])
+def ask_stream(request):
+    """
+    ask'in Server-Sent Events hali: event: citations, ardından her LLM parçası için
+    event: token ({"text"}), en sonda event: done ({"answer", "meta"}).
+    """
+    tenant = getattr(request, "tenant", None)
     try:
         data = request.data or {}
+        if not isinstance(data, dict):
+            raise ValueError("JSON object expected")
     except Exception:
         return Response(
             {"answer": "Invalid JSON body.", "citations": []},
             status=status.HTTP_400_BAD_REQUEST,
         )
+    q = (str(data.get("question") or "")).strip() or (str(data.get("q") or "")).strip()
+    enriched, pieces, hit = prepare_stream(tenant, q)
 
-    q = (data.get("question") or "").strip() or (data.get("q") or "").strip()
-    if not q:
-        return Response({"answer": "Please provide a question.", "citations": []})
+    async def body():
+        async for name, payload in answer_events(enriched, pieces, hit):
+            yield sse_event(name, payload)
+
+    response = StreamingHttpResponse(body(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # nginx parçaları tamponlamadan istemciye iletir
+    response["X-Accel-Buffering"] = "no"
+    return response
 
+@api_view(["POST"])
+def ask_batch(request):
+    """
+    {"questions": [...]} -> {"results": [{"question", "answer", "citations", "meta"}, ...]}
+    Retrieval tek geçişte; LLM çağrıları LLM_CONCURRENCY ile sınırlı paralel.
+    """
+    tenant = getattr(request, "tenant", None)
     try:
-        top_k = int(getattr(settings, "TOP_K", 4))
+        data = request.data or {}
     except Exception:
-        top_k = 4
+        return Response({"detail": "Invalid JSON body.", "results": []}, status=status.HTTP_400_BAD_REQUEST)
+
+    questions = data.get("questions")
+    if not isinstance(questions, list) or not questions:
+        return Response({"detail": "Please provide a non-empty 'questions' list.", "results": []},
+                        status=status.HTTP_400_BAD_REQUEST)
+    questions = [(str(q) if q is not None else "").strip() for q in questions]
+    limit = int(getattr(settings, "ASK_BATCH_MAX", 200))
+    if len(questions) > limit:
+        return Response({"detail": f"At most {limit} questions per batch.", "results": []},
+                        status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        # Retrieval
-        raw_cites = retrieve(tenant, q, top_k=top_k)
-
-        # Enrichment (quote önce)
-        enriched = []
-        for c in raw_cites:
-            quote = best_sentence_for_chunk(q, c.get("text") or "")
-            enriched.append({
-                "doc": c["doc"],
-                "doc_id": c["doc_id"],
-                "page": c["page"],
-                "chunk_id": c["chunk_id"],
-                "snippet": c["snippet"],
-                "quote": (quote or c["snippet"]),
-            })
-
-        # LLM seçimi
-        llm_provider = getattr(settings, "LLM_PROVIDER", "gemini")
-        use_gemini = (llm_provider == "gemini" and bool(getattr(settings, "GEMINI_API_KEY", "")))
-
-        if use_gemini:
-            ans = gemini_answer(q, enriched)
-        else:
-            ans = fake_llm_answer(q, enriched)
+        asked = [i for i, q in enumerate(questions) if q]
+        cites = retrieve_many(tenant, [questions[i] for i in asked], top_k=_top_k())
+        enriched = {i: _enrich(questions[i], c) for i, c in zip(asked, cites)}
 
-        # Nihai dönüş
-        return Response({
-            "answer": ans or "I don't know.",
-            "citations": enriched,
-        })
+        def run(i: int) -> Tuple[str, bool, Optional[str]]:
+            try:
+                ans, hit, source = _answer(questions[i], enriched[i], tenant.id)
+                return ans or "I don't know.", hit, source
+            except Exception as e:
+                log.exception("Batch answer failed")
+                return f"Server error: {e}", False, None
 
+        workers = max(1, int(getattr(settings, "LLM_CONCURRENCY", 4)))
+        with ThreadPoolExecutor(max_workers=min(workers, max(1, len(asked))),
+                                thread_name_prefix="ask-batch") as pool:
+            answers = dict(zip(asked, pool.map(run, asked)))
     except Exception as e:
-        # Her durumda Response dön! (500 üretmeyelim)
-        return Response(
-            {"answer": f"Server error: {e}", "citations": []},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
+        return Response({"detail": f"Server error: {e}", "results": []},
+                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    results = []
+    for i, q in enumerate(questions):
+        ans, hit, source = answers.get(i, ("Please provide a question.", False, None))
+        results.append({"question": q, "answer": ans, "citations": _public(enriched.get(i, [])), "meta": _meta(hit, source)})
+    return Response({"results": results})
 
 @api_view(["GET"])
 def llm_health(_request):
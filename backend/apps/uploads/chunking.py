@@ -0,0 +1,158 @@
+from __future__ import annotations
+from bisect import bisect_left
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+from apps.rag.quotes import SENT_SPLIT
+from apps.rag.tokens import token_offsets
+
+# Chunk'lama: CHUNK_TOKENS > 0 ise token birimiyle (tiktoken), chunk sonu ve
+# örtüşme başlangıcı cümle sınırlarına oturtulur; 0 ise eski karakter tabanlı
+# CHUNK_SIZE/CHUNK_OVERLAP. Her iki yol da sayfa akışını (sayfa no, metin)
+# sırayla tüketir ve her chunk'ı başladığı sayfayla etiketler.
+
+Pages = Iterable[Tuple[Optional[int], str]]
+
+# Token sınırı kesinleşsin diye kesim noktasından sonra beklenen token payı
+# (sonraki sayfanın metni son token'ları birleştirebilir)
+_MARGIN = 16
+
+
+def chunk_text(text: str, size: int, overlap: int):
+    chunks = []
+    s = 0
+    n = len(text)
+    if n == 0:
+        return []
+    while s < n:
+        e = min(n, s + size)
+        chunks.append(text[s:e])
+        s = e - overlap if (e - overlap) > s else e
+    return chunks
+
+
+def chunk_pages(pages: Pages, size: int, overlap: int) -> Iterator[Tuple[str, Optional[int]]]:
+    """
+    Sayfalar geldikçe chunk'lar: birleşik metin üzerinde chunk_text ile aynı
+    parçalar, her biri başladığı sayfanın numarasıyla. Bellekte yalnızca son
+    chunk başlangıcından itibaren metin (≈ bir chunk + bir sayfa) tutulur.
+    """
+    buf, base, s = "", 0, 0  # buf = metin[base:], s = sıradaki chunk başlangıcı
+    starts: List[Tuple[int, Optional[int]]] = []  # (sayfa başlangıç konumu, sayfa no)
+
+    def page_at(pos: int) -> Optional[int]:
+        page = None
+        for off, no in starts:
+            if off > pos:
+                break
+            page = no
+        return page
+
+    def step(e: int) -> int:
+        return e - overlap if (e - overlap) > s else e
+
+    for no, text in pages:
+        if not text:
+            continue
+        starts.append((base + len(buf), no))
+        buf += text
+        end = base + len(buf)
+        # e = min(n, s + size) ve n >= end: s + size <= end ise e kesinleşmiştir
+        while s + size <= end:
+            e = s + size
+            yield buf[s - base:e - base], page_at(s)
+            s = step(e)
+        buf, base = buf[s - base:], s
+        while len(starts) > 1 and starts[1][0] <= s:
+            starts.pop(0)
+
+    n = base + len(buf)
+    while s < n:
+        e = min(n, s + size)
+        yield buf[s - base:e - base], page_at(s)
+        s = step(e)
+
+
+def token_chunk_pages(pages: Pages, max_tokens: int, overlap: int) -> Iterator[Tuple[str, Optional[int]]]:
+    """
+    Token bütçeli chunk'lar: en fazla max_tokens token; bütçenin ikinci
+    yarısındaki son cümle sınırında kesilir (yoksa token sınırında). Sonraki
+    chunk ~overlap token geriden, en yakın cümle başından başlar (2*overlap
+    içinde yoksa token sınırından). Bellekte yalnızca son chunk
+    başlangıcından itibaren metin tutulur.
+    """
+    max_tokens = max(1, max_tokens)
+    buf, base = "", 0  # buf = metin[base:], buf[0] sıradaki chunk başlangıcı
+    starts: List[Tuple[int, Optional[int]]] = []
+
+    def page_at(pos: int) -> Optional[int]:
+        page = None
+        for off, no in starts:
+            if off > pos:
+                break
+            page = no
+        return page
+
+    def cut(final: bool) -> Optional[Tuple[int, Optional[int]]]:
+        """(chunk sonu, sonraki başlangıç) buf'a göre; metin yetmiyorsa None, son parça ise (len, None)."""
+        window = max_tokens * 8
+        while True:
+            offs = token_offsets(buf[:window])
+            if window >= len(buf) or len(offs) > max_tokens + _MARGIN:
+                break
+            window *= 2
+        whole = window >= len(buf)
+        if whole and len(offs) <= max_tokens:
+            return (len(buf), None) if final else None
+        if whole and not final and len(offs) <= max_tokens + _MARGIN:
+            return None
+        hard = offs[max_tokens]
+        e = hard
+        for m in SENT_SPLIT.finditer(buf, offs[max_tokens // 2], hard):
+            if m.start() > 0:
+                e = m.end()
+        if e <= 0:
+            e = next((o for o in offs if o > 0), len(buf))
+        if overlap <= 0:
+            return e, e
+        n = bisect_left(offs, e)
+        if n - overlap <= 0:
+            return e, e
+        ideal, lo = offs[n - overlap], offs[max(1, n - 2 * overlap)]
+        near = [m.end() for m in SENT_SPLIT.finditer(buf, lo, e) if 0 < m.end() < e]
+        nxt = min(near, key=lambda b: abs(b - ideal)) if near else ideal
+        return e, (nxt if nxt > 0 else e)
+
+    def advance(nxt: int) -> None:
+        nonlocal buf, base
+        buf, base = buf[nxt:], base + nxt
+        while len(starts) > 1 and starts[1][0] <= base:
+            starts.pop(0)
+
+    for no, text in pages:
+        if not text:
+            continue
+        starts.append((base + len(buf), no))
+        buf += text
+        while True:
+            r = cut(final=False)
+            if r is None:
+                break
+            yield buf[:r[0]], page_at(base)
+            advance(r[1])
+
+    while buf:
+        e, nxt = cut(final=True)
+        yield buf[:e], page_at(base)
+        if nxt is None:
+            break
+        advance(nxt)
+
+
+def chunk_stream(pages: Pages) -> Iterator[Tuple[str, Optional[int]]]:
+    """Ayarlara göre token ya da karakter tabanlı chunk'lama."""
+    tokens = int(getattr(settings, "CHUNK_TOKENS", 0))
+    if tokens > 0:
+        return token_chunk_pages(pages, tokens, int(getattr(settings, "CHUNK_OVERLAP_TOKENS", 0)))
+    return chunk_pages(pages, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP)
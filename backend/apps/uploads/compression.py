@@ -0,0 +1,103 @@
+from __future__ import annotations
+import threading, zlib
+from collections import Counter
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+from django.db.models import BinaryField, F, Func, Value
+
+# Metin alanları (Chunk.text_z, Document.text_z) ham deflate ile saklanır.
+# Tenant başına ortak bir ön-sözlük (zdict, ≤32KB) kısa chunk'larda oranı
+# belirgin artırır; satır hangi sözlükle sıkıştırıldığını text_dict ile tutar.
+# Açma sadece gerektiğinde: retrieval'da son top-k, indeks/embedding kurulumu.
+DICT_SIZE = 32 * 1024
+DICT_MIN_SAMPLES = 16
+LEVEL = 6
+_WBITS = -15  # başlıksız deflate (satır başına 6 bayt tasarruf)
+
+_dicts: Dict[int, bytes] = {}
+_lock = threading.Lock()
+
+
+def build_dictionary(samples: Sequence[str], size: int = DICT_SIZE) -> bytes:
+    """Örnek metinlerde tekrar eden kelime dizileri; en değerliler sonda (deflate yakın geçmişi ucuza referanslar)."""
+    counts: Counter = Counter()
+    for text in samples:
+        words = text.split()
+        for n in (1, 2, 3):
+            for i in range(len(words) - n + 1):
+                counts[" ".join(words[i:i + n])] += 1
+    ranked = sorted(((c * len(g), g) for g, c in counts.items() if c > 1), reverse=True)
+    parts, used = [], 0
+    for _, g in ranked:
+        b = (g + " ").encode("utf-8")
+        if used + len(b) > size:
+            break
+        parts.append(b)
+        used += len(b)
+    return b"".join(reversed(parts))
+
+
+def dictionary_bytes(dict_id: Optional[int]) -> Optional[bytes]:
+    """Sözlük satırları değişmez: süreç ömrü boyunca cache'lenir."""
+    if dict_id is None:
+        return None
+    with _lock:
+        data = _dicts.get(dict_id)
+    if data is None:
+        from .models import TextDictionary
+        data = bytes(TextDictionary.objects.values_list("data", flat=True).get(id=dict_id))
+        with _lock:
+            _dicts[dict_id] = data
+    return data
+
+
+def tenant_dictionary(tenant_id: int, samples: Sequence[str] = ()) -> Optional[Tuple[int, bytes]]:
+    """Tenant'ın güncel sözlüğü; yoksa ve yeterli örnek varsa örneklerden oluşturulur."""
+    from .models import TextDictionary
+    row = TextDictionary.objects.filter(tenant_id=tenant_id).order_by("-id").values_list("id", flat=True).first()
+    if row is not None:
+        return row, dictionary_bytes(row)
+    if len(samples) < DICT_MIN_SAMPLES:
+        return None
+    data = build_dictionary(samples)
+    if not data:
+        return None
+    obj = TextDictionary.objects.create(tenant_id=tenant_id, data=data)
+    with _lock:
+        _dicts[obj.id] = data
+    return obj.id, data
+
+
+def compressor(zdict: Optional[bytes]):
+    return zlib.compressobj(LEVEL, zlib.DEFLATED, _WBITS, zdict=zdict) if zdict else \
+        zlib.compressobj(LEVEL, zlib.DEFLATED, _WBITS)
+
+
+def compress(text: str, zdict: Optional[bytes] = None) -> bytes:
+    c = compressor(zdict)
+    return c.compress(text.encode("utf-8")) + c.flush()
+
+
+def decompress(data, dict_id: Optional[int]) -> str:
+    if not data:
+        return ""
+    zdict = dictionary_bytes(dict_id)
+    d = zlib.decompressobj(_WBITS, zdict=zdict) if zdict else zlib.decompressobj(_WBITS)
+    return (d.decompress(bytes(data)) + d.flush()).decode("utf-8")
+
+
+def iter_texts(rows: Iterable[Tuple[int, bytes, Optional[int]]]) -> Iterator[Tuple[int, str]]:
+    """values_list("id", "text_z", "text_dict_id") -> (id, metin); indeks/embedding kurulumu için."""
+    for cid, data, dict_id in rows:
+        yield cid, decompress(data, dict_id)
+
+
+class _Append(Func):
+    template = "%(expressions)s"
+    arg_joiner = " || "
+    output_field = BinaryField()
+
+
+def append_bytes(field: str, data: bytes) -> Func:
+    """UPDATE ... SET field = field || data (akış halinde sıkıştırılan Document.text_z için)."""
+    return _Append(F(field), Value(data, output_field=BinaryField()))
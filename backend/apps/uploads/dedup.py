@@ -0,0 +1,79 @@
+from __future__ import annotations
+import hashlib
+from typing import List, Optional
+
+from django.utils import timezone
+
+from .models import Chunk, ChunkRef, Document
+
+# İçerik adresli tekilleştirme: aynı dosya (SHA-256) tekrar yüklenirse çıkarma
+# yapılmaz, yeni Document sadece asıl dokümana referans olur; tenant içinde
+# aynı metinli chunk bir kez saklanır/indekslenir, diğer dokümanlar ChunkRef ile
+# işaret eder. Silmede içerik, hâlâ referans veren dokümana devredilir.
+
+_BLOCK = 1 << 20
+
+
+def file_sha256(fobj) -> str:
+    """Dosyayı bloklar halinde hash'ler ve başa sarar."""
+    h = hashlib.sha256()
+    fobj.seek(0)
+    for block in iter(lambda: fobj.read(_BLOCK), b""):
+        h.update(block)
+    fobj.seek(0)
+    return h.hexdigest()
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def find_duplicate(tenant, sha256: str) -> Optional[Document]:
+    # Sadece tamamlanmış dokümanlar: yarım asıla referans boş/kesik içerikle "başarılı" olurdu
+    return (Document.objects.filter(tenant=tenant, sha256=sha256, duplicate_of__isnull=True,
+                                    ingested_at__isnull=False)
+            .order_by("id").first())
+
+
+def add_reference(tenant, original: Document, filename: str, size: Optional[int]) -> Document:
+    return Document.objects.create(tenant=tenant, filename=filename, size=size, sha256=original.sha256,
+                                   duplicate_of=original, ingested_at=timezone.now())
+
+
+def delete_document(doc: Document, promote: bool = True) -> List[int]:
+    """
+    Dokümanı siler; atomic blok içinde çağrılmalı. Dönüş: DB'den gerçekten
+    silinen chunk id'leri (indekste tombstone'lanacaklar). promote=False: içerik
+    kopyalara devredilmez, kopyalar da silinir (yarım kalan doküman).
+    """
+    if doc.duplicate_of_id is not None:
+        doc.delete()
+        return []
+
+    heir = doc.duplicates.order_by("id").first() if promote else None
+    if not promote:
+        doc.duplicates.all().delete()
+    if heir is not None:
+        # Kopya varsa asıl doküman o olur: chunk'lar ve referanslar olduğu gibi devredilir
+        Chunk.objects.filter(document=doc).update(document=heir)
+        ChunkRef.objects.filter(document=doc).update(document=heir)
+        doc.duplicates.exclude(id=heir.id).update(duplicate_of=heir)
+        heir.duplicate_of, heir.text_z, heir.text_dict_id = None, doc.text_z, doc.text_dict_id
+        heir.save(update_fields=["duplicate_of", "text_z", "text_dict"])
+        doc.delete()
+        return []
+
+    # Başka dokümanların referans verdiği chunk'lar ilk referans verene taşınır
+    moved = set()
+    refs = (ChunkRef.objects.filter(chunk__document=doc).exclude(document=doc)
+            .order_by("chunk_id", "id"))
+    for ref in refs:
+        if ref.chunk_id in moved:
+            continue
+        Chunk.objects.filter(id=ref.chunk_id).update(document_id=ref.document_id, index=ref.index, page=ref.page)
+        ref.delete()
+        moved.add(ref.chunk_id)
+    ids = list(Chunk.objects.filter(document=doc).values_list("id", flat=True))
+    doc.delete()
+    return ids
+
@@ -0,0 +1,316 @@
+from __future__ import annotations
+import multiprocessing, os, logging, threading, time
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.contrib.postgres.search import SearchVector
+from django.db.models import TextField, Value
+
+from apps.rag.corpus import bump_corpus_version
+from apps.rag.embeddings import embed_texts
+from apps.rag.index import chunks_added, chunks_deleted
+from apps.rag.quotes import sentence_features
+from .chunking import chunk_stream
+from .compression import append_bytes, compress, compressor, tenant_dictionary
+from .dedup import add_reference, delete_document, file_sha256, find_duplicate, text_sha256
+from .models import FTS_CONFIG, Document, Chunk, ChunkRef
+from .pdf_extract import extract_range, iter_pdf_pages, pdf_page_count
+
+log = logging.getLogger("docuchat.uploads")
+
+# Ingestion hattı: extract -> chunk -> (embed) -> toplu insert, akış halinde.
+# PDF sayfaları dosyadan tek tek çıkarılır, chunk'lar sayfalar geldikçe
+# üretilir ve batch'ler halinde (her biri kendi kısa transaction'ında)
+# bulk_create ile yazılır; bellekte birkaç sayfa + bir batch kalır.
+# upload view'u ve management komutları aynı hattı kullanır.
+
+
+# Büyük PDF'ler sayfa aralıklarına bölünüp süreç havuzunda çıkarılır (pdfminer
+# saf Python, CPU'ya bağlı). spawn: daphne/ingest thread'leri ve açık DB
+# bağlantıları fork ile kopyalanmaz.
+_procs: Optional[ProcessPoolExecutor] = None
+_procs_lock = threading.Lock()
+
+
+# progress(olay, veri): arka plan işleri ilerlemeyi WebSocket grubuna iletir
+Progress = Optional[Callable[[str, Dict], None]]
+
+
+def iter_file_pages(fobj, name: str, progress: Progress = None) -> Iterator[Tuple[Optional[int], str]]:
+    """
+    (sayfa no, metin) çiftleri. PDF'ler dosyadan (spool ya da upload'un
+    geçici dosyası) sayfa sayfa okunur, tamamı belleğe alınmaz; diğer
+    biçimlerde tek parça ve sayfa None.
+    """
+    ext = os.path.splitext(name.lower())[1]
+    if ext == ".pdf":
+        fobj.seek(0)
+        if not fobj.read(1):
+            return
+        fobj.seek(0)
+        total = pdf_page_count(fobj)
+        workers = pdf_processes()
+        if workers > 1 and total and total >= int(getattr(settings, "INGEST_PDF_PARALLEL_MIN_PAGES", 40)):
+            texts = _iter_pdf_parallel(fobj, total, workers)
+        else:
+            texts = iter_pdf_pages(fobj)
+        for i, page in enumerate(texts, start=1):
+            yield i, page
+            if progress:
+                progress("page", {"file": name, "page": i, "pages": total})
+        return
+    data = fobj.read()
+    if data:
+        yield None, data.decode("utf-8", "ignore")
+
+
+def pdf_processes() -> int:
+    return int(getattr(settings, "INGEST_PDF_PROCESSES", 4))
+
+
+def _process_pool() -> ProcessPoolExecutor:
+    global _procs
+    with _procs_lock:
+        if _procs is None:
+            _procs = ProcessPoolExecutor(max_workers=pdf_processes(),
+                                         mp_context=multiprocessing.get_context("spawn"))
+        return _procs
+
+
+def _iter_pdf_parallel(fobj, total: int, workers: int) -> Iterator[str]:
+    """
+    Sayfa aralıkları süreç havuzunda çıkarılır, sırayla birleştirilir. Aynı
+    anda en fazla 2*workers aralık işte/bellekte. Son aralık açık uçlu:
+    katalogdaki sayfa sayısı eksikse kalan sayfalar da alınır.
+    """
+    path = getattr(fobj, "name", None)
+    # Spool ve geçici upload dosyaları yoldan açılır; bellekteki küçük upload'lar içerikle gider
+    source = path if isinstance(path, str) and os.path.isfile(path) else fobj.read()
+    # Worker başına birkaç aralık (yük dengesi), aralık başına en fazla 32 sayfa
+    step = min(32, -(-total // (workers * 4)))
+    ranges = iter([(a, a + step if a + step < total else None) for a in range(0, total, step)])
+    pool = _process_pool()
+    pending = deque(pool.submit(extract_range, source, a, b) for a, b in islice(ranges, workers * 2))
+    try:
+        while pending:
+            pages = pending.popleft().result()
+            nxt = next(ranges, None)
+            if nxt is not None:
+                pending.append(pool.submit(extract_range, source, *nxt))
+            yield from pages
+    finally:
+        for f in pending:
+            f.cancel()
+
+
+def batch_size() -> int:
+    return max(1, int(getattr(settings, "INGEST_BATCH_SIZE", 1000)))
+
+
+def _ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000.0, 1)
+
+
+class _ChunkWriter:
+    """
+    Chunk'ları batch'ler halinde yazar: cümle özellikleri + embedding + tek
+    bulk_create, her batch kendi kısa transaction'ında. Metinler tenant
+    sözlüğüyle sıkıştırılır (ilk batch'te, yoksa o batch'ten kurulur);
+    Document.text_z sayfalar geldikçe tek deflate akışının ucuna eklenir.
+    """
+
+    def __init__(self, tenant, doc: Document, report: Dict):
+        self.tenant, self.doc, self.report = tenant, doc, report
+        self.n = batch_size()
+        self.pending: List[Tuple[str, Optional[int]]] = []
+        self.text: List[str] = []
+        self.count = self.refs = self.index = 0
+        self.zdict: Optional[Tuple[int, bytes]] = None
+        self.zdoc = None  # Document metni için akış halinde compressobj
+        for k in ("chunk_ms", "embed_ms", "insert_ms"):
+            report.setdefault(k, 0.0)
+
+    def _add_ms(self, key: str, t0: float) -> None:
+        self.report[key] = round(self.report[key] + _ms(t0), 1)
+
+    def add_text(self, text: str) -> None:
+        self.text.append(text)
+
+    def add(self, piece: str, page: Optional[int]) -> None:
+        self.pending.append((piece, page))
+        if len(self.pending) >= self.n:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending and not self.text:
+            return
+        # Tenant'ta (ya da bu batch'te daha önce) aynı metinli chunk varsa sadece referans yazılır
+        hashes = [text_sha256(p) for p, _ in self.pending]
+        known = dict(Chunk.objects.filter(tenant=self.tenant, sha256__in=set(hashes))
+                     .order_by("-id").values_list("sha256", "id"))
+        new: Dict[str, int] = {}
+        for i, h in enumerate(hashes):
+            if h not in known and h not in new:
+                new[h] = i
+        pieces = [self.pending[i][0] for i in new.values()]
+
+        t0 = time.perf_counter()
+        sentences = [sentence_features(p) for p in pieces]
+        self._add_ms("chunk_ms", t0)
+
+        # Dense sinyal açıksa embedding'ler upload sırasında hesaplanır
+        t0 = time.perf_counter()
+        vectors = embed_texts(self.tenant.id, pieces) if pieces else None
+        self._add_ms("embed_ms", t0)
+
+        t0 = time.perf_counter()
+        first = self.zdoc is None
+        if first:
+            self.zdict = tenant_dictionary(self.tenant.id, pieces)
+            self.zdoc = compressor(self.zdict[1] if self.zdict else None)
+        dict_id, zdict = self.zdict or (None, None)
+        objs = [
+            Chunk(tenant=self.tenant, document=self.doc, index=self.index + i, page=self.pending[i][1],
+                  text_z=compress(self.pending[i][0], zdict), text_dict_id=dict_id, sha256=h,
+                  search=SearchVector(Value(self.pending[i][0], output_field=TextField()), config=FTS_CONFIG),
+                  sentences=sentences[j], embedding=vectors[j] if vectors is not None else None)
+            for j, (h, i) in enumerate(new.items())
+        ]
+        text_z = self.zdoc.compress("".join(self.text).encode("utf-8"))
+        tenant_id = self.tenant.id
+        with transaction.atomic():
+            if first:
+                Document.objects.filter(id=self.doc.id).update(text_dict_id=dict_id)
+            if text_z:
+                Document.objects.filter(id=self.doc.id).update(text_z=append_bytes("text_z", text_z))
+            # Postgres bulk_create id'leri döndürür (RETURNING)
+            Chunk.objects.bulk_create(objs, batch_size=self.n)
+            known.update((c.sha256, c.id) for c in objs)
+            refs = [
+                ChunkRef(document=self.doc, chunk_id=known[h], index=self.index + i, page=self.pending[i][1])
+                for i, h in enumerate(hashes) if new.get(h) != i
+            ]
+            ChunkRef.objects.bulk_create(refs, batch_size=self.n)
+            added = [(c.id, self.pending[i][0]) for c, i in zip(objs, new.values())]
+            # Yeni chunk'lar indekse delta segment olarak eklenir
+            if added:
+                transaction.on_commit(lambda: chunks_added(tenant_id, added))
+        self._add_ms("insert_ms", t0)
+        self.count += len(objs)
+        self.refs += len(refs)
+        self.index += len(self.pending)
+        self.pending, self.text = [], []
+
+    def close(self) -> None:
+        self.flush()
+        done = {"ingested_at": timezone.now()}
+        if self.zdoc is not None:
+            done["text_z"] = append_bytes("text_z", self.zdoc.flush())
+        # Bundan sonra aynı içerikli upload'lar bu dokümana referans olabilir
+        Document.objects.filter(id=self.doc.id).update(**done)
+        # Retrieval cache'i yeni nesle geçer
+        bump_corpus_version(self.tenant.id)
+
+    def abort(self) -> None:
+        discard_document(self.doc)
+
+
+def discard_document(doc: Document) -> None:
+    """
+    Yarım kalan dosya: yazılmış chunk'lar indeksten ve DB'den geri alınır. Doküman
+    tamamlanmamışsa ona referans olan kopyalar (eski kayıtlar) yarım içeriği devralmaz:
+    silinir ve iş kayıtlarında failed işaretlenir.
+    """
+    from .jobs import fail_documents
+
+    tenant_id = doc.tenant_id
+    with transaction.atomic():
+        partial = doc.ingested_at is None
+        if partial:
+            fail_documents(list(doc.duplicates.values_list("id", flat=True)), "original upload did not complete")
+        ids = delete_document(doc, promote=not partial)
+        if ids:
+            transaction.on_commit(lambda: chunks_deleted(tenant_id, ids))
+        transaction.on_commit(lambda: bump_corpus_version(tenant_id))
+
+
+def ingest_pages(tenant, filename: str, pages: Iterable[Tuple[Optional[int], str]],
+                 size: Optional[int] = None, sha256: str = "", progress: Progress = None) -> Dict:
+    """
+    Sayfa akışını chunk'lar ve yazar. Dönüş: dosya raporu
+    {"file", "document_id", "chunks", "duplicate_chunks", "<adım>_ms"...};
+    extract_ms sayfa beklemede geçen süredir. Hata olursa Document ve
+    chunk'ları silinir.
+    """
+    report: Dict = {"file": filename, "extract_ms": 0.0}
+    doc = Document.objects.create(tenant=tenant, filename=filename, size=size, sha256=sha256)
+    if progress:
+        # Süreç yarıda ölürse kurtarma (jobs.recover_jobs) yarım dokümanı bu id ile bulur
+        progress("document", {"file": filename, "document_id": doc.id})
+    writer = _ChunkWriter(tenant, doc, report)
+    it = iter(pages)
+
+    def timed_pages() -> Iterator[Tuple[Optional[int], str]]:
+        while True:
+            t0 = time.perf_counter()
+            item = next(it, None)
+            report["extract_ms"] = round(report["extract_ms"] + _ms(t0), 1)
+            if item is None:
+                return
+            writer.add_text(item[1])
+            yield item
+
+    try:
+        for piece, page in chunk_stream(timed_pages()):
+            writer.add(piece, page)
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+    report.update(document_id=doc.id, chunks=writer.count, duplicate_chunks=writer.refs)
+    return report
+
+
+def _reference(tenant, filename: str, size: Optional[int], sha256: str,
+               progress: Progress = None) -> Optional[Dict]:
+    """Aynı içerik zaten yüklüyse çıkarma yapılmaz; yeni Document asıl dokümana referans olur."""
+    original = find_duplicate(tenant, sha256)
+    if original is None:
+        return None
+    doc = add_reference(tenant, original, filename, size)
+    if progress:
+        # Referans da kaydedilir; iş yarıda ölürse kurtarma onu geri alır, tekrar çalışan iş ikinci kopya açmaz
+        progress("document", {"file": filename, "document_id": doc.id})
+    return {"file": filename, "document_id": doc.id, "duplicate_of": original.id, "chunks": 0,
+            "duplicate_chunks": 0, "extract_ms": 0.0, "chunk_ms": 0.0, "embed_ms": 0.0, "insert_ms": 0.0}
+
+
+def ingest_text(tenant, filename: str, text: str, size: Optional[int] = None) -> Dict:
+    """Çıkarılmış metin (sayfa bilgisi yok)."""
+    sha256 = text_sha256(text)
+    return (_reference(tenant, filename, size, sha256)
+            or ingest_pages(tenant, filename, [(None, text)], size=size, sha256=sha256))
+
+
+def ingest_file(tenant, fobj, name: str, size: Optional[int] = None, progress: Progress = None) -> Dict:
+    sha256 = file_sha256(fobj)
+    report = _reference(tenant, name, size, sha256, progress)
+    if report is not None:
+        log.info("Duplicate upload tenant=%s file=%s of document=%s", tenant.name, name, report["duplicate_of"])
+        return report
+    report = ingest_pages(tenant, name, iter_file_pages(fobj, name, progress), size=size, sha256=sha256,
+                          progress=progress)
+    log.info("Ingested tenant=%s file=%s chunks=%d dup_chunks=%d extract=%.0fms chunk=%.0fms embed=%.0fms "
+             "insert=%.0fms", tenant.name, name, report["chunks"], report["duplicate_chunks"],
+             report["extract_ms"], report["chunk_ms"], report["embed_ms"], report["insert_ms"])
+    return report
+
+
+def ingest_texts(tenant, docs: Iterable[Tuple[str, str]]) -> List[Dict]:
+    """Management komutları için: (dosya adı, metin) çiftleri."""
+    return [ingest_text(tenant, name, text, size=len(text)) for name, text in docs]
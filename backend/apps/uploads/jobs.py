@@ -0,0 +1,301 @@
+from __future__ import annotations
+import logging, shutil, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .ingest import discard_document, ingest_file
+from .models import Document, IngestJob
+
+log = logging.getLogger("docuchat.uploads")
+
+# Arka plan ingestion: upload dosyaları spool dizinine yazar, işi kuyruğa
+# koyar ve 202 döner. Sınırlı thread havuzu extract -> chunk -> insert ->
+# indeks adımlarını yürütür; ilerleme agent görevleriyle aynı Channels grup
+# mekanizmasıyla (agent.message) yayınlanır.
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = max(1, int(getattr(settings, "INGEST_WORKERS", 2)))
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        return _pool
+
+
+def ws_group(tenant_name: str, job_id: int) -> str:
+    return f"tenant_{tenant_name}_ingest_{job_id}"
+
+
+def spool_root() -> Path:
+    return Path(getattr(settings, "INGEST_SPOOL_DIR", "") or (Path(settings.BASE_DIR) / "ingest_spool"))
+
+
+def job_dir(job_id: int) -> Path:
+    return spool_root() / f"job_{job_id}"
+
+
+def create_job(tenant) -> IngestJob:
+    job = IngestJob.objects.create(tenant=tenant, status="queued", group="")
+    job.group = ws_group(tenant.name, job.id)
+    job.save(update_fields=["group"])
+    return job
+
+
+def accepted(job: IngestJob) -> Dict:
+    """202 gövdesi: istemci WS grubuna bağlanır ya da status_url'i yoklar."""
+    return {
+        "status": "queued",
+        "job_id": job.id,
+        "group": job.group,
+        "files": [e["name"] for e in job.files],
+        "status_url": f"/api/uploads/jobs/{job.id}",
+    }
+
+
+def spool_files(job: IngestJob, uploaded) -> List[Dict]:
+    """Upload edilen dosyaları istek bitmeden diske yazar (geçici dosyalar istekle silinir)."""
+    d = job_dir(job.id)
+    d.mkdir(parents=True, exist_ok=True)
+    entries = []
+    for i, f in enumerate(uploaded):
+        path = d / f"{i:04d}"
+        with open(path, "wb") as fh:
+            for part in f.chunks():
+                fh.write(part)
+        entries.append({"name": f.name, "size": f.size, "status": "queued", "spool": path.name})
+    return entries
+
+
+def _send(group: str, tp: str, data: Dict) -> None:
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        async_to_sync(layer.group_send)(group, {"type": "agent.message", "payload": {"type": tp, "data": data}})
+    except Exception:
+        # İlerleme yayını başarısız olsa da ingestion devam eder; durum endpoint'i DB'den okur
+        log.warning("Ingest progress send failed group=%s", group, exc_info=True)
+
+
+def submit(job_id: int) -> None:
+    _executor().submit(run_job, job_id)
+
+
+def resume_queued(older_than: float = 0.0) -> int:
+    """
+    `older_than` saniyedir bekleyen queued işleri (ör. recover_ingest_jobs --no-run ile
+    kuyruğa geri alınanlar) bu sürecin havuzuna verir. Birden çok worker aynı işi
+    verebilir; run_job'daki sahiplenme işi tek kez çalıştırır.
+    """
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    ids = list(IngestJob.objects.filter(status="queued", updated_at__lte=cutoff).values_list("id", flat=True))
+    for job_id in ids:
+        submit(job_id)
+    if ids:
+        log.info("Resumed %d queued ingest job(s)", len(ids))
+    return len(ids)
+
+
+def resume_interval() -> float:
+    return float(getattr(settings, "INGEST_RESUME_INTERVAL", 60))
+
+
+def start_resumer() -> None:
+    """Sunucu başlarken (asgi.py): queued işler hemen, sonra INGEST_RESUME_INTERVAL'de bir alınır."""
+    interval = resume_interval()
+
+    def loop() -> None:
+        older_than = 0.0
+        while True:
+            try:
+                close_old_connections()
+                resume_queued(older_than)
+            except Exception:
+                log.warning("Resuming queued ingest jobs failed", exc_info=True)
+            finally:
+                connection.close()
+            if interval <= 0:
+                return
+            # Upload'ın kendi submit ettiği (havuzda sırası gelmemiş) işler hemen çalınmaz
+            older_than = interval
+            time.sleep(interval)
+
+    threading.Thread(target=loop, name="ingest-resume", daemon=True).start()
+
+
+def run_job(job_id: int) -> None:
+    close_old_connections()
+    # queued -> running atomik: aynı iş iki worker'da ya da iki kez çalışmaz
+    claimed = IngestJob.objects.filter(id=job_id, status="queued").update(status="running",
+                                                                          updated_at=timezone.now())
+    if not claimed:
+        connection.close()
+        return
+    job = IngestJob.objects.select_related("tenant").get(id=job_id)
+    try:
+        _run(job)
+    except Exception as e:
+        log.exception("Ingest job failed id=%s", job_id)
+        job.status, job.error = "failed", str(e)
+        job.save(update_fields=["status", "error", "files", "updated_at"])
+        _send(job.group, "status", {"job_id": job.id, "status": job.status, "error": job.error})
+    finally:
+        shutil.rmtree(job_dir(job_id), ignore_errors=True)
+        connection.close()
+
+
+def progress_interval() -> float:
+    return float(getattr(settings, "INGEST_PROGRESS_INTERVAL", 2.0))
+
+
+def _run(job: IngestJob) -> None:
+    tenant = job.tenant
+    # Durum run_job'da sahiplenirken running yapıldı
+    _send(job.group, "status", {"job_id": job.id, "status": job.status})
+
+    interval = progress_interval()
+    for i, entry in enumerate(job.files):
+        # Kurtarılan işte bitmiş/başarısız dosyalar tekrar işlenmez
+        if entry["status"] != "queued":
+            continue
+        name = entry["name"]
+        entry["status"] = "running"
+        job.save(update_fields=["files", "updated_at"])
+        _send(job.group, "file", {"job_id": job.id, "index": i, "file": name, "status": "running"})
+        saved = time.monotonic()
+
+        def progress(event: str, data: Dict, i=i, entry=entry) -> None:
+            nonlocal saved
+            if event == "document":
+                entry["document_id"] = data["document_id"]
+                job.save(update_fields=["files", "updated_at"])
+                return
+            if event == "page":
+                # Sayfa olayları Channels'tan anında gider; DB'ye en fazla INGEST_PROGRESS_INTERVAL'de bir yazılır
+                entry["pages"], entry["pages_done"] = data.get("pages"), data["page"]
+                if time.monotonic() - saved >= interval:
+                    job.save(update_fields=["files", "updated_at"])
+                    saved = time.monotonic()
+            _send(job.group, event, {"job_id": job.id, "index": i, **data})
+
+        try:
+            with open(job_dir(job.id) / entry["spool"], "rb") as fh:
+                report = ingest_file(tenant, fh, name, size=entry.get("size"), progress=progress)
+            entry.update(status="done", document_id=report["document_id"], chunks=report["chunks"],
+                         duplicate_chunks=report["duplicate_chunks"], duplicate_of=report.get("duplicate_of"),
+                         timings={k: v for k, v in report.items() if k.endswith("_ms")})
+        except Exception as e:
+            log.exception("Ingest failed job=%s file=%s", job.id, name)
+            entry.pop("document_id", None)
+            entry.update(status="failed", error=str(e))
+        job.save(update_fields=["files", "updated_at"])
+        _send(job.group, "file", {"job_id": job.id, "index": i, "file": name, **_public(entry)})
+
+    _finish(job)
+    job.save(update_fields=["status", "error", "updated_at"])
+    _send(job.group, "done", {"job_id": job.id, "status": job.status, "error": job.error})
+
+
+def _finish(job: IngestJob) -> None:
+    failed = sum(e["status"] == "failed" for e in job.files)
+    job.status = "failed" if failed == len(job.files) and failed else "done"
+    job.error = f"{failed} of {len(job.files)} file(s) failed" if failed else ""
+
+
+def fail_documents(doc_ids: List[int], reason: str) -> None:
+    """Silinen dokümanları üreten dosya kayıtları failed olur (iş durumu yeniden hesaplanır)."""
+    if not doc_ids:
+        return
+    ids = set(doc_ids)
+    for doc_id in doc_ids:
+        for job in IngestJob.objects.filter(files__contains=[{"document_id": doc_id}]):
+            for entry in job.files:
+                if entry.get("document_id") in ids:
+                    entry.pop("document_id")
+                    entry.update(status="failed", error=reason)
+            if job.status not in ("queued", "running"):
+                _finish(job)
+            job.save(update_fields=["status", "error", "files", "updated_at"])
+            _send(job.group, "status", {"job_id": job.id, "status": job.status, "error": job.error})
+
+
+def stale_after() -> float:
+    return float(getattr(settings, "INGEST_STALE_AFTER", 600))
+
+
+def recover_jobs(older_than: Optional[float] = None, requeue: bool = True) -> Dict:
+    """
+    Süreç ölünce queued/running kalan işler (updated_at `older_than` saniyeden eski;
+    çalışan işler ilerlemeyle bunu tazeler): yarıda kalan dosyanın dokümanı geri
+    alınır, bitmemiş dosyalar spool'da duruyorsa iş tekrar queued yapılır (requeue),
+    yoksa failed. Sonra bitmiş ya da silinmiş işlerin spool dizinleri temizlenir.
+    Dönüş: {"requeued": [iş id'leri], "failed": n, "spool_removed": n}.
+    """
+    if older_than is None:
+        older_than = stale_after()
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    requeued, failed = [], 0
+    for job in IngestJob.objects.filter(status__in=("queued", "running"), updated_at__lte=cutoff):
+        pending = 0
+        for entry in job.files:
+            if entry["status"] not in ("queued", "running"):
+                continue
+            if entry["status"] == "running":
+                doc = Document.objects.filter(id=entry.pop("document_id", None), tenant_id=job.tenant_id).first()
+                if doc is not None:
+                    discard_document(doc)
+                for k in ("pages", "pages_done"):
+                    entry.pop(k, None)
+            if requeue and (job_dir(job.id) / entry["spool"]).exists():
+                entry["status"] = "queued"
+                pending += 1
+            else:
+                entry.update(status="failed", error="interrupted")
+        if pending:
+            job.status = "queued"
+            requeued.append(job.id)
+        else:
+            _finish(job)
+            failed += 1
+        job.save(update_fields=["status", "error", "files", "updated_at"])
+        log.warning("Recovered ingest job id=%s status=%s", job.id, job.status)
+
+    removed = 0
+    root = spool_root()
+    if root.is_dir():
+        ids = {int(p.name[4:]): p for p in root.glob("job_*") if p.name[4:].isdigit()}
+        active = set(IngestJob.objects.filter(id__in=ids, status__in=("queued", "running"))
+                     .values_list("id", flat=True))
+        for job_id, path in ids.items():
+            if job_id not in active:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+    return {"requeued": requeued, "failed": failed, "spool_removed": removed}
+
+
+def _public(entry: Dict) -> Dict:
+    return {k: v for k, v in entry.items() if k != "spool"}
+
+
+def job_payload(job: IngestJob) -> Dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "group": job.group,
+        "files": [_public(e) for e in job.files],
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from apps.uploads import sessions
+
+
+class Command(BaseCommand):
+    help = ("Abort resumable upload sessions idle for longer than UPLOAD_SESSION_TTL and delete their files. "
+            "Run it periodically (cron); new sessions also trigger it.")
+
+    def handle(self, *args, **kwargs):
+        n = sessions.expire_sessions()
+        self.stdout.write(self.style.SUCCESS(f"Expired {n} upload session(s)"))
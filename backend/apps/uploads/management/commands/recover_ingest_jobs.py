@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from apps.uploads import jobs
+
+
+class Command(BaseCommand):
+    help = ("Recover ingest jobs left queued/running by a dead worker: roll back half-written documents, "
+            "re-run unfinished files from the spool (or mark them failed) and remove orphaned spool dirs. "
+            "Run before starting workers, or with --older-than while they are up.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=float,
+                            help="Only jobs not updated for this many seconds (default INGEST_STALE_AFTER; "
+                                 "0 when no worker is running)")
+        parser.add_argument("--fail", action="store_true", help="Mark unfinished files failed instead of re-running")
+        parser.add_argument("--no-run", action="store_true",
+                            help="Only requeue; do not run the recovered jobs in this process")
+
+    def handle(self, *args, **opts):
+        result = jobs.recover_jobs(opts["older_than"], requeue=not opts["fail"])
+        self.stdout.write(f"requeued={len(result['requeued'])} failed={result['failed']} "
+                          f"spool_removed={result['spool_removed']}")
+        if opts["no_run"]:
+            return
+        for job_id in result["requeued"]:
+            jobs.run_job(job_id)
+            self.stdout.write(self.style.SUCCESS(f"Job {job_id} re-run"))
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.7 on 2026-10-18 01:34
+
+import pgvector.django
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0001_initial'),
+    ]
+
+    operations = [
+        pgvector.django.VectorExtension(),
+        migrations.AddField(
+            model_name='chunk',
+            name='embedding',
+            field=pgvector.django.VectorField(blank=True, dimensions=128, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='chunk',
+            index=pgvector.django.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='chunk_embedding_hnsw', opclasses=['vector_cosine_ops']),
+        ),
+    ]
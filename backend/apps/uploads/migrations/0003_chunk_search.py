@@ -0,0 +1,31 @@
+# Generated by Django 5.0.7 on 2026-10-18 01:36
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0002_chunk_embedding'),
+    ]
+
+    operations = [
+        # Düz tsvector kolonu (generated değil): metin sonradan sıkıştırılıp düz kolon
+        # kaldırılacağı için ingestion kolonu kendisi yazar. Mevcut satırlar burada
+        # doldurulur, GIN indeksi doldurduktan sonra tek seferde kurulur.
+        migrations.AddField(
+            model_name='chunk',
+            name='search',
+            field=django.contrib.postgres.search.SearchVectorField(null=True),
+        ),
+        migrations.RunSQL(
+            "UPDATE uploads_chunk SET search = to_tsvector('simple'::regconfig, COALESCE(text, ''))",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='chunk',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search'], name='chunk_search_gin'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.0.7 on 2026-10-18 01:50
+
+import re
+
+from django.db import migrations, models
+
+# apps.rag.quotes.sentence_features'ın bu migration için dondurulmuş kopyası: uygulama
+# kodu değişse de backfill aynı biçimi üretir. Cümle başına
+# [başlangıç, bitiş, tarih, yıl, sürüm, uzunluk cezası].
+_SENT_SPLIT = re.compile(r'(?<=[\.!?])\s+|\n+')
+_DATE = re.compile(r'\b\d{1,2}\.\d{1,2}\.\d{4}\b')
+_YEAR = re.compile(r'\b20\d{2}\b')
+_VERSION = re.compile(r'\\b\\d+(?:\\.\\d+){1,3}\\b')
+
+
+def sentence_spans(text):
+    spans = []
+    text = text or ''
+
+    def add(a, b):
+        s = text[a:b]
+        stripped = s.strip()
+        if stripped:
+            lead = len(s) - len(s.lstrip())
+            spans.append((a + lead, a + lead + len(stripped)))
+
+    pos = 0
+    for m in _SENT_SPLIT.finditer(text):
+        add(pos, m.start())
+        pos = m.end()
+    add(pos, len(text))
+    return spans
+
+
+def sentence_features(text):
+    out = []
+    for a, b in sentence_spans(text):
+        s = text[a:b]
+        out.append([a, b, int(bool(_DATE.search(s))), int(bool(_YEAR.search(s))),
+                    int(bool(_VERSION.search(s))), min(len(s) / 500.0, 0.5)])
+    return out
+
+
+def backfill_sentences(apps, schema_editor):
+    Chunk = apps.get_model('uploads', 'Chunk')
+    batch = []
+    for c in Chunk.objects.filter(sentences__isnull=True).only('id', 'text').iterator(chunk_size=2000):
+        c.sentences = sentence_features(c.text or '')
+        batch.append(c)
+        if len(batch) >= 2000:
+            Chunk.objects.bulk_update(batch, ['sentences'])
+            batch = []
+    if batch:
+        Chunk.objects.bulk_update(batch, ['sentences'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0003_chunk_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunk',
+            name='sentences',
+            field=models.JSONField(blank=True, default=None, null=True),
+        ),
+        migrations.RunPython(backfill_sentences, migrations.RunPython.noop),
+    ]
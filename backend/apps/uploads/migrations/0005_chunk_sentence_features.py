@@ -0,0 +1,33 @@
+import importlib
+
+from django.db import migrations
+
+# Son biçim doğrudan 0004'te yazılır; burada sadece 0004'ün eski sürümüyle
+# ([başlangıç, bitiş, statik skor]) doldurulmuş satırlar dönüştürülür. Yeni
+# kurulumda hiçbir satır eşleşmez, tablo ikinci kez yazılmaz.
+sentence_features = importlib.import_module('apps.uploads.migrations.0004_chunk_sentences').sentence_features
+
+
+def convert_legacy_sentences(apps, schema_editor):
+    Chunk = apps.get_model('uploads', 'Chunk')
+    legacy = Chunk.objects.filter(sentences__0__2__isnull=False, sentences__0__3__isnull=True)
+    batch = []
+    for c in legacy.only('id', 'text').iterator(chunk_size=2000):
+        c.sentences = sentence_features(c.text or '')
+        batch.append(c)
+        if len(batch) >= 2000:
+            Chunk.objects.bulk_update(batch, ['sentences'])
+            batch = []
+    if batch:
+        Chunk.objects.bulk_update(batch, ['sentences'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0004_chunk_sentences'),
+    ]
+
+    operations = [
+        migrations.RunPython(convert_legacy_sentences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.0.7 on 2026-10-18 02:02
+
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def hash_chunks(apps, schema_editor):
+    # Mevcut chunk'lar hash'lenir (yeni upload'lar bunlarla tekilleşir); eski kopyalar birleştirilmez
+    Chunk = apps.get_model('uploads', 'Chunk')
+    batch = []
+    for c in Chunk.objects.only('id', 'text').iterator(chunk_size=2000):
+        c.sha256 = hashlib.sha256((c.text or '').encode('utf-8')).hexdigest()
+        batch.append(c)
+        if len(batch) >= 2000:
+            Chunk.objects.bulk_update(batch, ['sha256'])
+            batch = []
+    if batch:
+        Chunk.objects.bulk_update(batch, ['sha256'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0006_ingestjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkRef',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('page', models.IntegerField(blank=True, default=None, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='chunk',
+            name='sha256',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='uploads.document'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='chunk',
+            index=models.Index(fields=['tenant', 'sha256'], name='uploads_chu_tenant__e63fd0_idx'),
+        ),
+        migrations.AddField(
+            model_name='chunkref',
+            name='chunk',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='refs', to='uploads.chunk'),
+        ),
+        migrations.AddField(
+            model_name='chunkref',
+            name='document',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunk_refs', to='uploads.document'),
+        ),
+        migrations.RunPython(hash_chunks, migrations.RunPython.noop),
+    ]
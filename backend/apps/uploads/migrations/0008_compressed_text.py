@@ -0,0 +1,58 @@
+# Generated by Django 5.0.7 on 2026-10-18 02:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0007_content_hashes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TextDictionary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='text_dictionaries', to='uploads.tenant')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='chunk',
+            name='text_z',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='text_z',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+        migrations.AddField(
+            model_name='chunk',
+            name='text_dict',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='+', to='uploads.textdictionary'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='text_dict',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='+', to='uploads.textdictionary'),
+        ),
+        # 0003'ün eski sürümünü (generated search kolonu) uygulamış veritabanları: ifade
+        # düşürülür, kolon ve GIN indeksi olduğu gibi kalır (tablo yeniden yazılmaz)
+        migrations.RunSQL(
+            """
+            DO $$
+            BEGIN
+                IF EXISTS (SELECT 1 FROM information_schema.columns
+                           WHERE table_name = 'uploads_chunk' AND column_name = 'search'
+                             AND is_generated = 'ALWAYS') THEN
+                    ALTER TABLE uploads_chunk ALTER COLUMN search DROP EXPRESSION;
+                END IF;
+            END $$;
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,74 @@
+import zlib
+from collections import Counter
+
+from django.db import migrations
+
+SAMPLE = 2000
+BATCH = 2000
+
+# apps.uploads.compression'ın bu migration için dondurulmuş kopyası. Saklanan biçim
+# (başlıksız deflate, isteğe bağlı zdict) uygulamanın decompress'i ile okunabilir kalmalı.
+DICT_SIZE = 32 * 1024
+LEVEL = 6
+_WBITS = -15
+
+
+def build_dictionary(samples, size=DICT_SIZE):
+    counts = Counter()
+    for text in samples:
+        words = text.split()
+        for n in (1, 2, 3):
+            for i in range(len(words) - n + 1):
+                counts[' '.join(words[i:i + n])] += 1
+    ranked = sorted(((c * len(g), g) for g, c in counts.items() if c > 1), reverse=True)
+    parts, used = [], 0
+    for _, g in ranked:
+        b = (g + ' ').encode('utf-8')
+        if used + len(b) > size:
+            break
+        parts.append(b)
+        used += len(b)
+    return b''.join(reversed(parts))
+
+
+def compress(text, zdict=None):
+    c = zlib.compressobj(LEVEL, zlib.DEFLATED, _WBITS, zdict=zdict) if zdict else \
+        zlib.compressobj(LEVEL, zlib.DEFLATED, _WBITS)
+    return c.compress(text.encode('utf-8')) + c.flush()
+
+
+def compress_texts(apps, schema_editor):
+    # Tenant başına son chunk'lardan sözlük kurulur; chunk ve doküman metinleri onunla sıkıştırılır
+    Tenant = apps.get_model('uploads', 'Tenant')
+    TextDictionary = apps.get_model('uploads', 'TextDictionary')
+    Chunk = apps.get_model('uploads', 'Chunk')
+    Document = apps.get_model('uploads', 'Document')
+    for tenant in Tenant.objects.all():
+        samples = [t or '' for t in Chunk.objects.filter(tenant=tenant).order_by('-id')
+                   .values_list('text', flat=True)[:SAMPLE]]
+        data = build_dictionary(samples) if samples else b''
+        zdict = TextDictionary.objects.create(tenant=tenant, data=data) if data else None
+        zbytes = bytes(zdict.data) if zdict else None
+
+        for model in (Chunk, Document):
+            batch = []
+            for row in model.objects.filter(tenant=tenant).only('id', 'text').iterator(chunk_size=BATCH):
+                row.text_z, row.text_dict = compress(row.text or '', zbytes), zdict
+                batch.append(row)
+                if len(batch) >= BATCH:
+                    model.objects.bulk_update(batch, ['text_z', 'text_dict'])
+                    batch = []
+            if batch:
+                model.objects.bulk_update(batch, ['text_z', 'text_dict'])
+
+
+class Migration(migrations.Migration):
+    # Veri taşıma ayrı migration'da: güncellenen satırlar aynı transaction'da DDL'i engeller
+
+    dependencies = [
+        ('uploads', '0008_compressed_text'),
+    ]
+
+    operations = [
+        migrations.RunPython(compress_texts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0009_compress_existing_text'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='chunk',
+            name='text',
+        ),
+        migrations.RemoveField(
+            model_name='document',
+            name='text',
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0011_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='ingested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        # Mevcut dokümanlar tamamlanmış sayılır
+        migrations.RunSQL(
+            "UPDATE uploads_document SET ingested_at = created_at",
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -1,4 +1,14 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from pgvector.django import VectorField, HnswIndex
+
+from .compression import decompress
+
+# Yerel LSA embedding boyutu (apps/rag/embeddings.py); değişirse migration gerekir
+EMBEDDING_DIM = 128
+# Postgres FTS (RETRIEVAL_BACKEND=postgres) metin yapılandırması; çok dilli korpus için stemming yok
+FTS_CONFIG = "simple"
 
 class Tenant(models.Model):
     name = models.CharField(max_length=150, unique=True)
@@ -8,25 +18,68 @@ class Tenant(models.Model):
     def __str__(self):
         return self.name
 
+class TextDictionary(models.Model):
+    """Tenant'ın metin sıkıştırma ön-sözlüğü (zlib zdict); satırlar değişmez (bkz. compression.py)."""
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='text_dictionaries')
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
 class Document(models.Model):
     tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='documents')
     filename = models.CharField(max_length=255)
-    text = models.TextField(blank=True, default="")
+    # Çıkarılan tam metin, sayfalar geldikçe tek deflate akışı olarak eklenir
+    text_z = models.BinaryField(default=b"", blank=True)
+    text_dict = models.ForeignKey(TextDictionary, null=True, blank=True, on_delete=models.RESTRICT, related_name='+')
     size = models.IntegerField(null=True, blank=True)
+    # Yüklenen içeriğin SHA-256'sı; aynı içerik tekrar gelirse kopya sadece referans olur (bkz. dedup.py)
+    sha256 = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    duplicate_of = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='duplicates')
+    # Ingestion bitince set edilir; yazılmakta olan doküman tekilleştirmede asıl sayılmaz
+    ingested_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.filename} ({self.tenant.name})"
 
+    @property
+    def text(self) -> str:
+        return decompress(self.text_z, self.text_dict_id)
+
 class Chunk(models.Model):
     tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='chunks')
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='chunks')
     index = models.IntegerField()
     page = models.IntegerField(null=True, blank=True, default=None)
-    text = models.TextField()
+    # Sıkıştırılmış metin; açması `text` (sadece gerektiğinde, bkz. compression.py)
+    text_z = models.BinaryField(default=b"")
+    text_dict = models.ForeignKey(TextDictionary, null=True, blank=True, on_delete=models.RESTRICT, related_name='+')
+    # Metnin SHA-256'sı: tenant içinde aynı chunk bir kez saklanır/indekslenir
+    sha256 = models.CharField(max_length=64, blank=True, default="")
+    # Upload'da hesaplanan cümle sınırları + sorudan bağımsız quote özellikleri (apps/rag/quotes.py)
+    sentences = models.JSONField(null=True, blank=True, default=None)
+    embedding = VectorField(dimensions=EMBEDDING_DIM, null=True, blank=True)
+    # Metin sıkıştırılmış olduğundan tsvector insert sırasında düz metinden hesaplanır
+    search = SearchVectorField(null=True)
 
     class Meta:
-        indexes = [models.Index(fields=['tenant','document','index'])]
+        indexes = [
+            models.Index(fields=['tenant','document','index']),
+            models.Index(fields=['tenant','sha256']),
+            GinIndex(name='chunk_search_gin', fields=['search']),
+            HnswIndex(name='chunk_embedding_hnsw', fields=['embedding'], m=16, ef_construction=64,
+                      opclasses=['vector_cosine_ops']),
+        ]
+
+    @property
+    def text(self) -> str:
+        return decompress(self.text_z, self.text_dict_id)
+
+class ChunkRef(models.Model):
+    """Başka bir dokümanda zaten saklı olan chunk'ın bu dokümandaki konumu (içerik kopyalanmaz)."""
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='chunk_refs')
+    chunk = models.ForeignKey(Chunk, on_delete=models.CASCADE, related_name='refs')
+    index = models.IntegerField()
+    page = models.IntegerField(null=True, blank=True, default=None)
 
 class Report(models.Model):
     tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='reports')
@@ -42,3 +95,24 @@ class Task(models.Model):
     steps = models.JSONField(default=list, blank=True)
     report = models.ForeignKey(Report, null=True, blank=True, on_delete=models.SET_NULL, related_name='task')
     created_at = models.DateTimeField(auto_now_add=True)
+
+class IngestJob(models.Model):
+    """Arka plan ingestion işi (upload 202 döner); ilerleme Channels grubuna da yayınlanır."""
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='ingest_jobs')
+    status = models.CharField(max_length=50, default="queued")  # queued | running | done | failed
+    group = models.CharField(max_length=255)  # ws group name
+    files = models.JSONField(default=list, blank=True)  # dosya başına durum, sayfa ilerlemesi, süreler
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class UploadSession(models.Model):
+    """Devam ettirilebilir upload: init -> offset'li PUT parçaları -> finalize (bkz. sessions.py)."""
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    received = models.JSONField(default=list, blank=True)  # birleştirilmiş [başlangıç, bitiş) aralıkları
+    status = models.CharField(max_length=50, default="open")  # open | finalized | aborted
+    job = models.ForeignKey(IngestJob, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
@@ -0,0 +1,53 @@
+from __future__ import annotations
+import io
+from typing import Iterator, List, Optional, Union
+
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import resolve1
+
+# Saf pdfminer yardımcıları. Django'ya bağımlı değildir: ProcessPoolExecutor
+# (spawn) worker'ları bu modülü ayarsız içe aktarır (bkz. ingest.iter_file_pages).
+
+
+def pdf_page_count(fp) -> Optional[int]:
+    try:
+        fp.seek(0)
+        doc = PDFDocument(PDFParser(fp))
+        return int(resolve1(doc.catalog["Pages"])["Count"])
+    except Exception:
+        return None
+    finally:
+        fp.seek(0)
+
+
+def iter_pdf_pages(fp, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+    """
+    Sayfa sayfa metin (pdfminer extract_text ile aynı çıktı, sayfa sonu \f dahil);
+    birleşimi extract_text(fp) ile birebir aynıdır. [start, stop) 0 tabanlı
+    sayfa aralığı; aralık dışındaki sayfaların içeriği işlenmez.
+    """
+    rsrcmgr = PDFResourceManager(caching=True)
+    with io.StringIO() as out:
+        device = TextConverter(rsrcmgr, out, codec="utf-8", laparams=LAParams())
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+        for i, page in enumerate(PDFPage.get_pages(fp, caching=True)):
+            if i < start:
+                continue
+            if stop is not None and i >= stop:
+                break
+            interpreter.process_page(page)
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate(0)
+
+
+def extract_range(source: Union[str, bytes], start: int, stop: Optional[int]) -> List[str]:
+    """Worker süreci: dosya yolu (spool/geçici dosya) ya da küçük upload'lar için içerik."""
+    fp = open(source, "rb") if isinstance(source, str) else io.BytesIO(source)
+    with fp:
+        return list(iter_pdf_pages(fp, start, stop))
@@ -0,0 +1,187 @@
+from __future__ import annotations
+import logging, os, shutil
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, List
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import jobs
+from .models import IngestJob, UploadSession
+
+log = logging.getLogger("docuchat.uploads")
+
+# Devam ettirilebilir upload: init dosyayı spool altında bildirilen boyutta
+# (seyrek) açar; her PUT parçası doğrudan kendi offset'ine pwrite edilir, yani
+# birleştirme adımı ve ek kopya yoktur. finalize dosyayı os.replace ile iş
+# dizinine taşır ve ingestion'ı hemen kuyruğa koyar. Kopan bağlantıda istemci
+# GET ile alınmış aralıkları öğrenip eksik parçalardan devam eder.
+
+_BLOCK = 1 << 20
+
+
+class UploadError(Exception):
+    def __init__(self, message: str, status: int = 400, **extra):
+        super().__init__(message)
+        self.status, self.extra = status, extra
+
+
+def part_size() -> int:
+    return int(getattr(settings, "UPLOAD_PART_SIZE", 8 * 1024 * 1024))
+
+
+def max_size() -> int:
+    return int(getattr(settings, "UPLOAD_MAX_SIZE", 2 * 1024 ** 3))
+
+
+def session_path(session: UploadSession) -> Path:
+    return jobs.spool_root() / "sessions" / f"{session.id:08d}"
+
+
+def merge_range(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+    out: List[List[int]] = []
+    for a, b in sorted([*ranges, [start, end]]):
+        if out and a <= out[-1][1]:
+            out[-1][1] = max(out[-1][1], b)
+        else:
+            out.append([a, b])
+    return out
+
+
+def missing_ranges(session: UploadSession) -> List[List[int]]:
+    gaps, pos = [], 0
+    for a, b in session.received:
+        if a > pos:
+            gaps.append([pos, a])
+        pos = max(pos, b)
+    if pos < session.size:
+        gaps.append([pos, session.size])
+    return gaps
+
+
+def expire_sessions() -> int:
+    """UPLOAD_SESSION_TTL'i aşan açık oturumları ve dosyalarını siler."""
+    ttl = int(getattr(settings, "UPLOAD_SESSION_TTL", 86400))
+    stale = list(UploadSession.objects.filter(status="open", updated_at__lt=timezone.now() - timedelta(seconds=ttl)))
+    for s in stale:
+        abort(s)
+    return len(stale)
+
+
+def create(tenant, filename: str, size: int) -> UploadSession:
+    if not filename:
+        raise UploadError("filename is required")
+    if size < 0 or size > max_size():
+        raise UploadError(f"size must be between 0 and {max_size()} bytes", status=413)
+    expire_sessions()
+    session = UploadSession.objects.create(tenant=tenant, filename=os.path.basename(filename), size=size)
+    path = session_path(session)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as fh:
+        fh.truncate(size)
+    return session
+
+
+def write_part(session: UploadSession, offset: int, stream, length: int) -> UploadSession:
+    """Gövdeyi bloklar halinde okuyup dosyaya offset'inden itibaren yazar; aynı parça tekrar gönderilebilir."""
+    if session.status != "open":
+        raise UploadError(f"session is {session.status}", status=409)
+    if length <= 0:
+        raise UploadError("empty part")
+    if length > part_size():
+        raise UploadError(f"part larger than {part_size()} bytes", status=413)
+    if offset < 0 or offset + length > session.size:
+        raise UploadError("part outside of declared size", status=416)
+
+    try:
+        fd = os.open(session_path(session), os.O_WRONLY)
+    except FileNotFoundError:
+        # Bu arada finalize dosyayı iş dizinine taşıdı ya da oturum iptal edildi
+        session.refresh_from_db(fields=["status"])
+        raise UploadError(f"session is {session.status}" if session.status != "open" else "session file is missing",
+                          status=409)
+    written = 0
+    try:
+        while written < length:
+            block = stream.read(min(_BLOCK, length - written))
+            if not block:
+                break
+            os.pwrite(fd, block, offset + written)
+            written += len(block)
+    finally:
+        os.close(fd)
+
+    # Eşzamanlı parçalar aynı satırı günceller: aralık birleştirme kilit altında
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(id=session.id)
+        # Yazma sırasında finalize/abort olduysa parça kabul edilmez
+        if session.status != "open":
+            raise UploadError(f"session is {session.status}", status=409)
+        if written:
+            session.received = merge_range(session.received, offset, offset + written)
+            session.save(update_fields=["received", "updated_at"])
+    if written < length:
+        raise UploadError("incomplete part body", status=400, received=session.received)
+    return session
+
+
+def finalize(session: UploadSession) -> IngestJob:
+    """Dosya eksiksizse iş dizinine taşınır ve ingestion başlatılır; tekrar çağrı aynı işi döner."""
+    moved = None
+    try:
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(id=session.id)
+            if session.status == "finalized" and session.job_id:
+                return session.job
+            if session.status != "open":
+                raise UploadError(f"session is {session.status}", status=409)
+            gaps = missing_ranges(session)
+            if gaps:
+                raise UploadError("upload incomplete", status=409, missing=gaps)
+
+            job = jobs.create_job(session.tenant)
+            d = jobs.job_dir(job.id)
+            d.mkdir(parents=True, exist_ok=True)
+            moved = (session_path(session), d / "0000")
+            os.replace(*moved)
+            job.files = [{"name": session.filename, "size": session.size, "status": "queued", "spool": "0000"}]
+            job.save(update_fields=["files"])
+            session.status, session.job = "finalized", job
+            session.save(update_fields=["status", "job", "updated_at"])
+            transaction.on_commit(lambda: jobs.submit(job.id))
+    except BaseException:
+        # Transaction geri alındı (iş satırı yok, oturum açık): dosya oturuma geri taşınır
+        if moved is not None:
+            os.replace(moved[1], moved[0])
+            shutil.rmtree(moved[1].parent, ignore_errors=True)
+        raise
+    log.info("Upload session finalized tenant=%s session=%s job=%s size=%d",
+             session.tenant_id, session.id, job.id, session.size)
+    return job
+
+
+def abort(session: UploadSession) -> None:
+    if session.status == "open":
+        session.status = "aborted"
+        session.save(update_fields=["status", "updated_at"])
+    try:
+        os.remove(session_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def payload(session: UploadSession) -> Dict:
+    return {
+        "session_id": session.id,
+        "filename": session.filename,
+        "size": session.size,
+        "part_size": part_size(),
+        "received": session.received,
+        "received_bytes": sum(b - a for a, b in session.received),
+        "status": session.status,
+        "job_id": session.job_id,
+        "upload_url": f"/api/uploads/sessions/{session.id}",
+        "finalize_url": f"/api/uploads/sessions/{session.id}/finalize",
+    }
@@ -1,8 +1,13 @@
 from django.urls import path
-from .views import upload, list_uploads, delete_upload
+from .views import (upload, list_uploads, delete_upload, ingest_job, create_upload_session, upload_session,
+                    finalize_upload_session)
 
 urlpatterns = [
     path("uploads/upload", upload),
     path("uploads/list", list_uploads),
     path("uploads/<int:doc_id>", delete_upload),
+    path("uploads/jobs/<int:job_id>", ingest_job),
+    path("uploads/sessions", create_upload_session),
+    path("uploads/sessions/<int:session_id>", upload_session),
+    path("uploads/sessions/<int:session_id>/finalize", finalize_upload_session),
 ]
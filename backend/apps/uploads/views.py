@@ -1,40 +1,20 @@
-import io, os, logging
+import logging
 from django.db import transaction
 from rest_framework.decorators import api_view, parser_classes
 from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework import status
-from django.conf import settings
-from pdfminer.high_level import extract_text
 from markdown_it import MarkdownIt
-from .models import Document, Chunk
+from apps.rag.corpus import bump_corpus_version
+from apps.rag.index import chunks_deleted
+from django.conf import settings
+from . import jobs, sessions
+from .dedup import delete_document
+from .ingest import ingest_file
+from .models import Document, IngestJob, UploadSession
 
 log = logging.getLogger("docuchat.uploads")
 
-def extract_text_from_file(fobj, name: str) -> str:
-    ext = os.path.splitext(name.lower())[1]
-    data = fobj.read()
-    if not data:
-        return ""
-    if ext == ".pdf":
-        return extract_text(io.BytesIO(data)) or ""
-    elif ext in [".md", ".markdown"]:
-        return data.decode("utf-8", "ignore")
-    else:
-        return data.decode("utf-8", "ignore")
-
-def chunk_text(text: str, size: int, overlap: int):
-    chunks = []
-    s = 0
-    n = len(text)
-    if n == 0:
-        return []
-    while s < n:
-        e = min(n, s + size)
-        chunks.append(text[s:e])
-        s = e - overlap if (e - overlap) > s else e
-    return chunks
-
 @api_view(["GET"])
 def list_uploads(request):
     tenant = request.tenant
@@ -42,7 +22,8 @@ def list_uploads(request):
     data = [{
         "id": d.id, "filename": d.filename,
         "created_at": d.created_at.isoformat() if d.created_at else None,
-        "size": d.size
+        "size": d.size,
+        "duplicate_of": d.duplicate_of_id,
     } for d in qs]
     return Response({"items": data})
 
@@ -53,8 +34,12 @@ def delete_upload(request, doc_id: int):
     if not doc:
         return Response({"detail": "not found"}, status=status.HTTP_404_NOT_FOUND)
     with transaction.atomic():
-        Chunk.objects.filter(document=doc).delete()
-        doc.delete()
+        # Başka dokümanların referans verdiği içerik onlara devredilir; sadece sahipsiz chunk'lar silinir
+        chunk_ids = delete_document(doc)
+        # İndekste tombstone'la (commit sonrası)
+        transaction.on_commit(lambda: chunks_deleted(tenant.id, chunk_ids))
+        # Retrieval cache'i bu tenant için geçersiz (yeni korpus nesli)
+        transaction.on_commit(lambda: bump_corpus_version(tenant.id))
     return Response({"status": "ok", "deleted": doc_id})
 
 @api_view(["POST"])
@@ -63,12 +48,77 @@ def upload(request):
     tenant = request.tenant
     files = request.FILES.getlist("files")
     log.info("Upload received tenant=%s count=%d names=%s", tenant.name, len(files), [f.name for f in files])
-    saved = []
-    with transaction.atomic():
+    if not getattr(settings, "INGEST_ASYNC", True):
+        saved, timings = [], []
+        # Her dosya: extract + chunk transaction dışında, yazma kendi kısa transaction'ında
         for f in files:
-            text = extract_text_from_file(f.file, f.name)
-            doc = Document.objects.create(tenant=tenant, filename=f.name, text=text, size=f.size)
+            timings.append(ingest_file(tenant, f.file, f.name, size=f.size))
             saved.append(f.name)
-            for idx, ch in enumerate(chunk_text(text, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP)):
-                Chunk.objects.create(tenant=tenant, document=doc, index=idx, text=ch)
-    return Response({"status": "ok", "files": saved})
+        return Response({"status": "ok", "files": saved, "timings": timings})
+
+    # Arka planda: dosyalar spool'a yazılır, iş kuyruğa girer, hemen 202 dönülür
+    job = jobs.create_job(tenant)
+    job.files = jobs.spool_files(job, files)
+    job.save(update_fields=["files"])
+    transaction.on_commit(lambda: jobs.submit(job.id))
+    return Response(jobs.accepted(job), status=status.HTTP_202_ACCEPTED)
+
+@api_view(["GET"])
+def ingest_job(request, job_id: int):
+    job = IngestJob.objects.filter(tenant=request.tenant, id=job_id).first()
+    if not job:
+        return Response({"detail": "not found"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(jobs.job_payload(job))
+
+def _session_error(e: sessions.UploadError) -> Response:
+    return Response({"detail": str(e), **e.extra}, status=e.status)
+
+@api_view(["POST"])
+def create_upload_session(request):
+    """{"filename", "size"} -> 201 oturum; parçalar PUT {upload_url}?offset=N ile gönderilir."""
+    data = request.data or {}
+    try:
+        size = int(data.get("size"))
+        session = sessions.create(request.tenant, str(data.get("filename") or ""), size)
+    except (TypeError, ValueError):
+        return Response({"detail": "size must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+    except sessions.UploadError as e:
+        return _session_error(e)
+    return Response(sessions.payload(session), status=status.HTTP_201_CREATED)
+
+@api_view(["GET", "PUT", "DELETE"])
+def upload_session(request, session_id: int):
+    session = UploadSession.objects.filter(tenant=request.tenant, id=session_id).first()
+    if not session:
+        return Response({"detail": "not found"}, status=status.HTTP_404_NOT_FOUND)
+    if request.method == "DELETE":
+        sessions.abort(session)
+        return Response(sessions.payload(session))
+    if request.method == "PUT":
+        # Ham gövde (application/octet-stream) request.data'ya okunmaz, akıştan diske yazılır
+        if not request.META.get("CONTENT_LENGTH"):
+            return Response({"detail": "Content-Length is required"}, status=status.HTTP_411_LENGTH_REQUIRED)
+        try:
+            offset = int(request.query_params.get("offset", ""))
+        except ValueError:
+            return Response({"detail": "offset query parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            length = int(request.META["CONTENT_LENGTH"])
+        except ValueError:
+            return Response({"detail": "invalid Content-Length"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            session = sessions.write_part(session, offset, request.stream, length)
+        except sessions.UploadError as e:
+            return _session_error(e)
+    return Response(sessions.payload(session))
+
+@api_view(["POST"])
+def finalize_upload_session(request, session_id: int):
+    session = UploadSession.objects.filter(tenant=request.tenant, id=session_id).first()
+    if not session:
+        return Response({"detail": "not found"}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        job = sessions.finalize(session)
+    except sessions.UploadError as e:
+        return _session_error(e)
+    return Response(jobs.accepted(job), status=status.HTTP_202_ACCEPTED)
@@ -2,15 +2,24 @@ import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from django.urls import path
-from apps.agent.consumers import AgentConsumer
-
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
 django_app = get_asgi_application()
 
+from apps.agent.consumers import AgentConsumer
+from apps.rag.consumers import AskConsumer
+
 websocket_urlpatterns = [
     path("ws/agent/<str:group>/", AgentConsumer.as_asgi()),
+    # Ingestion işlerinin ilerlemesi aynı grup mekanizmasıyla yayınlanır
+    path("ws/ingest/<str:group>/", AgentConsumer.as_asgi()),
+    # Cevaplar token token: citations → token... → done
+    path("ws/ask/", AskConsumer.as_asgi()),
 ]
 
+# Kurtarılıp kuyruğa geri alınan ingestion işleri (recover_ingest_jobs --no-run) bu sunucuda çalışır
+from apps.uploads.jobs import start_resumer
+start_resumer()
+
 application = ProtocolTypeRouter({
     "http": django_app,
     "websocket": URLRouter(websocket_urlpatterns),
@@ -96,15 +96,79 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 # RAG settings
 TOP_K = int(os.getenv("TOP_K", "4"))
+# "index": süreç içi TF-IDF+BM25 indeksi; "postgres": Chunk.search (tsvector/GIN) + ts_rank_cd
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "index")
+# Retrieval cache anahtarı tenant'ın korpus neslini içerir (upload/silme artırır); TTL uzun olabilir
+RETRIEVAL_CACHE_TTL = int(os.getenv("RETRIEVAL_CACHE_TTL", "86400"))
+# Chunk'lama token birimiyle (cümle sınırına oturtulur); CHUNK_TOKENS=0 ise karakter tabanlı CHUNK_SIZE/CHUNK_OVERLAP
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "900"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "150"))
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "cl100k_base")
+# LLM context'i için token bütçesi (bitişik chunk'lar birleştirilerek paketlenir)
+CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS", "3000"))
+# Ingestion: chunk'lar bu boyutta batch'lerle bulk_create edilir
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+# Upload arka planda işlenir (202 + job id); havuz boyutu ve dosyaların bekletildiği dizin
+INGEST_ASYNC = os.getenv("INGEST_ASYNC", "true").lower() in ("1","true","yes")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", str(BASE_DIR / "ingest_spool"))
+# Sayfa ilerlemesi DB'ye en fazla bu aralıkla yazılır (saniye); bu süre kadar güncellenmeyen
+# queued/running işler recover_ingest_jobs için ölü sayılır
+INGEST_PROGRESS_INTERVAL = float(os.getenv("INGEST_PROGRESS_INTERVAL", "2"))
+INGEST_STALE_AFTER = float(os.getenv("INGEST_STALE_AFTER", "600"))
+# Sunucu queued işleri başlangıçta ve bu aralıkla (saniye) yoklar (0 = sadece başlangıçta)
+INGEST_RESUME_INTERVAL = float(os.getenv("INGEST_RESUME_INTERVAL", "60"))
+# Bu sayfa sayısından büyük PDF'ler sayfa aralıklarına bölünüp süreç havuzunda çıkarılır (1 = kapalı)
+INGEST_PDF_PROCESSES = int(os.getenv("INGEST_PDF_PROCESSES", "4"))
+INGEST_PDF_PARALLEL_MIN_PAGES = int(os.getenv("INGEST_PDF_PARALLEL_MIN_PAGES", "40"))
+# Devam ettirilebilir upload: parça boyutu (nginx client_max_body_size altında), dosya üst sınırı, yarım oturum ömrü
+UPLOAD_PART_SIZE = int(os.getenv("UPLOAD_PART_SIZE", str(8 * 1024 * 1024)))
+UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", str(2 * 1024 ** 3)))
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", "86400"))
+# Retrieval index: delta segment sayısı / (delta + silinen) oranı aşılınca arka planda compaction
+INDEX_MAX_SEGMENTS = int(os.getenv("INDEX_MAX_SEGMENTS", "8"))
+INDEX_COMPACT_RATIO = float(os.getenv("INDEX_COMPACT_RATIO", "0.10"))
+# Disk üzerindeki (mmap'li) indeks nesilleri; aynı node'daki worker'lar paylaşır
+INDEX_DIR = os.getenv("INDEX_DIR", str(BASE_DIR / "index_data"))
+# Dense sinyal (pgvector + tenant'a özel yerel LSA embedding): 0 = kapalı,
+# >0 ise cosine benzerliği bu ağırlıkla hybrid skora eklenir
+DENSE_WEIGHT = float(os.getenv("DENSE_WEIGHT", "0"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+EMBED_TRAIN_SAMPLE = int(os.getenv("EMBED_TRAIN_SAMPLE", "20000"))
 
 # LLM
+# gemini | http (akışlı completion API, ör. manage.py llm_standin) | fake | LLMProvider dotted path
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+LLM_HTTP_URL = os.getenv("LLM_HTTP_URL", "http://localhost:8090")
+LLM_HTTP_MODEL = os.getenv("LLM_HTTP_MODEL", "standin")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "models/gemini-2.5-flash")
 GEMINI_TEMPERATURE = float(os.getenv("GEMINI_TEMPERATURE", "0.2"))
 GEMINI_MAX_TOKENS = int(os.getenv("GEMINI_MAX_TOKENS", "1024"))
+# /api/chat/ask_batch: soru limiti ve aynı anda en fazla kaç LLM çağrısı
+ASK_BATCH_MAX = int(os.getenv("ASK_BATCH_MAX", "200"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+# Eşzamanlı özdeş ask'ler (tenant + normalize soru + korpus nesli) tek kez işlenir;
+# diğer worker'lar liderin sonucunu en fazla ASK_COALESCE_WAIT saniye bekler
+ASK_COALESCE = os.getenv("ASK_COALESCE", "true").lower() in ("1","true","yes")
+ASK_COALESCE_WAIT = float(os.getenv("ASK_COALESCE_WAIT", "30"))
+# LLM gateway: süreç ve tenant başına eşzamanlı çağrı, saniye cinsinden kesin süre sınırı
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "16"))
+LLM_TENANT_INFLIGHT = int(os.getenv("LLM_TENANT_INFLIGHT", "4"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "20"))
+# Akışlı cevaplar: ilk parça için süre sınırı (toplam süre yine LLM_DEADLINE)
+LLM_FIRST_TOKEN_DEADLINE = float(os.getenv("LLM_FIRST_TOKEN_DEADLINE", "10"))
+# Hedge: p95 gecikmesini aşan isteğe ikinci kopya (en az LLM_HEDGE_MIN_SAMPLES ölçümden sonra)
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() in ("1","true","yes")
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Circuit breaker: ardışık hata sayısı ve açık kalma süresi (bu sürede extractive fallback)
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# Cevap cache'i (soru + context parmak izi): TTL saniye (0 = kapalı), worker başına en fazla kayıt
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
 
 # Auth bypass
 BYPASS_AUTH = os.getenv("BYPASS_AUTH", "true").lower() in ("1","true","yes")